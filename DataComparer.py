@@ -1,67 +1,579 @@
 import os
 import sys
 import time
-from comparison import Comparison
-from export_results import ExportResults
-from configuration import Configuration
-from multiprocessing import Pool
+import shutil
+import logging
+import argparse
+import multiprocessing
+from functools import partial
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from configuration import Configuration, true_values
 from datetime import datetime
 from logger import Logger
+from profiler import Profiler, get_profile_modes
+from checkpoints import Checkpoints
+from memory_watchdog import MemoryWatchdog, get_rss, parse_size
+from prefetch import Prefetcher
+
+# pandas, numpy, xlsxwriter and fastnumbers are imported by the "comparison" and "export_results"
+# modules, they are imported only when needed to keep the startup fast
+
+# Shared counters of the pool (see init_worker): the worker processes under memory pressure
+# and the started jobs (for the prefetching of the inputs). The throttled pool counts the pressure
+# per job and records the worker process of each job (see process_job).
+memory_pressure = None
+started_jobs = None
+job_workers = None
+job_slot = None
+
+
+def init_worker(pressure=None, started=None, workers=None):
+    """
+    Initializer of the pool workers, the shared counters are inherited by each worker process
+    """
+    global memory_pressure, started_jobs, job_workers
+    memory_pressure = pressure
+    started_jobs = started
+    job_workers = workers
+
+
+def process_job(index, xml_comparisons, **kwargs):
+    """
+    Job "index" of the throttled pool (see Comparer.throttle_comparisons), the worker records its process id
+    for the job and its memory watchdogs count the pressure in the slot of the job
+    """
+    global job_slot
+    job_slot = index
+    job_workers[index] = os.getpid()
+    return process_comparisons(xml_comparisons, **kwargs)
+
+
+def process_comparisons(xml_comparisons, xml_defaults, export_folder, profile=None, store=None, estimate=None,
+                        memory_limit=None):
+    """
+    Processes a job of the pool, a single comparison or the comparisons of a fan-out group. The first
+    comparison of a group loads the baseline, the others are compared with it concurrently.
+    """
+    def process(xml_comparison):
+        return process_comparison(xml_comparison, xml_defaults, export_folder, profile, store, estimate,
+                                  memory_limit, fan_out)
+
+    if started_jobs is not None:
+        with started_jobs.get_lock():
+            started_jobs.value += 1
+    fan_out = {}
+    results = [process(xml_comparisons[0])]
+    if len(xml_comparisons) > 1:
+        with ThreadPoolExecutor(min(len(xml_comparisons) - 1, os.cpu_count())) as executor:
+            results += list(executor.map(process, xml_comparisons[1:]))
+    return results
+
+
+def group_fan_out(comparisons):
+    """
+    Jobs of the pool, the consecutive comparisons of a fan-out group (see Configuration.expand_fan_out)
+    form one job, any other comparison is a job on its own
+    """
+    job = []
+    for comparison in comparisons:
+        if job and (comparison.get('fan_out') is None or comparison.get('fan_out') != job[0].get('fan_out')):
+            yield job
+            job = []
+        job.append(comparison)
+    if job:
+        yield job
+
+
+def is_enabled(xml_comparison):
+    return xml_comparison.find('enabled') is not None and xml_comparison.find('enabled').text in true_values
+
+
+def process_comparison(xml_comparison, xml_defaults, export_folder, profile=None, store=None, estimate=None,
+                       memory_limit=None, fan_out=None):
+    """
+    Processes the comparison and persists its result as a checkpoint of the run (except for estimates)
+    """
+    if estimate:
+        return run_comparison(xml_comparison, xml_defaults, export_folder, profile, store, estimate, memory_limit,
+                              fan_out)
+    fingerprint = Checkpoints.get_fingerprint(xml_comparison, xml_defaults)
+    result = run_comparison(xml_comparison, xml_defaults, export_folder, profile, store, memory_limit=memory_limit,
+                            fan_out=fan_out)
+    try:
+        Checkpoints(export_folder).write(xml_comparison.get('file_name'), fingerprint, result)
+    except Exception as e:
+        # The logger of the comparison still has its handlers
+        logging.getLogger(xml_comparison.get('file_name')).warning(f'Checkpoint was not written: {e}')
+    return result
+
+
+def run_comparison(xml_comparison, xml_defaults, export_folder, profile=None, store=None, estimate=None,
+                   memory_limit=None, fan_out=None):
+    """
+    Processing routine for each worker
+        * Creates log
+        * Parse configuration for current comparison
+        * Perform comparison (profiled if requested by "profile" or the "profile" attribute of the comparison),
+          only of a sample of the lines if "estimate" (the sampled fraction) is given
+        * Generates report xlsx file (in the gate mode only if requested by the gate),
+          for an estimate the report of the sample and the extrapolated results
+        * With a "memory_limit" (bytes) the memory watchdog degrades the comparison near the limit,
+          its events are added to the summary
+        * The comparisons of a fan-out group share the baseline in "fan_out", set by the first comparison
+        * Writes the results to the results store
+        * Return data for comparison summary
+    """
+
+    from comparison import Comparison
+    from export_results import ExportResults
+    from estimate import get_estimate, describe
+
+    file_name = xml_comparison.get("file_name")
+    log = Logger(export_folder + '\\' + 'log', file_name, file_name=file_name)
+    try:
+        start = time.perf_counter()
+        config, defaults = Configuration(xml_comparison, xml_defaults, log).get_configuration()
+        if config['enabled']:
+            profile_modes = get_profile_modes(xml_comparison.get('profile', profile))
+            profiler = Profiler(os.path.dirname(log.get_path()), file_name, profile_modes) \
+                if profile_modes else nullcontext()
+            watchdog = MemoryWatchdog(memory_limit, pressure=memory_pressure, log=log, slot=job_slot) \
+                if memory_limit else None
+            with profiler, watchdog or nullcontext():
+                comparison = Comparison(config, defaults, export_folder, log, sample=estimate, watchdog=watchdog,
+                                        baseline=fan_out.get('baseline') if fan_out else None).get_comparison()
+                if fan_out is not None and comparison.baseline is not None:
+                    fan_out.setdefault('baseline', comparison.baseline)
+                if estimate:
+                    report_start = time.perf_counter()
+                    report = ExportResults(export_folder, file_name, log, postfix='_estimate')
+                    report.create_detailed_report(comparison)
+                    report.workbook.close()
+                    report_path = export_folder + '\\' + file_name + '_estimate.xlsx'
+                    comparison.summary['paths'].update({'comp_report': report_path})
+                    comparison.summary.update({'estimate': get_estimate(comparison, report_path,
+                                                                        time.perf_counter() - report_start)})
+                    for line in describe(comparison.summary['estimate']):
+                        log.logger.info(f'Estimate: {line}')
+                # In the gate mode the detailed report is created only if requested
+                elif not config['gate'] or config['gate']['report']:
+                    report = ExportResults(export_folder, file_name, log)
+                    # report.create_detailed_report(comparison, limit=250J
+                    limit = None
+                    if watchdog and len(comparison.df_compare) > watchdog.report_rows and watchdog.check(
+                            'report', f'the detailed report was capped at {watchdog.report_rows} lines'):
+                        limit = watchdog.report_rows
+                    report.create_detailed_report(comparison, limit=limit)
+                    report.workbook.close()
+            comparison.summary.update({'total_time': time.perf_counter() - start, 'timings': comparison.timings})
+            if watchdog:
+                comparison.summary.update({'memory': watchdog.get_report()})
+                if watchdog.events:
+                    message = f'Memory pressure: {"; ".join(event["action"] for event in watchdog.events)}'
+                    comparison.summary.update({'note': f'{comparison.summary["note"]}; {message}'
+                                               if comparison.summary['note'] else message})
+            if profile_modes:
+                comparison.summary.update({'profile': profiler.report})
+                for hot_function in profiler.report['hot_functions']:
+                    log.logger.info(f'Hot function: {hot_function}')
+            store_error = store_result(store, export_folder, 0, comparison.summary, comparison, log)
+            if store_error:
+                comparison.summary.update({'store_error': store_error,
+                                           'note': f'{comparison.summary["note"]}; {store_error}'
+                                           if comparison.summary['note'] else store_error})
+            return 0, comparison.summary
+        else:
+            return -1, None
+
+    except Exception as e:
+        log.logger.error(e)
+        store_result(store, export_folder, 100, {'error': e, 'file_name': file_name}, log=log)
+        return 100, {'error': e, 'file_name': file_name}
+
+
+def store_result(store, export_folder, status, summary, comparison=None, log=None):
+    """
+    Writes the result to the results store, the run is identified by the name of the export folder.
+    Returns the error message if the result was not stored.
+    """
+    if not store:
+        return None
+    from results_store import ResultsStore
+
+    start = time.perf_counter()
+    try:
+        results_store = ResultsStore(store)
+        results_store.store_result(export_folder.replace('/', '\\').split('\\')[-1], status, summary, comparison)
+        results_store.close()
+        if log:
+            log.logger.info(f'Results stored to {store}, elapsed time: {time.perf_counter() - start:0.2f}s')
+        return None
+    except Exception as e:
+        if log:
+            log.logger.warning(f'Results were not stored to {store}: {e}')
+        return f'Results were not stored to {store}: {e}'
 
 
 class Comparer:
-    def __init__(self):
-        xml_file = sys.argv[1]
-        self.xml_config = Configuration.get_xml_comparisons(xml_file)
-        self.export_folder = f'{self.xml_config["output"]}\\{datetime.today().strftime("%Y%m%d_%H%M%S")}'
-        self.sum_log = Logger(self.export_folder + '\\' + 'log', '_compare', file_name='_compare')
-        self.results = self.distribute_comparisons()
+    def __init__(self, xml_config, start_method=None, export_folder=None, queue_dir=None, local_workers=0,
+                 lease_timeout=300, profile=None, resume=False, estimate=None, memory_limit=None, prefetch=0,
+                 prefetch_budget=4 * 1024 ** 3):
+        self.start_method = start_method
+        self.prefetch = prefetch
+        self.prefetch_budget = prefetch_budget
+        self.memory_limit = memory_limit
+        self.estimate = estimate
+        self.resume = resume
+        self.profile = profile
+        self.queue_dir = queue_dir
+        self.local_workers = local_workers
+        self.lease_timeout = lease_timeout
+        self.xml_config = xml_config
+        if export_folder is None:
+            export_folder = f'{self.xml_config["output"]}\\{datetime.today().strftime("%Y%m%d_%H%M%S")}'
+            if estimate:
+                export_folder += '_estimate'
+        self.export_folder = export_folder
+        if resume and not os.path.isdir(Checkpoints(export_folder).folder):
+            raise ValueError(f'No checkpoints of the export folder to resume were found: {export_folder}')
+        self.sum_log = Logger(self.export_folder + '\\' + 'log', self.export_folder + '_compare', file_name='_compare',
+                              mode='a' if resume else 'w')
+        if memory_limit and get_rss() is None:
+            self.sum_log.logger.warning('The memory limit is ignored, the current memory of the processes cannot be '
+                                        'measured: the psutil package is required outside of Linux')
+            self.memory_limit = None
+        if prefetch and queue_dir and not estimate:
+            self.sum_log.logger.warning('The prefetch is ignored, the queue workers read their inputs themselves')
+            self.prefetch = 0
+        self.results = []
+
+    @classmethod
+    def from_file(cls, xml_file, **kwargs):
+        return cls(Configuration.get_xml_comparisons(xml_file, lazy=True), **kwargs)
+
+    def get_comparisons(self):
+        """
+        The comparisons as a list, a lazily parsed configuration is read completely
+        """
+        if not isinstance(self.xml_config['comparisons'], list):
+            self.xml_config['comparisons'] = list(self.xml_config['comparisons'])
+        return self.xml_config['comparisons']
+
+    def run(self):
+        if not isinstance(self.xml_config['comparisons'], list) and not (self.resume or self.queue_dir
+                                                                          or self.memory_limit):
+            self.results = self.distribute_stream(self.xml_config['comparisons'])
+            self.generate_summary()
+            return self.results
+        comparisons = self.get_comparisons()
+        results = self.get_checkpoint_results(comparisons) if self.resume else [None] * len(comparisons)
+        pending = [comparison for comparison, result in zip(comparisons, results) if result is None]
+        new_results = iter(self.distribute_comparisons(pending) if pending else [])
+        self.results = [result if result is not None else next(new_results) for result in results]
         self.generate_summary()
+        return self.results
+
+    def get_checkpoint_results(self, comparisons):
+        """
+        Results persisted by the resumed run, None for the comparisons to run again
+        (missing, failed or with a changed configuration or inputs)
+        """
+        checkpoints = Checkpoints(self.export_folder)
+        results = [checkpoints.get_result(comparison, self.xml_config['defaults']) for comparison in comparisons]
+        reused = len([result for result in results if result is not None])
+        self.sum_log.logger.info(f'Resuming {self.export_folder}: {reused} results reused, '
+                                 f'{len(comparisons) - reused} comparisons to run')
+        return results
 
     def process_comparison(self, xml_comparison):
+        return self.get_processor()(xml_comparison)
+
+    def get_processor(self, function=None):
         """
-        Processing routine for each worker
-            * Creates log
-            * Parse configuration for current comparison
-            * Perform comparison
-            * Generates report xlsx file
-            * Return data for comparison summary
+        "process_comparison" (or "process_comparisons" for the jobs of fan-out groups) with the arguments
+        of the run, pickled for each job without the Comparer
         """
+        # The default is looked up at the call, in the class body the name is the method process_comparison.
+        # The estimates are not written to the results store.
+        return partial(function or process_comparison, xml_defaults=self.xml_config['defaults'],
+                       export_folder=self.export_folder, profile=self.profile,
+                       store=None if self.estimate else self.xml_config.get('store'),
+                       estimate=self.estimate, memory_limit=self.memory_limit)
 
-        file_name = xml_comparison.get("file_name")
-        log = Logger(self.export_folder + '\\' + 'log', file_name, file_name=file_name)
-        try:
-            start = time.perf_counter()
-            config, defaults = Configuration(xml_comparison, self.xml_config['defaults'], log).get_configuration()
-            if config['enabled']:
-                comparison = Comparison(config, defaults, self.export_folder, log).get_comparison()
-                report = ExportResults(self.export_folder, file_name, log)
-                # report.create_detailed_report(comparison, limit=250J
-                report.create_detailed_report(comparison)
-                report.workbook.close()
-                comparison.summary.update({'total_time': time.perf_counter() - start})
-                return 0, comparison.summary
+    def distribute_comparisons(self, comparisons):
+        """
+        Creates the pool of workers depending on the current number
+        of logical cpus and the number of enabled comparisons.
+        A single comparison is processed in this process, without a pool.
+        With a memory limit, new jobs are held back while a worker is under memory pressure.
+        """
+        if self.queue_dir and not self.estimate:
+            return self.distribute_to_queue(comparisons)
+
+        enabled = [comparison for comparison in comparisons if is_enabled(comparison)]
+        processes = min(os.cpu_count(), len(enabled))
+        self.sum_log.logger.info(f'{len(enabled)} of {len(comparisons)} comparisons enabled, '
+                                 f'{processes} worker processes')
+        if processes <= 1 or not self.memory_limit:
+            return self.run_jobs(group_fan_out(comparisons), processes)
+
+        context = self.get_context()
+        jobs = list(group_fan_out(comparisons))
+        # Per job: the memory pressure counter and the worker process
+        pressure = context.Array('i', len(jobs))
+        workers = context.Array('i', len(jobs))
+        started = context.Value('i', 0)
+        prefetcher = self.get_prefetcher(jobs, started)
+        with prefetcher, context.Pool(processes, initializer=init_worker,
+                                      initargs=(pressure, started, workers)) as p:
+            results = self.throttle_comparisons(p, jobs, processes, pressure, workers)
+        if self.prefetch:
+            prefetcher.log_prefetch(jobs, results)
+        return results
+
+    def throttle_comparisons(self, pool, jobs, processes, pressure, workers):
+        """
+        Submits the jobs (see group_fan_out) one by one, a new job is started only if no worker reports
+        memory pressure (or if no job runs at all, so the run always progresses). The jobs of a worker
+        process which died (e.g. killed by the kernel when out of memory) fail with the status 100
+        and their memory pressure is dropped.
+        """
+        process = self.get_processor(process_job)
+        results = [None] * len(jobs)
+        pending = list(range(len(jobs)))
+        running = {}
+        held_back = False
+        while pending or running:
+            for index in [index for index, result in running.items() if result.ready()]:
+                results[index] = running.pop(index).get()
+            alive = {child.pid for child in multiprocessing.active_children()}
+            for index in [index for index in running if workers[index] and workers[index] not in alive]:
+                # The result may still be on its way from a worker which finished
+                running[index].wait(1)
+                if running[index].ready():
+                    results[index] = running.pop(index).get()
+                    continue
+                running.pop(index)
+                pressure[index] = 0
+                results[index] = self.get_failed_results(jobs[index], f'The worker process {workers[index]} died')
+            under_pressure = len([index for index in running if pressure[index] > 0])
+            if pending and len(running) < processes and (under_pressure == 0 or not running):
+                if held_back:
+                    self.sum_log.logger.info('Memory pressure is over, new jobs are started again')
+                    held_back = False
+                index = pending.pop(0)
+                running[index] = pool.apply_async(process, (index, jobs[index]))
+                continue
+            if pending and len(running) < processes and not held_back:
+                self.sum_log.logger.warning(f'{under_pressure} workers under memory pressure, '
+                                            f'{len(pending)} jobs are held back')
+                held_back = True
+            time.sleep(0.05)
+        return [result for job_results in results for result in job_results]
+
+    def get_failed_results(self, job, error):
+        """
+        Results of the comparisons of a job which did not finish, stored like the failed comparisons
+        """
+        results = []
+        for xml_comparison in job:
+            summary = {'error': error, 'file_name': xml_comparison.get('file_name')}
+            self.sum_log.logger.error(f'{summary["file_name"]} failed: {error}')
+            store_result(None if self.estimate else self.xml_config.get('store'), self.export_folder, 100, summary,
+                         log=self.sum_log)
+            results.append((100, summary))
+        return results
+
+    def distribute_stream(self, comparisons):
+        """
+        Feeds the lazily parsed comparisons to the pool as they are resolved, the first comparison
+        starts while the rest of the configuration is read. The parsed comparisons are kept for the summary.
+        The stream is read up to the second enabled comparison first, a single one is processed
+        in this process, without a pool.
+        """
+        parsed = []
+        comparisons = iter(comparisons)
+        enabled = 0
+        for comparison in comparisons:
+            parsed.append(comparison)
+            enabled += is_enabled(comparison)
+            if enabled > 1:
+                # More comparisons may follow
+                enabled = os.cpu_count()
+                break
+        peeked = list(parsed)
+
+        def feed():
+            yield from peeked
+            for comparison in comparisons:
+                parsed.append(comparison)
+                yield comparison
+
+        processes = min(os.cpu_count(), enabled)
+        self.sum_log.logger.info(f'Comparisons are streamed to {processes} worker processes')
+        results = self.run_jobs(group_fan_out(feed()), processes)
+        self.xml_config['comparisons'] = parsed
+        self.sum_log.logger.info(f'{len(parsed)} comparisons processed')
+        return results
+
+    def run_jobs(self, jobs, processes):
+        """
+        Processes the jobs (see group_fan_out) in order, in this process for a single worker process.
+        The comparisons of a fan-out group are processed by one worker. With prefetching, the inputs
+        of the next jobs are read ahead while the previous jobs are processed.
+        """
+        process = self.get_processor(process_comparisons)
+        context = self.get_context()
+        started = context.Value('i', 0)
+        submitted = []
+
+        def feed():
+            # The jobs are read lazily, with prefetching up to "prefetch" jobs ahead of the processed one,
+            # so the prefetcher finds the next jobs in the submitted ones
+            pending = deque()
+            for job in jobs:
+                submitted.append(job)
+                pending.append(job)
+                if len(pending) > self.prefetch:
+                    yield pending.popleft()
+            yield from pending
+
+        prefetcher = self.get_prefetcher(submitted, started)
+        with prefetcher:
+            if processes <= 1:
+                init_worker(started=started)
+                job_results = [process(job) for job in feed()]
             else:
-                return -1, None
+                with context.Pool(processes, initializer=init_worker, initargs=(None, started)) as p:
+                    job_results = list(p.imap(process, feed()))
+        results = [result for results in job_results for result in results]
+        if self.prefetch:
+            prefetcher.log_prefetch(submitted, results)
+        return results
+
+    def get_prefetcher(self, jobs, started):
+        """
+        Prefetcher of the inputs of the jobs, a no-op context without the prefetch option
+        """
+        if not self.prefetch:
+            return nullcontext()
+        return Prefetcher(jobs, started, self.prefetch, self.prefetch_budget, self.sum_log)
+
+    def get_context(self):
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == 'forkserver':
+            # The forkserver imports pandas once, each worker is forked from it already warmed up
+            context.set_forkserver_preload(['comparison', 'export_results'])
+        return context
+
+    def distribute_to_queue(self, comparisons):
+        """
+        Writes the comparisons as jobs to the shared queue directory and waits until
+        the workers (on any node) deliver all results. Optionally starts local workers.
+        """
+        from work_queue import WorkQueue, run_worker
+
+        queue = WorkQueue(self.queue_dir, lease_timeout=self.lease_timeout, log=self.sum_log)
+        run_dir = queue.submit(comparisons, self.xml_config['defaults'], self.export_folder, self.profile,
+                               self.xml_config.get('store'))
+        self.sum_log.logger.info(f'{len(comparisons)} jobs written to the queue: {run_dir}')
 
-        except Exception as e:
-            log.logger.error(e)
-            return 100, {'error': e, 'file_name': file_name}
+        context = multiprocessing.get_context(self.start_method)
+        workers = [context.Process(target=run_worker, args=(self.queue_dir, self.lease_timeout), daemon=True)
+                   for _ in range(self.local_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            return queue.collect(run_dir, len(comparisons), on_result=lambda index, result: self.sum_log.logger.info(
+                f'Job {index} finished with status {result[0]}'))
+        finally:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+            shutil.rmtree(run_dir, ignore_errors=True)
 
-    def distribute_comparisons(self):
+    def get_exit_code(self):
         """
-        Creates the pool of workers depending
-        on the current number of logical cpus
+        Exit code of a gating run: 1 if a gate failed, 2 if a comparison failed with an error
+        while a gate is configured, otherwise 0
         """
-        with Pool(os.cpu_count()) as p:
-        # with Pool(1) as p:
-            return p.map(self.process_comparison, self.xml_config['comparisons'])
+        summaries = [summary for status, summary in self.results if status == 0]
+        if any(not summary['gate']['passed'] for summary in summaries if summary.get('gate')):
+            return 1
+        gated = any(xml_element.find('gate') is not None
+                    for xml_element in self.xml_config['defaults'] + self.get_comparisons())
+        if gated and any(status == 100 for status, _ in self.results):
+            return 2
+        return 0
 
     def generate_summary(self):
+        from export_results import ExportResults
+
+        if self.estimate:
+            from estimate import get_estimated_summary
+
+            summary = ExportResults(self.export_folder, '_Estimate_summary', self.sum_log)
+            summary.create_summary([(status, get_estimated_summary(result) if status == 0 else result)
+                                    for status, result in self.results])
+            summary.workbook.close()
+            return
         summary = ExportResults(self.export_folder, '_Results_summary', self.sum_log)
         summary.create_summary(self.results)
         summary.workbook.close()
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Compares the reports configured in a xml file')
+    parser.add_argument('config', help='xml configuration file')
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(), default=None,
+                        help='start method of the worker processes, "forkserver" preloads pandas only once')
+    parser.add_argument('--profile', nargs='?', const='all', default=None, choices=['all', 'cpu', 'memory'],
+                        help='profiles each comparison, reports are written to the log folder')
+    parser.add_argument('--queue', default=None,
+                        help='shared queue directory, the comparisons are processed by "work_queue.py" workers')
+    parser.add_argument('--local-workers', type=int, default=0, help='number of queue workers started locally')
+    parser.add_argument('--lease-timeout', type=int, default=300, help='seconds after which a queue job is retried')
+    parser.add_argument('--resume', default=None, metavar='EXPORT_FOLDER',
+                        help='export folder of an interrupted run, only the missing, failed or changed comparisons '
+                             'are processed again')
+    parser.add_argument('--estimate', nargs='?', const=1.0, default=None, type=float, metavar='PERCENT',
+                        help='compares only a sample of the keys (1%% by default) and extrapolates the results')
+    parser.add_argument('--memory-limit', default=None, type=parse_size, metavar='SIZE',
+                        help='soft memory limit of each worker (e.g. 2G), near the limit the comparison switches '
+                             'to cheaper strategies and new jobs are held back')
+    parser.add_argument('--watch', nargs='?', const=5.0, default=None, type=float, metavar='SECONDS',
+                        help='watches the input files (polled every 5 seconds by default) and compares them as soon '
+                             'as they are complete and changed, until interrupted')
+    parser.add_argument('--settle', type=float, default=10.0, metavar='SECONDS',
+                        help='watch mode: seconds without a change after which an input file is complete')
+    parser.add_argument('--watch-timeout', type=float, default=None, metavar='SECONDS',
+                        help='watch mode: stops watching after the given seconds')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='JOBS',
+                        help='reads the input files of the next JOBS queued comparisons ahead into the page cache')
+    parser.add_argument('--prefetch-budget', default='4G', type=parse_size, metavar='SIZE',
+                        help='maximal size of the prefetched inputs of the comparisons not started yet')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    Comparer()
+    arguments = parse_arguments()
+    comparer = Comparer.from_file(arguments.config, start_method=arguments.start_method, queue_dir=arguments.queue,
+                                  local_workers=arguments.local_workers, lease_timeout=arguments.lease_timeout,
+                                  profile=arguments.profile, export_folder=arguments.resume,
+                                  resume=arguments.resume is not None,
+                                  estimate=arguments.estimate / 100 if arguments.estimate else None,
+                                  memory_limit=arguments.memory_limit, prefetch=arguments.prefetch,
+                                  prefetch_budget=arguments.prefetch_budget)
+    if arguments.watch:
+        from watch import Watcher
+
+        if comparer.prefetch:
+            comparer.sum_log.logger.warning('The prefetch is ignored in the watch mode, the inputs are compared as '
+                                            'soon as they are written')
+        comparer.results = Watcher(comparer, poll_interval=arguments.watch, settle_time=arguments.settle,
+                                   timeout=arguments.watch_timeout).run()
+    else:
+        comparer.run()
+    sys.exit(comparer.get_exit_code())
@@ -0,0 +1,81 @@
+import xml.etree.ElementTree as ET
+from comparison import Comparison
+from configuration import Configuration
+from logger import Logger
+
+
+def compare_frames(left, right, configuration, defaults=None, export_folder=None, log=None):
+    """
+    Compares two in-memory reports (pandas DataFrames or pyarrow Tables) with the same merge,
+    compare and tolerance logic as the file based comparisons, the inputs are not copied or modified.
+    Returns the Comparison object:
+        comparison.df_compare - the differences (out of tolerance), indexed by the lines of "df_merge"
+        comparison.df_merge   - both reports merged on the reference columns, with the "_merge" indicator
+        comparison.summary    - the summary dict, as returned by "process_comparison"
+
+        configuration: a "comparison" xml element or a dict, e.g.
+            {'file_name': 'orders',
+             'columns': [{'name': 'id', 'reference': True},
+                         {'name': 'amount', 'tolerance': 0.01, 'tolerance_mode': 'Abs', 'count_difference': True},
+                         {'name': 'note', 'ignore': True}]}
+            any other key is used as the tag of the same name
+        defaults: default tolerances, e.g. {'tolerances': [{'name': 'TOTAL', 'tolerance': 1.0, 'tolerance_mode': 'Abs'}]}
+        export_folder: if given, the detailed xlsx report and the log are written to it
+    """
+    if log is None:
+        # Without an export folder the log records are only propagated to the logging of the caller
+        log = Logger(export_folder + '\\' + 'log' if export_folder else None, 'api_comparison',
+                     file_name=configuration.get('file_name', 'comparison'))
+    xml_comparison = configuration if isinstance(configuration, ET.Element) else comparison_to_xml(configuration)
+    config, defaults = Configuration(xml_comparison, [defaults_to_xml(defaults)], log).get_configuration()
+
+    comparison = Comparison(config, defaults, export_folder or '', log,
+                            df_left=to_dataframe(left), df_right=to_dataframe(right)).get_comparison()
+    if export_folder:
+        from export_results import ExportResults
+
+        report = ExportResults(export_folder, config['file_name'], log)
+        report.create_detailed_report(comparison)
+        report.workbook.close()
+    return comparison
+
+
+def to_dataframe(report):
+    """
+    pyarrow Tables are converted to numpy backed DataFrames, split into one block per
+    column, null-free numeric columns are not copied. DataFrames are used as they are.
+    """
+    if hasattr(report, 'to_pandas') and hasattr(report, 'schema'):
+        return report.to_pandas(split_blocks=True)
+    return report
+
+
+def comparison_to_xml(configuration):
+    """
+    Builds the "comparison" xml element of the configuration dict
+    """
+    xml_comparison = ET.Element('comparison', {'file_name': str(configuration.get('file_name', 'comparison'))})
+    ET.SubElement(xml_comparison, 'enabled').text = 'true'
+    for tag in ['left', 'right']:
+        ET.SubElement(xml_comparison, tag).text = str(configuration.get(tag, f'<{tag} in memory>'))
+
+    for key, value in configuration.items():
+        if key in ['file_name', 'enabled', 'left', 'right']:
+            continue
+        elif key == 'columns':
+            xml_columns = ET.SubElement(xml_comparison, 'columns')
+            for column in value:
+                ET.SubElement(xml_columns, 'column', {name: str(attribute) for name, attribute in column.items()})
+        elif isinstance(value, (list, tuple)):
+            ET.SubElement(xml_comparison, key).text = ';'.join(str(item) for item in value)
+        elif value is not None:
+            ET.SubElement(xml_comparison, key).text = str(value)
+    return xml_comparison
+
+
+def defaults_to_xml(defaults):
+    xml_defaults = ET.Element('defaults')
+    xml_tolerances = ET.SubElement(xml_defaults, 'tolerances')
+    for tolerance in (defaults or {}).get('tolerances', []):
+        ET.SubElement(xml_tolerances, 'column', {name: str(value) for name, value in tolerance.items()})
+    return xml_defaults
@@ -0,0 +1,396 @@
+import numpy as np
+import pandas as pd
+from decimal import Decimal
+from file_streams import open_input
+from pandas.api.types import is_datetime64_any_dtype
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Errors of the conversion of pandas columns to polars, e.g. for object columns of mixed types
+conversion_errors = (TypeError, ValueError) + ((pl.exceptions.PolarsError,) if pl is not None else ())
+
+# Strings read as missing values by pandas.read_csv
+csv_null_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                   '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+class Backend:
+    """
+    Compute backend of a Comparison, the heavy operators over the reports:
+        read_csv  - loads a csv report
+        merge     - outer join on the reference columns, in the layout of pd.merge(..., sort=True, indicator=True)
+                    (merge_indexed joins against the prebuilt key index of a shared baseline)
+        compare   - differences of two aligned frames, in the layout of DataFrame.compare
+        tolerance - checks the differences against the tolerances (exactly for the decimal columns)
+    All operators take and return pandas objects, so the results of all backends are interchangeable.
+    """
+    name = None
+
+    def read_csv(self, file, configuration, usecols=None):
+        """
+        Only the columns in "usecols" (names, or positions for a file without a header) are read if given
+        """
+        raise NotImplementedError
+
+    def merge(self, df_left, df_right, references):
+        raise NotImplementedError
+
+    def compare(self, df_left, df_right):
+        raise NotImplementedError
+
+    @staticmethod
+    def index_keys(df_left, references):
+        """
+        Index of the reference keys of a baseline, None if the keys are not unique or missing
+        (the candidates are then joined by "merge")
+        """
+        if df_left[references].isna().any(axis=None):
+            return None
+        keys = pd.MultiIndex.from_frame(df_left[references]) if len(references) > 1 \
+            else pd.Index(df_left[references[0]])
+        return keys if keys.is_unique else None
+
+    def merge_indexed(self, df_left, df_right, references, keys):
+        """
+        Outer join of a candidate with the baseline "df_left" by the prebuilt key index of the baseline,
+        each candidate line looks up its baseline line. Same layout as "merge".
+        """
+        if keys is None or df_right[references].isna().any(axis=None) or \
+                any(df_left[reference].dtype != df_right[reference].dtype for reference in references):
+            return self.merge(df_left, df_right, references)
+        right_keys = pd.MultiIndex.from_frame(df_right[references]) if len(references) > 1 \
+            else pd.Index(df_right[references[0]])
+        positions = keys.get_indexer(right_keys)
+        matched = positions >= 0
+        left_only = np.setdiff1d(np.arange(len(df_left)), positions[matched])
+        right_only = np.flatnonzero(~matched)
+        # Lines of both reports, -1 where a report has no line: both, left only, right only
+        left_rows = np.concatenate([positions[matched], left_only, np.full(len(right_only), -1)])
+        right_rows = np.concatenate([np.flatnonzero(matched), np.full(len(left_only), -1), right_only])
+
+        def take(column, rows):
+            values = column.array if isinstance(column.dtype, pd.api.extensions.ExtensionDtype) else column.to_numpy()
+            return pd.Series(pd.api.extensions.take(values, rows, allow_fill=True), name=column.name)
+
+        columns = {}
+        for column in df_left.columns:
+            if column in references:
+                # The keys of the baseline lines and then of the lines only in the candidate
+                columns[column] = pd.concat([df_left[column].iloc[left_rows[:len(left_rows) - len(right_only)]],
+                                             df_right[column].iloc[right_only]], ignore_index=True)
+            else:
+                columns[f'{column}_x' if column in df_right.columns else column] = take(df_left[column], left_rows)
+        for column in df_right.columns:
+            if column not in references:
+                columns[f'{column}_y' if column in df_left.columns else column] = take(df_right[column], right_rows)
+        df_merge = pd.DataFrame(columns)
+        df_merge['_merge'] = pd.Categorical.from_codes(
+            np.where(left_rows < 0, 1, np.where(right_rows < 0, 0, 2)), categories=['left_only', 'right_only', 'both'])
+        return df_merge.sort_values(references, kind='stable').reset_index(drop=True)
+
+    def tolerance(self, df_compare, tolerances, scales=None):
+        """
+        Returns (rows in tolerance, diffs counter):
+            rows in tolerance - boolean array, True for the rows of "df_compare" where all differences are in tolerance
+            diffs counter     - {column: {'absolute': number of differences, 'in_tolerance': differences in tolerance}}
+        The decimal columns (integers scaled by 10^scale) are given in "scales" as {str(column): scale}.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def get_text_columns(configuration):
+        """
+        Columns read as texts, the decimal columns are parsed from their exact digits
+        """
+        return [name for name, column_type in configuration.get('column_types', {}).items()
+                if column_type['type'] == 'decimal']
+
+    @staticmethod
+    def decimal_tolerance(left, right, tolerance, mode, scale):
+        """
+        Exact tolerance check of two decimal columns, integers scaled by 10^scale (see Comparison.parse_decimal).
+        The tolerance is the fraction p/q of its shortest decimal representation (e.g. 0.01 is 1/100):
+        |left - right| * q <= p * 10^scale (abs) or p * |right| (rel). The lines where the products could
+        overflow int64 are checked in Python integers (see decimal_in_tolerance).
+        """
+        valid = (left.notna() & right.notna()).to_numpy()
+        left = left.to_numpy(dtype='int64', na_value=0)
+        right = right.to_numpy(dtype='int64', na_value=0)
+        numerator, denominator = Decimal(repr(float(tolerance))).as_integer_ratio()
+        deviation = np.abs(left - right)
+        limit = np.iinfo('int64').max
+        if mode == 'abs':
+            # The deviations are integers, the bound is rounded down
+            return valid & (deviation <= min(numerator * 10 ** scale // denominator, limit))
+
+        magnitude = np.abs(right)
+        if numerator <= limit and denominator <= limit:
+            safe = (deviation <= limit // denominator) & (magnitude <= limit // max(numerator, 1))
+        else:
+            safe = np.zeros(len(left), dtype=bool)
+        in_tolerance = np.zeros(len(left), dtype=bool)
+        in_tolerance[safe] = deviation[safe] * denominator <= numerator * magnitude[safe]
+        for i in np.flatnonzero(~safe & valid):
+            in_tolerance[i] = Backend.decimal_in_tolerance(left[i], right[i], tolerance, mode, scale)
+        return valid & in_tolerance & (right != 0)
+
+    @staticmethod
+    def decimal_in_tolerance(left, right, tolerance, mode, scale):
+        """
+        Exact tolerance check of two decimal values in Python integers, the scalar form of decimal_tolerance
+        """
+        numerator, denominator = Decimal(repr(float(tolerance))).as_integer_ratio()
+        deviation = abs(int(left) - int(right)) * denominator
+        if mode == 'abs':
+            return deviation <= numerator * 10 ** scale
+        return right != 0 and deviation <= numerator * abs(int(right))
+
+    @staticmethod
+    def get_tolerance(tolerances, column):
+        tolerance = tolerances[column]
+        mode = tolerance['tolerance_mode'].lower()
+        if mode not in ['abs', 'rel']:
+            raise ValueError(f'Unknown parameter for "tolerance mode": {tolerance["tolerance_mode"]}, '
+                             f'have to be "Abs" or "Rel"')
+        return tolerance['tolerance'], mode
+
+    @staticmethod
+    def to_nanoseconds(column):
+        """
+        Datetime column as int64 nanoseconds since the epoch (in UTC for time zone aware columns),
+        the missing values (NaT) have to be masked by the caller
+        """
+        if column.dt.tz is not None:
+            column = column.dt.tz_convert(None)
+        return column.to_numpy(dtype='datetime64[ns]').view('int64')
+
+
+class PandasBackend(Backend):
+    name = 'pandas'
+
+    def read_csv(self, file, configuration, usecols=None):
+        text_columns = self.get_text_columns(configuration)
+        with open_input(file) as reader:
+            return pd.read_csv(reader, sep=configuration["separator"], header=configuration["header"],
+                               names=configuration['header_names'], encoding='unicode_escape',
+                               engine='python', skiprows=configuration["ignore_rows"], usecols=usecols,
+                               dtype={column: str for column in text_columns} if text_columns else None)
+
+    def merge(self, df_left, df_right, references):
+        return pd.merge(df_left, df_right, how='outer', on=references, sort=True, indicator=True)
+
+    def compare(self, df_left, df_right):
+        return df_left.compare(df_right)
+
+    def tolerance(self, df_compare, tolerances, scales=None):
+        scales = scales or {}
+        in_tolerance = np.ones(len(df_compare), dtype=bool)
+        diffs_counter = {}
+        for column in df_compare.columns.get_level_values(0).unique():
+            left = df_compare[(column, 'self')]
+            right = df_compare[(column, 'other')]
+            differs = (left.notna() | right.notna()).to_numpy()
+            column_in_tolerance = np.zeros(len(df_compare), dtype=bool)
+            if column in tolerances and str(column) in scales:
+                tolerance, mode = self.get_tolerance(tolerances, column)
+                column_in_tolerance = self.decimal_tolerance(left, right, tolerance, mode, scales[str(column)])
+            elif column in tolerances and is_datetime64_any_dtype(left) and is_datetime64_any_dtype(right):
+                # Time tolerance in seconds, compared in integer nanoseconds
+                tolerance, mode = self.get_tolerance(tolerances, column)
+                if mode == 'abs':
+                    deviation = np.abs(self.to_nanoseconds(left) - self.to_nanoseconds(right))
+                    column_in_tolerance = (left.notna() & right.notna()).to_numpy() & \
+                        (deviation <= round(tolerance * 1e9))
+            elif column in tolerances:
+                tolerance, mode = self.get_tolerance(tolerances, column)
+                left = pd.to_numeric(left, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                right = pd.to_numeric(right, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    if mode == 'abs':
+                        column_in_tolerance = np.abs(left - right) <= tolerance
+                    else:
+                        column_in_tolerance = (right != 0) & (np.abs(left - right) / np.abs(right) <= tolerance)
+                column_in_tolerance &= differs
+            diffs_counter.update({column: {'absolute': int(differs.sum()),
+                                           'in_tolerance': int(column_in_tolerance.sum())}})
+            in_tolerance &= ~differs | column_in_tolerance
+        return in_tolerance, diffs_counter
+
+
+class PolarsBackend(Backend):
+    """
+    Multi-threaded Polars implementation, the operators run on lazy frames
+    and only their results are converted back to pandas
+    """
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ImportError(f'The "polars" backend requires the "polars" package!')
+
+    def read_csv(self, file, configuration, usecols=None):
+        if configuration['header_names'] or configuration['ignore_rows']:
+            # Options only supported by the pandas reader
+            return PandasBackend().read_csv(file, configuration, usecols)
+        has_header = configuration["header"] is not None
+        if usecols is not None and not has_header:
+            # Positions of the columns, read in the order of the file
+            usecols = sorted(usecols)
+        # The columns of a file without a header are named column_1, column_2, ... by polars
+        text_columns = {str(column) if has_header else f'column_{int(column) + 1}': pl.String
+                        for column in self.get_text_columns(configuration) if usecols is None or column in usecols}
+        with open_input(file) as reader:
+            df = pl.read_csv(reader, separator=configuration["separator"] or ',', has_header=has_header,
+                             null_values=csv_null_values, encoding='utf8-lossy', infer_schema_length=None,
+                             schema_overrides=text_columns or None,
+                             columns=[str(column) for column in usecols] if usecols and has_header else usecols)
+        df = df.to_pandas()
+        for column in df.columns[df.dtypes == object]:
+            # Missing texts are NaN, like in pandas.read_csv
+            df[column] = df[column].where(df[column].notna(), np.nan)
+        if configuration["header"] is None:
+            df.columns = usecols if usecols is not None else list(range(len(df.columns)))
+        return df
+
+    def merge(self, df_left, df_right, references):
+        """
+        Only the reference columns are joined in polars, with the row numbers of both reports,
+        the other columns are taken from the reports by these row numbers
+        """
+        keys = [str(reference) for reference in references]
+        try:
+            left = pl.from_pandas(self.with_str_columns(df_left[references])).with_row_index('_left_row')
+            right = pl.from_pandas(self.with_str_columns(df_right[references])).with_row_index('_right_row')
+        except conversion_errors:
+            # References of mixed types (e.g. numbers and strings) are joined by pandas
+            return PandasBackend().merge(df_left, df_right, references)
+
+        rows = left.lazy().join(right.lazy(), on=keys, how='full', coalesce=True, nulls_equal=True) \
+            .sort(keys, nulls_last=True, maintain_order=True).collect()
+        left_rows = rows['_left_row'].fill_null(-1).to_numpy()
+        right_rows = rows['_right_row'].fill_null(-1).to_numpy()
+
+        # The reference columns keep their original (e.g. integer) names
+        df_merge = rows.select(keys).to_pandas().set_axis(references, axis=1)
+        values = [column for column in df_left.columns if column not in references]
+        for df, df_rows, suffix in [(df_left, left_rows, '_x'), (df_right, right_rows, '_y')]:
+            df_values = df[values].reset_index(drop=True).reindex(df_rows).reset_index(drop=True)
+            df_merge[[f'{column}{suffix}' for column in values]] = df_values
+        df_merge = df_merge[[column if column in references else f'{column}_x' for column in df_left.columns] +
+                            [f'{column}_y' for column in values]]
+
+        merge = np.where(left_rows < 0, 'right_only', np.where(right_rows < 0, 'left_only', 'both'))
+        df_merge['_merge'] = pd.Categorical(merge, categories=['left_only', 'right_only', 'both'])
+        return df_merge
+
+    def compare(self, df_left, df_right):
+        """
+        The cells are compared in polars, equal cells (including both missing) are masked like in DataFrame.compare
+        """
+        columns = list(df_left.columns)
+        series = {}
+        for i, column in enumerate(columns):
+            try:
+                left = pl.from_pandas(df_left[column], nan_to_null=True)
+                right = pl.from_pandas(df_right[column], nan_to_null=True)
+            except conversion_errors:
+                continue
+            # Pairs of different types (e.g. strings and numbers) are compared by pandas, like DataFrame.compare does
+            if left.dtype == right.dtype or (left.dtype.is_numeric() and right.dtype.is_numeric()):
+                series.update({i: (left.alias(f'self_{i}'), right.alias(f'other_{i}'))})
+
+        differs = pd.DataFrame(index=df_left.index)
+        if series:
+            result = pl.DataFrame([part for pair in series.values() for part in pair]).lazy().select(
+                [pl.col(f'self_{i}').ne_missing(pl.col(f'other_{i}')).alias(str(i)) for i in series]).collect()
+        for i, column in enumerate(columns):
+            if i in series:
+                differs[column] = result[str(i)].to_numpy()
+            else:
+                differs[column] = ~((df_left[column] == df_right[column]) |
+                                    (df_left[column].isna() & df_right[column].isna()))
+
+        rows = differs.any(axis=1).to_numpy()
+        compared = [column for column in columns if differs[column].any()]
+        differs = differs.loc[rows, compared]
+        parts = {}
+        for column in compared:
+            parts[(column, 'self')] = df_left.loc[rows, column].where(differs[column])
+            parts[(column, 'other')] = df_right.loc[rows, column].where(differs[column])
+        df_compare = pd.DataFrame(parts, index=df_left.index[rows])
+        df_compare.columns = pd.MultiIndex.from_tuples(list(parts)) if parts else pd.MultiIndex.from_arrays([[], []])
+        return df_compare
+
+    def tolerance(self, df_compare, tolerances, scales=None):
+        scales = scales or {}
+        columns = list(df_compare.columns.get_level_values(0).unique())
+        if not columns:
+            return np.ones(len(df_compare), dtype=bool), {}
+        datetimes = [all(is_datetime64_any_dtype(df_compare[(column, side)]) for side in ['self', 'other'])
+                     for column in columns]
+        frame = pl.DataFrame([self.to_polars(f'{side}_{i}', df_compare[(column, side)], datetimes[i])
+                              for i, column in enumerate(columns) for side in ['self', 'other']])
+        missing = pl.DataFrame({f'{side}_{i}': df_compare[(column, side)].isna().to_numpy()
+                                for i, column in enumerate(columns) for side in ['self', 'other']})
+        # The decimal columns are checked exactly, in integers
+        decimals = pl.DataFrame({f'decimal_{i}': self.decimal_tolerance(df_compare[(column, 'self')],
+                                                                        df_compare[(column, 'other')],
+                                                                        *self.get_tolerance(tolerances, column),
+                                                                        scales[str(column)])
+                                 for i, column in enumerate(columns) if column in tolerances and str(column) in scales})
+        expressions = []
+        for i, column in enumerate(columns):
+            differs = ~(pl.col(f'missing_self_{i}') & pl.col(f'missing_other_{i}'))
+            if f'decimal_{i}' in decimals.columns:
+                in_tolerance = differs & pl.col(f'decimal_{i}')
+            elif column in tolerances:
+                tolerance, mode = self.get_tolerance(tolerances, column)
+                deviation = (pl.col(f'self_{i}') - pl.col(f'other_{i}')).abs()
+                if datetimes[i]:
+                    # Time tolerance in seconds, compared in integer nanoseconds
+                    tolerance = round(tolerance * 1e9) if mode == 'abs' else -1
+                elif mode == 'rel':
+                    deviation = pl.when(pl.col(f'other_{i}') != 0).then(deviation / pl.col(f'other_{i}').abs())
+                in_tolerance = (differs & (deviation <= tolerance)).fill_null(False)
+            else:
+                in_tolerance = pl.lit(False)
+            expressions += [differs.alias(f'differs_{i}'), in_tolerance.alias(f'in_tolerance_{i}')]
+        frames = [frame, missing.rename({name: f'missing_{name}' for name in missing.columns})]
+        result = pl.concat(frames + ([decimals] if decimals.columns else []), how='horizontal').lazy() \
+            .select(expressions).collect()
+
+        in_tolerance = np.ones(len(df_compare), dtype=bool)
+        diffs_counter = {}
+        for i, column in enumerate(columns):
+            differs = result[f'differs_{i}'].to_numpy()
+            column_in_tolerance = result[f'in_tolerance_{i}'].to_numpy()
+            diffs_counter.update({column: {'absolute': int(differs.sum()),
+                                           'in_tolerance': int(column_in_tolerance.sum())}})
+            in_tolerance &= ~differs | column_in_tolerance
+        return in_tolerance, diffs_counter
+
+    def to_polars(self, name, column, datetime):
+        """
+        Values for the tolerance check, int64 nanoseconds for datetime columns, floats for the others
+        """
+        if datetime:
+            return pl.from_pandas(pd.Series(pd.arrays.IntegerArray(self.to_nanoseconds(column),
+                                                                   column.isna().to_numpy()), name=name))
+        return pl.Series(name, pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan),
+                         nan_to_null=True)
+
+    @staticmethod
+    def with_str_columns(df):
+        return df.set_axis([str(column) for column in df.columns], axis=1)
+
+
+backends = {'pandas': PandasBackend, 'polars': PolarsBackend}
+
+
+def get_backend(name):
+    if name not in backends:
+        raise ValueError(f'Unknown backend: {name}, the options are: {list(backends)}')
+    return backends[name]()
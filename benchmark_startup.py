@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+# Startup benchmark of the command line tool, guards against regressions of the lazy imports
+# usage: python benchmark_startup.py [--repeats 5] [--max-seconds 0.5]
+
+parser = argparse.ArgumentParser(description='Measures the import time of DataComparer.py')
+parser.add_argument('--repeats', type=int, default=5)
+parser.add_argument('--max-seconds', type=float, default=0.5, help='fails if the best time exceeds this limit')
+arguments = parser.parse_args()
+
+root = os.path.dirname(os.path.abspath(__file__))
+script = 'import sys, DataComparer; print(",".join(m for m in ["pandas", "numpy", "xlsxwriter", "fastnumbers"] ' \
+         'if m in sys.modules))'
+
+timings = []
+for i in range(arguments.repeats):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    timings.append(time.perf_counter() - start)
+    print(f'iteration {i + 1}: {timings[-1]:0.3f}s')
+
+heavy_modules = result.stdout.strip()
+print(f'best: {min(timings):0.3f}s, mean: {sum(timings) / len(timings):0.3f}s')
+
+if heavy_modules:
+    print(f'Failed: heavy modules imported at startup: {heavy_modules}')
+    sys.exit(1)
+if min(timings) > arguments.max_seconds:
+    print(f'Failed: startup took longer than {arguments.max_seconds}s')
+    sys.exit(1)
+print('Passed')
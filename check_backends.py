@@ -0,0 +1,53 @@
+import sys
+import argparse
+import pandas as pd
+from configuration import Configuration
+from comparison import Comparison
+from backends import backends
+from logger import Logger
+
+# Conformance check of the compute backends, every comparison of the configuration is run with each installed
+# backend and the merged reports, the differences and the differences counters have to be equal
+# usage: python check_backends.py config.xml [--backends pandas polars]
+
+parser = argparse.ArgumentParser(description='Checks that all backends give the same results')
+parser.add_argument('config', help='path of the xml configuration')
+parser.add_argument('--backends', nargs='+', default=list(backends))
+arguments = parser.parse_args()
+
+xml_config = Configuration.get_xml_comparisons(arguments.config)
+log = Logger(None, 'check_backends', file_name='check_backends')
+
+failed = False
+for xml_comparison in xml_config['comparisons']:
+    results = {}
+    for backend in arguments.backends:
+        configuration, defaults = Configuration(xml_comparison, xml_config['defaults'], log).get_configuration()
+        if not configuration['enabled']:
+            break
+        configuration['backend'] = backend
+        try:
+            comparison = Comparison(configuration, defaults, '', log).get_comparison()
+        except ImportError as error:
+            print(f'{backend}: skipped, {error}')
+            continue
+        results[backend] = comparison
+
+    for backend, comparison in list(results.items())[1:]:
+        baseline_backend, baseline = next(iter(results.items()))
+        name = f'{comparison.configuration["file_name"]}: {backend} vs {baseline_backend}'
+        try:
+            for frame in ['df_merge', 'df_compare']:
+                if not (getattr(comparison, frame).empty and getattr(baseline, frame).empty):
+                    pd.testing.assert_frame_equal(getattr(comparison, frame), getattr(baseline, frame),
+                                                  check_dtype=False, obj=frame)
+            assert comparison.summary['diffs_counter'] == baseline.summary['diffs_counter'], 'diffs_counter differs'
+            print(f'{name}: equal')
+        except AssertionError as error:
+            print(f'{name}: different\n{error}')
+            failed = True
+
+if failed:
+    print('Failed')
+    sys.exit(1)
+print('Passed')
@@ -0,0 +1,62 @@
+import os
+import pickle
+import hashlib
+import xml.etree.ElementTree as ET
+from work_queue import WorkQueue
+
+
+class Checkpoints:
+    """
+    Results of the comparisons of a run, persisted to "<export_folder>\\checkpoints" as soon as
+    each comparison finishes. Each checkpoint holds the result (status and summary) and the
+    fingerprint of the configuration and the input files, so a resumed run reuses only the
+    results of unchanged comparisons.
+    """
+
+    def __init__(self, export_folder):
+        self.folder = export_folder + '\\' + 'checkpoints'
+
+    def get_path(self, file_name):
+        return self.folder + '\\' + f'{file_name}.pkl'
+
+    @staticmethod
+    def get_fingerprint(xml_comparison, xml_defaults):
+        """
+        Hash of the comparison and defaults configuration (without formatting) and of the size
+        and modification time of the input files
+        """
+        digest = hashlib.sha256()
+        for xml_element in list(xml_defaults) + [xml_comparison]:
+            digest.update(ET.canonicalize(ET.tostring(xml_element), strip_text=True).encode())
+        for tag in ['left', 'right']:
+            xml_path = xml_comparison.find(tag)
+            path = xml_path.text if xml_path is not None else None
+            if path and os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update(f'{path}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+            else:
+                digest.update(f'{path}|missing'.encode())
+        return digest.hexdigest()
+
+    def write(self, file_name, fingerprint, result):
+        os.makedirs(self.folder, exist_ok=True)
+        WorkQueue.write_atomic(self.get_path(file_name), pickle.dumps({'fingerprint': fingerprint, 'result': result}))
+
+    def read(self, file_name):
+        try:
+            with open(self.get_path(file_name), 'rb') as reader:
+                return pickle.load(reader)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def get_result(self, xml_comparison, xml_defaults):
+        """
+        The persisted result of the comparison, None if it is missing, failed (status 100)
+        or if the configuration or the inputs changed since
+        """
+        checkpoint = self.read(xml_comparison.get('file_name'))
+        if checkpoint is None or checkpoint['result'][0] == 100:
+            return None
+        if checkpoint['fingerprint'] != self.get_fingerprint(xml_comparison, xml_defaults):
+            return None
+        return checkpoint['result']
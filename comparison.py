@@ -1,22 +1,47 @@
 import os
+import mmap
+import json
 import time
+import hashlib
+import threading
 import numpy as np
 import pandas as pd
 from export_results import ExportResults
-from pandas.api.types import is_numeric_dtype
+from backends import get_backend
+from file_streams import open_input, open_seekable, detect_compression
+from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype, is_object_dtype, is_string_dtype
 from fastnumbers import query_type
 import re
+import warnings
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+
+# Edges of the log-scale histogram of the absolute deviations
+deviation_bins = [0.0, 1e-6, 1e-4, 1e-2, 1.0, 1e2, 1e4, 1e6, np.inf]
 
 
 class Comparison:
     """todo"""
 
-    def __init__(self, configuration, defaults, export_folder, log):
+    def __init__(self, configuration, defaults, export_folder, log, df_left=None, df_right=None, sample=None,
+                 watchdog=None, baseline=None):
         self.configuration = configuration
+        if configuration['keys_only']:
+            # Only the loaded columns are normalized and typed
+            projection = self.get_projection()
+            self.configuration = {**configuration,
+                                  'normalizations': {column: normalization for column, normalization
+                                                     in configuration['normalizations'].items() if column in projection},
+                                  'column_types': {column: column_type for column, column_type
+                                                   in configuration['column_types'].items() if column in projection}}
+        self.gate = configuration['gate']
         self.defaults = defaults
         self.export_folder = export_folder
         self.log = log
+        self.watchdog = watchdog
+        self.backend = get_backend(configuration['backend'])
         self.summary = {'report_name': configuration['file_name'],
                         'paths': {
                             'comp_report': export_folder + '\\' + '\\' + configuration.get('file_name') + '.xlsx',
@@ -26,17 +51,59 @@ class Comparison:
                         'column_names': [],
                         'diff_column_names': [],
                         'diffs_counter': {},
+                        'deviations': {},
                         'merge_match': {'match_both': 0, 'unmatched_left': 0, 'unmatched_right': 0},
                         'configuration': {},
                         'total_time': 0.0,
                         'note': None
                         }
-        self.df_left, self.df_right, self.add_header = self.load_reports()
+        self.df_compare = pd.DataFrame()
+        self.x_columns = []
+        self.columns_with_diffs = []
+        self.deviations = {}
+        self.sample_fraction = None
+        self.timings = {}
+        start = time.perf_counter()
+        self.baseline = baseline
+        if baseline is not None:
+            # Fan-out candidate, only the right report is loaded and prepared
+            self.df_left, self.add_header = baseline.df_left, baseline.add_header
+            self.log.logger.info(f'Comparing the candidate {self.configuration["right"]} with the loaded baseline '
+                                 f'{self.configuration["left"]}')
+            df_right = self.load_report('right')
+            if sample:
+                _, df_right, self.sample_fraction = self.sample_reports(None, df_right, sample)
+            _, self.df_right = self.prepare_reports(None, df_right)
+            self.summary['lines'].update({'left': len(self.df_left), 'right': len(self.df_right)})
+        else:
+            if df_left is not None and df_right is not None:
+                self.df_left, self.df_right, self.add_header = self.use_reports(df_left, df_right)
+            else:
+                self.df_left, self.df_right, self.add_header = self.load_reports()
+            if sample:
+                # Only the sampled lines are normalized and converted
+                self.df_left, self.df_right, self.sample_fraction = self.sample_reports(self.df_left, self.df_right,
+                                                                                        sample)
+            self.df_left, self.df_right = self.prepare_reports(self.df_left, self.df_right)
+            if self.configuration.get('fan_out'):
+                self.baseline = Baseline(self)
         self.columns = self.check_columns()
-        self.df_merge = self.merge_reports()
-        if not self.df_merge.empty:
-            self.df_compare, self.x_columns = self.compare_reports()
-            self.columns_with_diffs = self.apply_tolerances()
+        self.timings.update({'load': time.perf_counter() - start})
+
+        start = time.perf_counter()
+        if self.configuration['keys_only']:
+            self.df_merge = self.reconcile_keys()
+        elif self.gate and not sample:
+            self.df_merge = self.run_gate()
+        else:
+            self.df_merge = self.merge_reports()
+            # The loaded reports are not needed after the merge (except for the estimate of a sample)
+            if not sample and self.check_memory('merge', 'the loaded reports were released'):
+                self.df_left, self.df_right = self.df_left.iloc[:0], self.df_right.iloc[:0]
+            if not self.df_merge.empty:
+                self.df_compare, self.x_columns = self.compare_reports()
+                self.columns_with_diffs = self.apply_tolerances()
+        self.timings.update({'compare': time.perf_counter() - start})
 
     def check_columns(self):
         """
@@ -56,6 +123,12 @@ class Comparison:
 
         return columns
 
+    def check_memory(self, stage, action):
+        """
+        Consults the memory watchdog of the worker, True if the stage has to switch to its cheaper strategy
+        """
+        return self.watchdog is not None and self.watchdog.check(stage, action)
+
     def merge_reports(self):
         """
         Merges and sorts two dataframes in an "Outer join" way.
@@ -81,8 +154,7 @@ class Comparison:
         self.log.logger.info(f'The number of lines in the right file is {len(self.df_right)}')
 
         start = time.perf_counter()
-        df_merge = pd.merge(self.df_left, self.df_right, how='outer', on=self.configuration['references'],
-                            sort=True, indicator=True)
+        df_merge = self.join_reports()
 
         if max(len(self.df_left), len(self.df_right)) != len(df_merge):
             self.log.logger.warning(f'Length of input and merged tables differs!')
@@ -94,6 +166,430 @@ class Comparison:
 
         return df_merge
 
+    def join_reports(self):
+        """
+        Outer join of the reports on the reference columns, tolerant if some of them carry a tolerance
+        """
+        tolerant_references = [reference for reference in self.configuration['references']
+                               if str(reference) in self.configuration['tolerances']]
+        if tolerant_references:
+            return self.merge_reports_tolerant(tolerant_references)
+        if self.baseline is not None and self.df_left is self.baseline.df_left:
+            return self.backend.merge_indexed(self.df_left, self.df_right, self.configuration['references'],
+                                              self.baseline.get_keys(self.backend, self.configuration['references']))
+        return self.backend.merge(self.df_left, self.df_right, self.configuration['references'])
+
+    def run_gate(self):
+        """
+        Gate mode, the reports are split into shards by a hash of the exact reference columns and
+        the shards are merged, compared and checked against the tolerances one by one. The comparison
+        stops after the first shard where a threshold of the gate is exceeded, the results
+        (df_merge, df_compare and the summary) then cover the processed shards only.
+        """
+        df_left, df_right = self.df_left, self.df_right
+        exact_references = [reference for reference in self.configuration['references']
+                            if str(reference) not in self.configuration['tolerances']]
+        shards = max(self.gate['shards'], 1) if exact_references else 1
+        shards_left = self.get_shards(df_left, exact_references, shards)
+        shards_right = self.get_shards(df_right, exact_references, shards)
+        # Upper bound of the merged lines, for the percentages before the last shard
+        max_lines = len(df_left) + len(df_right)
+
+        merges, compares, columns_with_diffs = [], [], []
+        deviations = {}
+        merge_match = {'match_both': 0, 'unmatched_left': 0, 'unmatched_right': 0}
+        diffs_counter = {}
+        differences, merged, processed = 0, 0, 0
+        crossed = []
+        start = time.perf_counter()
+        for shard in range(shards):
+            self.df_left = df_left[shards_left == shard]
+            self.df_right = df_right[shards_right == shard]
+            processed += 1
+            if self.df_left.empty and self.df_right.empty:
+                continue
+
+            self.df_merge = self.join_reports()
+            self.df_merge.index = pd.RangeIndex(merged, merged + len(self.df_merge))
+            merged += len(self.df_merge)
+            self.summary['diffs_counter'], self.summary['diff_column_names'] = {}, []
+            self.df_compare, self.x_columns = self.compare_reports()
+            self.deviations = {}
+            self.columns_with_diffs = self.apply_tolerances()
+            for column, deviation in self.deviations.items():
+                for kind, values in deviation.items():
+                    deviations.setdefault(column, {}).setdefault(kind, []).append(values)
+
+            counts = self.df_merge['_merge'].value_counts()
+            for key, indicator in [('match_both', 'both'), ('unmatched_left', 'left_only'),
+                                   ('unmatched_right', 'right_only')]:
+                merge_match[key] += int(counts.get(indicator, 0))
+            for column, counter in self.summary['diffs_counter'].items():
+                total = diffs_counter.setdefault(column, {'absolute': 0, 'in_tolerance': 0})
+                total['absolute'] += counter['absolute']
+                total['in_tolerance'] += counter['in_tolerance']
+            columns_with_diffs += [column for column in self.columns_with_diffs if column not in columns_with_diffs]
+            differences += len(self.df_compare)
+            merges.append(self.df_merge)
+            compares.append(self.df_compare)
+
+            crossed = self.check_gate(differences, merge_match['unmatched_left'] + merge_match['unmatched_right'],
+                                      merged if processed == shards else max_lines)
+            if crossed:
+                break
+
+        self.df_left, self.df_right = df_left, df_right
+        df_merge = pd.concat(merges) if merges else pd.DataFrame()
+        self.df_compare = pd.concat(compares) if compares else pd.DataFrame()
+        if len(merges) > 1:
+            # Sorted by the references like a single merge, the differences follow the new line numbers
+            order = df_merge.sort_values(self.configuration['references'], kind='stable').index
+            lines = pd.Series(np.arange(len(order)), index=order)
+            df_merge = df_merge.loc[order].reset_index(drop=True)
+            self.df_compare.index = lines.loc[self.df_compare.index].to_numpy()
+            self.df_compare = self.df_compare.sort_index()
+        if not self.df_compare.empty:
+            # The shards have differences in different columns
+            self.df_compare = self.df_compare[[(column, side) for column in self.columns for side in ['self', 'other']
+                                               if (column, side) in self.df_compare.columns]]
+        self.columns_with_diffs = [column for column in self.columns if column in columns_with_diffs]
+        self.summary['lines'].update({'merged': merged})
+        self.summary['merge_match'].update(merge_match)
+        self.summary['diffs_counter'] = {column: diffs_counter[column] for column in self.columns
+                                         if column in diffs_counter}
+        self.summary['diff_column_names'] = self.columns_with_diffs
+        self.summary['deviations'] = self.get_deviation_statistics(
+            {column: {kind: np.concatenate(values) for kind, values in deviations[column].items()}
+             for column in self.columns if column in deviations})
+
+        self.set_gate(crossed, processed, shards, differences,
+                      merge_match['unmatched_left'] + merge_match['unmatched_right'], start)
+        return df_merge
+
+    def set_gate(self, crossed, processed, shards, differences, unmatched, start):
+        """
+        Adds the result of the gate to the summary and to its note
+        """
+        gate = {'passed': not crossed, 'complete': processed == shards, 'shards': shards,
+                'shards_processed': processed, 'differences': differences, 'unmatched': unmatched, 'crossed': crossed}
+        self.summary.update({'gate': gate})
+        message = f'Gate failed: {"; ".join(crossed)}' if crossed else 'Gate passed'
+        self.add_note(message)
+        self.log.logger.info(f'{message}, {processed} of {shards} shards processed, '
+                             f'elapsed time: {time.perf_counter() - start:0.2f}s')
+
+    def add_note(self, message):
+        self.summary.update({'note': f'{self.summary["note"]}; {message}' if self.summary['note'] else message})
+
+    def reconcile_keys(self):
+        """
+        Keys-only mode, the reports are reconciled on their references without joining the lines. The keys
+        of both reports are factorized together and counted per side, a line is unmatched if its key has no
+        line on the other side. The counts are those of the outer join (a key on n left and m right lines
+        is matched n * m times). Tolerant references are joined by "join_reports" on the loaded columns.
+        Returns the unmatched keys with the "_merge" indicator, sorted by the references.
+        """
+        start = time.perf_counter()
+        references = self.configuration['references']
+        if not references:
+            raise ValueError(f'The keys only comparison requires reference columns!')
+        df_left, df_right = self.df_left[references], self.df_right[references]
+
+        if any(str(reference) in self.configuration['tolerances'] for reference in references):
+            df_merge = self.join_reports()
+            counts = df_merge['_merge'].value_counts()
+            match_both, unmatched_left, unmatched_right = [int(counts.get(indicator, 0))
+                                                           for indicator in ['both', 'left_only', 'right_only']]
+            df_unmatched = df_merge.loc[df_merge['_merge'] != 'both', references + ['_merge']].reset_index(drop=True)
+        else:
+            codes = self.factorize_keys(pd.concat([df_left, df_right], ignore_index=True))
+            codes_left, codes_right = codes[:len(df_left)], codes[len(df_left):]
+            keys = int(codes.max()) + 1 if len(codes) else 0
+            counts_left = np.bincount(codes_left, minlength=keys)
+            counts_right = np.bincount(codes_right, minlength=keys)
+            left_only = counts_right[codes_left] == 0
+            right_only = counts_left[codes_right] == 0
+            match_both = int((counts_left * counts_right).sum())
+            unmatched_left, unmatched_right = int(left_only.sum()), int(right_only.sum())
+
+            df_unmatched = pd.concat([df_left[left_only], df_right[right_only]], ignore_index=True)
+            df_unmatched['_merge'] = pd.Categorical.from_codes(np.repeat([0, 1], [unmatched_left, unmatched_right]),
+                                                               categories=['left_only', 'right_only', 'both'])
+            df_unmatched = df_unmatched.sort_values(references, kind='stable').reset_index(drop=True)
+
+        self.summary['merge_match'].update({'match_both': match_both, 'unmatched_left': unmatched_left,
+                                            'unmatched_right': unmatched_right})
+        self.summary['lines'].update({'merged': match_both + unmatched_left + unmatched_right})
+        self.summary['configuration'].update(self.configuration)
+        self.add_note(f'Keys only: {unmatched_left + unmatched_right} unmatched lines')
+        self.log.logger.info(f'Reconciling the keys finished ({match_both} matched, {unmatched_left} unmatched left, '
+                             f'{unmatched_right} unmatched right), elapsed time: {time.perf_counter() - start:0.2f}s')
+        if self.gate:
+            self.set_gate(self.check_gate(0, unmatched_left + unmatched_right,
+                                          match_both + unmatched_left + unmatched_right), 1, 1, 0,
+                          unmatched_left + unmatched_right, start)
+        return df_unmatched
+
+    @staticmethod
+    def factorize_keys(df_keys):
+        """
+        Integer codes of the lines of the key columns, equal keys (including missing values) have the same code
+        """
+        codes = np.zeros(len(df_keys), dtype='int64')
+        for column in df_keys.columns:
+            column_codes, uniques = pd.factorize(df_keys[column], use_na_sentinel=False)
+            codes, _ = pd.factorize(codes * len(uniques) + column_codes)
+        return codes
+
+    def get_projection(self):
+        """
+        Columns loaded in the keys-only mode (the references and the columns of "drop_duplicates"),
+        None if all columns are loaded
+        """
+        if not self.configuration['keys_only']:
+            return None
+        references = self.configuration['references']
+        return references + [column for column in self.configuration['drop_duplicates'] if column not in references]
+
+    def sample_reports(self, df_left, df_right, fraction):
+        """
+        Keeps only the lines of the loaded reports whose hash of the exact reference columns falls into
+        the first of 1 / fraction buckets, so the same keys are kept in both reports. A report given as None
+        (the baseline of a fan-out candidate, sampled with it) is skipped.
+        Returns the sampled reports and the fraction of the lines which were kept.
+        """
+        exact_references = [reference for reference in self.configuration['references']
+                            if str(reference) not in self.configuration['tolerances']]
+        if not exact_references:
+            self.log.logger.warning(f'All references have a tolerance, the estimate uses all lines')
+            return df_left, df_right, 1.0
+
+        buckets = max(int(round(1 / fraction)), 1)
+        reports = [df for df in [df_left, df_right] if df is not None]
+        lines = sum(len(df) for df in reports)
+        df_left, df_right = [df[self.get_shards(self.get_sample_keys(df, exact_references), exact_references,
+                                                buckets) == 0] if df is not None else None
+                             for df in [df_left, df_right]]
+        sampled = sum(len(df) for df in [df_left, df_right] if df is not None)
+        self.log.logger.info(f'Sample of {sampled} of {lines} lines (bucket 1 of {buckets}) is compared')
+        return df_left, df_right, sampled / lines if sampled else 1 / buckets
+
+    def get_sample_keys(self, df, references):
+        """
+        Reference columns of a loaded report for the sampling. The raw values are hashed, only the references
+        with a normalization or a type are normalized and converted first, so their differently formatted
+        values are sampled together.
+        """
+        keys = pd.DataFrame(index=df.index)
+        for reference in references:
+            if reference not in df.columns:
+                raise ValueError(f'The key column "{reference}" was not found in the report!')
+            column = df[reference]
+            if reference in self.configuration['normalizations']:
+                column = self.normalize_column(column, self.configuration['normalizations'][reference])
+            column_type = self.configuration['column_types'].get(reference)
+            if column_type and column_type['type'] == 'datetime':
+                column = self.parse_datetime(column, column_type['format'], column_type['timezone'])
+            elif column_type and column_type['type'] == 'decimal':
+                column = self.parse_decimal(column, column_type['scale'])
+            keys[reference] = column
+        return keys
+
+    def check_gate(self, differences, unmatched, lines):
+        """
+        Returns the descriptions of the exceeded thresholds. Before the last shard the percentages
+        are related to the largest possible number of merged lines, so an exceeded threshold
+        stays exceeded when all shards are processed.
+        """
+        crossed = []
+        for threshold, count, name in [('max_differences', differences, 'differences'),
+                                       ('max_unmatched', unmatched, 'unmatched lines')]:
+            if self.gate[threshold] is None:
+                continue
+            limit = self.gate[threshold]['value']
+            if self.gate[threshold]['percent']:
+                if lines and count / lines * 100 > limit:
+                    crossed.append(f'{name} exceed {limit:g}% ({count} of at most {lines} lines)')
+            elif count > limit:
+                crossed.append(f'{name} exceed {limit:g} ({count})')
+        return crossed
+
+    @staticmethod
+    def get_shards(df, references, shards):
+        """
+        Shard number of each line, by a hash of the reference columns. Numbers are hashed
+        as floats, so integer and float keys of the same value land in the same shard.
+        """
+        if shards == 1 or df.empty:
+            return np.zeros(len(df), dtype=np.int64)
+        keys = pd.DataFrame({str(reference): df[reference].astype('float64') if is_numeric_dtype(df[reference])
+                             else df[reference] for reference in references})
+        return (pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(shards)).astype(np.int64)
+
+    def merge_reports_tolerant(self, tolerant_references):
+        """
+        Outer join of two dataframes where some of the reference columns carry a tolerance.
+        The references without tolerance are joined exactly, the first tolerant reference is
+        matched to the nearest value within its tolerance by a sorted "merge_asof" and the
+        remaining tolerant references are checked against their tolerances afterwards.
+        Every line is matched at most once, to the nearest free line of the other report.
+        The result has the same layout as the exact "pd.merge" (references, "_x"/"_y" columns
+        and the "_merge" indicator as the last column).
+        """
+        references = self.configuration['references']
+        exact_references = [reference for reference in references if reference not in tolerant_references]
+        df_left = self.df_left.reset_index(drop=True)
+        df_right = self.df_right.reset_index(drop=True)
+
+        keys_left = pd.DataFrame({'_row_left': np.arange(len(df_left))})
+        keys_right = pd.DataFrame({'_row_right': np.arange(len(df_right))})
+        windows = {}
+        for i, reference in enumerate(tolerant_references):
+            key_left, key_right = self.get_tolerance_keys(df_left[reference], df_right[reference])
+            tolerance = self.configuration['tolerances'][str(reference)]
+            if tolerance['tolerance_mode'].lower() == 'abs':
+                # The keys of a decimal column are scaled integers
+                window = tolerance['tolerance'] * 10 ** self.get_scales().get(str(reference), 0)
+            else:
+                # The relative tolerance is checked per line after the join,
+                # the join itself uses the widest possible window
+                window = tolerance['tolerance'] * np.nanmax(np.abs(key_right)) if len(key_right) else 0.0
+            windows.update({i: window})
+            keys_left[f'_key_{i}'] = key_left
+            keys_right[f'_key_{i}'] = key_right
+        for i, reference in enumerate(exact_references):
+            keys_left[f'_exact_{i}'] = df_left[reference].values
+            keys_right[f'_exact_{i}'] = df_right[reference].values
+        by_columns = [f'_exact_{i}' for i in range(len(exact_references))]
+
+        # "merge_asof" requires the "on" key without missing values and sorted
+        keys_left = keys_left[keys_left['_key_0'].notna()].sort_values('_key_0', kind='stable')
+        keys_right = keys_right[keys_right['_key_0'].notna()].sort_values('_key_0', kind='stable')
+        group_columns = by_columns + ['_key_0']
+
+        def pair(keys, others):
+            """
+            Every line of "others" goes to the nearest key of the "keys" lines (of the other report), the
+            closest lines of a key are paired with the lines of the key by their rank. The columns of the
+            "others" lines get the suffix "_other".
+            """
+            keys = keys.assign(_nearest=keys['_key_0'],
+                               _rank=keys.groupby(group_columns, dropna=False, sort=False).cumcount())
+            nearest = pd.merge_asof(others, keys.drop_duplicates(group_columns)[group_columns + ['_nearest']],
+                                    on='_key_0', by=by_columns if by_columns else None, tolerance=windows[0],
+                                    direction='nearest')
+            nearest = nearest[nearest['_nearest'].notna()]
+            nearest = nearest.assign(_distance=np.abs(nearest['_key_0'] - nearest['_nearest']))
+            nearest = nearest.sort_values('_distance', kind='stable')
+            nearest['_rank'] = nearest.groupby(by_columns + ['_nearest'], dropna=False, sort=False).cumcount()
+            return keys.merge(nearest.drop(columns='_distance'), on=by_columns + ['_nearest', '_rank'],
+                              suffixes=('', '_other'))
+
+        def swap(column):
+            # The lines of the right report were the keys of the pass
+            if column.endswith('_other'):
+                return column[:-len('_other')]
+            return f'{column}_right' if column.startswith('_key_') else column
+
+        # The passes alternate: the right lines go to the nearest left keys, then the left lines to the
+        # nearest right keys, so the duplicated keys of either report are matched in the same pass.
+        # A pass is a sorted "merge_asof" and an exact merge. The lines still free are matched again,
+        # until neither direction adds a match.
+        passes = []
+        right_to_left = True
+        idle = 0
+        while len(keys_left) and len(keys_right) and idle < 2:
+            if right_to_left:
+                matches = pair(keys_left, keys_right).rename(columns=lambda column: column.replace('_other', '_right'))
+            else:
+                matches = pair(keys_right, keys_left).rename(columns=swap)
+            right_to_left = not right_to_left
+
+            # Check all tolerant references against their own tolerance
+            in_tolerance = np.ones(len(matches), dtype=bool)
+            for i, reference in enumerate(tolerant_references):
+                deviation = np.abs(matches[f'_key_{i}'] - matches[f'_key_{i}_right']).values
+                tolerance = self.configuration['tolerances'][str(reference)]
+                if tolerance['tolerance_mode'].lower() == 'abs':
+                    in_tolerance &= deviation <= windows[i]
+                else:
+                    in_tolerance &= deviation <= tolerance['tolerance'] * np.abs(matches[f'_key_{i}_right']).values
+            matches = matches[in_tolerance]
+            if matches.empty:
+                idle += 1
+                continue
+            idle = 0
+            passes.append(matches)
+            keys_left = keys_left[~keys_left['_row_left'].isin(matches['_row_left'])]
+            keys_right = keys_right[~keys_right['_row_right'].isin(matches['_row_right'])]
+        matches = pd.concat(passes) if passes else pd.DataFrame({'_row_left': [], '_row_right': []})
+        rows_left = matches['_row_left'].to_numpy(dtype=np.int64)
+        rows_right = matches['_row_right'].to_numpy(dtype=np.int64)
+        only_left = np.setdiff1d(np.arange(len(df_left)), rows_left)
+        only_right = np.setdiff1d(np.arange(len(df_right)), rows_right)
+
+        values = [column for column in df_left.columns if column not in references]
+        part_left = df_left[values].add_suffix('_x')
+        part_right = df_right[values].add_suffix('_y')
+        parts = [pd.concat([df_left[references].iloc[rows_left].reset_index(drop=True),
+                            part_left.iloc[rows_left].reset_index(drop=True),
+                            part_right.iloc[rows_right].reset_index(drop=True)], axis=1).assign(_merge='both'),
+                 pd.concat([df_left[references].iloc[only_left].reset_index(drop=True),
+                            part_left.iloc[only_left].reset_index(drop=True)], axis=1).assign(_merge='left_only'),
+                 pd.concat([df_right[references].iloc[only_right].reset_index(drop=True),
+                            part_right.iloc[only_right].reset_index(drop=True)], axis=1).assign(_merge='right_only')]
+        df_merge = pd.concat(parts, ignore_index=True)
+
+        columns = [column if column in references else f'{column}_x' for column in df_left.columns]
+        columns += [f'{column}_y' for column in values] + ['_merge']
+        df_merge = df_merge[columns].sort_values(references, kind='stable').reset_index(drop=True)
+        df_merge['_merge'] = pd.Categorical(df_merge['_merge'], categories=['left_only', 'right_only', 'both'])
+
+        self.log.logger.info(f'Tolerant join on {", ".join(str(reference) for reference in tolerant_references)}: '
+                             f'{len(rows_left)} lines matched, {len(only_left)} left and {len(only_right)} '
+                             f'right lines unmatched')
+        return df_merge
+
+    @staticmethod
+    def get_tolerance_keys(column_left, column_right):
+        """
+        Converts a pair of reference columns to float keys for a tolerant join.
+        Numeric columns are used as they are, date columns are converted
+        to seconds so the tolerance is given in seconds.
+        """
+        if is_numeric_dtype(column_left) and is_numeric_dtype(column_right):
+            return column_left.astype('float64').values, column_right.astype('float64').values
+
+        # A typed datetime column would pass pd.to_numeric as nanoseconds, the dates are converted to seconds below
+        if not is_datetime64_any_dtype(column_left) and not is_datetime64_any_dtype(column_right):
+            numeric_left = pd.to_numeric(column_left, errors='coerce')
+            numeric_right = pd.to_numeric(column_right, errors='coerce')
+            if numeric_left.notna().sum() == column_left.notna().sum() and \
+                    numeric_right.notna().sum() == column_right.notna().sum():
+                return numeric_left.astype('float64').values, numeric_right.astype('float64').values
+
+        dates_left = Comparison.parse_dates(column_left)
+        dates_right = Comparison.parse_dates(column_right)
+        if dates_left.notna().sum() != column_left.notna().sum() or \
+                dates_right.notna().sum() != column_right.notna().sum():
+            raise ValueError(f'Reference column "{column_left.name}" has a tolerance, '
+                             f'but its values are neither numbers nor dates!')
+        seconds_left = dates_left.astype('int64').astype('float64').where(dates_left.notna()) / 1e9
+        seconds_right = dates_right.astype('int64').astype('float64').where(dates_right.notna()) / 1e9
+        return seconds_left.values, seconds_right.values
+
+    @staticmethod
+    def parse_dates(column):
+        """
+        Vectorized parsing of a date column, ISO 8601 first and any other format as a fallback
+        """
+        if is_datetime64_any_dtype(column):
+            return column
+        dates = pd.to_datetime(column, errors='coerce', format='ISO8601')
+        if dates.notna().sum() != column.notna().sum():
+            dates = pd.to_datetime(column, errors='coerce', format='mixed')
+        return dates
+
     def compare_reports(self):
         """
         At this point the two reports are sorted and merged in the "df_merge" dataframe.
@@ -118,23 +614,19 @@ class Comparison:
                     tolerance_indexes.update(
                         {header_names.index(str(column_name) + '_x'): self.configuration['tolerances'][column_name]})
 
-        df_left_compare = self.df_merge.iloc[:, columns_compare_left]
-        df_right_compare = self.df_merge.iloc[:, columns_compare_right]
-
-        left_header = df_left_compare.columns.values.tolist()
-        for i in range(len(left_header)):
-            left_header[i] = left_header[i][:-2]
-
-        right_header = df_right_compare.columns.values.tolist()
-        for i in range(len(right_header)):
-            right_header[i] = right_header[i][:-2]
-
-        # df_left_compare.set_axis(left_header, axis=1, inplace=True)
-        df_left_compare = df_left_compare.set_axis(left_header, axis=1)
-        df_right_compare = df_right_compare.set_axis(right_header, axis=1)
+        left_header = [header_names[i][:-2] for i in columns_compare_left]
+        right_header = [header_names[i][:-2] for i in columns_compare_right]
 
         start = time.perf_counter()
-        df_comparison = df_left_compare.compare(df_right_compare)
+        chunk_rows = self.watchdog.chunk_rows if self.watchdog else None
+        if chunk_rows and len(self.df_merge) > chunk_rows and \
+                self.check_memory('compare', f'the reports were compared in chunks of {chunk_rows} lines'):
+            df_comparison = self.compare_chunks(columns_compare_left, columns_compare_right, left_header,
+                                                right_header, chunk_rows)
+        else:
+            df_left_compare = self.df_merge.iloc[:, columns_compare_left].set_axis(left_header, axis=1)
+            df_right_compare = self.df_merge.iloc[:, columns_compare_right].set_axis(right_header, axis=1)
+            df_comparison = self.backend.compare(df_left_compare, df_right_compare)
 
         if 'both' in self.df_merge._merge.values:
             both_lines = self.df_merge._merge.value_counts()['both']
@@ -152,6 +644,20 @@ class Comparison:
 
         return df_comparison, columns
 
+    def compare_chunks(self, columns_left, columns_right, left_header, right_header, chunk_rows):
+        """
+        Compares the merged reports in chunks of lines, only a chunk of the compared columns is copied at once
+        """
+        chunks = []
+        for chunk_start in range(0, len(self.df_merge), chunk_rows):
+            df_chunk = self.df_merge.iloc[chunk_start:chunk_start + chunk_rows]
+            chunks.append(self.backend.compare(df_chunk.iloc[:, columns_left].set_axis(left_header, axis=1),
+                                               df_chunk.iloc[:, columns_right].set_axis(right_header, axis=1)))
+        df_comparison = pd.concat(chunks)
+        # The chunks have differences in different columns
+        return df_comparison[[(column, side) for column in left_header for side in ['self', 'other']
+                              if (column, side) in df_comparison.columns]]
+
     def apply_tolerances(self):
         """
         The data frame self.df;comparison contains only differences, so it is effectively
@@ -178,67 +684,21 @@ class Comparison:
         self.log.logger.info(f'Applying the defaults to configuration finished, '
                              f'elapsed time: {time.perf_counter() - start:0.2f}s')
 
-        # Select the pairs of columns which have the tolerance defined
+        # Check the differences of each column against its tolerance (backend operator)
         start = time.perf_counter()
-        columns_with_diffs = []
-        tolerance_check = []
-        unique_column = 0
-        for i in range(0, len(self.df_compare.columns), 2):
-            columns_with_diffs.append(self.df_compare.columns[i][0])
-            if self.df_compare.columns[i][0] in self.configuration['tolerances']:
-                has_tolerance = True
-            else:
-                has_tolerance = False
-
-            tolerance_check.append({'has_tolerance': has_tolerance,
-                                    'indexes': [i, i + 1],
-                                    'unique_column': unique_column})
-            unique_column += 1
-
+        columns_with_diffs = list(self.df_compare.columns.get_level_values(0).unique())
         self.summary['diff_column_names'].extend(columns_with_diffs)
 
-        # Differences counter for each column
-        diffs_counter = {}
-        for diff_column in columns_with_diffs:
-            diffs_counter.update({diff_column: {'absolute': 0, 'in_tolerance': 0}})
-
-        # Drop the lines where there are differences in tolerances
-        if tolerance_check:
-            rows_to_drop = []
-            for index, line in self.df_compare.iterrows():
-                drop = [False] * len(tolerance_check)
-                for check in tolerance_check:
-                    if pd.isna(line[check['indexes'][0]]) and pd.isna(line[check['indexes'][1]]):
-                        drop[check['unique_column']] = True
-                        continue
-                    column_name = line.index[check['indexes'][0]][0]
-                    diffs_counter[column_name]['absolute'] += 1
-                    if check['has_tolerance'] is True:
-                        left_val = self.check_for_number(line[check['indexes'][0]])
-                        right_val = self.check_for_number(line[check['indexes'][1]])
-                        if is_numeric_dtype(left_val) and is_numeric_dtype(right_val):
-                            if column_name in self.configuration['tolerances']:
-                                if self.configuration['tolerances'][column_name]['tolerance_mode'].lower() == 'abs':
-                                    if abs(left_val - right_val) <= \
-                                            self.configuration['tolerances'][column_name]['tolerance']:
-                                        drop[check['unique_column']] = True
-                                        diffs_counter[column_name]['in_tolerance'] += 1
-                                elif self.configuration['tolerances'][column_name]['tolerance_mode'].lower() == 'rel':
-                                    # check the dividing by zero!
-                                    if right_val != 0:
-                                        if abs(left_val - right_val) / abs(right_val) <= \
-                                                self.configuration['tolerances'][column_name]['tolerance']:
-                                            drop[check['unique_column']] = True
-                                            diffs_counter[column_name]['in_tolerance'] += 1
-                                else:
-                                    raise ValueError(f'Unknown parameter for "tolerance mode": '
-                                                     f'{self.configuration["tolerances"][column_name]["tolerance_mode"]}, '
-                                                     f'have to be "Abs" or "Rel"')
-
-                if False not in drop:
-                    rows_to_drop.append(index)
-
-            if rows_to_drop:
+        if columns_with_diffs:
+            in_tolerance, diffs_counter = self.backend.tolerance(self.df_compare, self.configuration['tolerances'],
+                                                                 self.get_scales())
+            # Deviations of all differences, before the differences in tolerance are dropped
+            self.deviations = self.get_deviations(self.df_compare)
+            self.summary['deviations'] = self.get_deviation_statistics(self.deviations)
+
+            # Drop the lines where all differences are in tolerances
+            rows_to_drop = self.df_compare.index[in_tolerance]
+            if len(rows_to_drop):
                 self.log.logger.info(f'By applying the tolerances, {len(rows_to_drop)} '
                                      f'({(len(rows_to_drop) / len(self.df_compare)) * 100:0.2f}%) differences were deleted')
                 self.df_compare.drop(rows_to_drop, inplace=True)
@@ -250,6 +710,66 @@ class Comparison:
 
         return columns_with_diffs
 
+    def get_scales(self):
+        """
+        Scales of the decimal columns, {str(column): scale} like the keys of the tolerances
+        """
+        return {str(column): column_type['scale'] for column, column_type in self.configuration['column_types'].items()
+                if column_type['type'] == 'decimal'}
+
+    def get_deviations(self, df_compare):
+        """
+        Absolute and relative deviations of the numeric differences of each column (datetime
+        columns in seconds, without relative deviations), the other values are skipped
+        """
+        deviations = {}
+        scales = self.get_scales()
+        for column in df_compare.columns.get_level_values(0).unique():
+            left = df_compare[(column, 'self')]
+            right = df_compare[(column, 'other')]
+            if is_datetime64_any_dtype(left) and is_datetime64_any_dtype(right):
+                valid = (left.notna() & right.notna()).to_numpy()
+                absolute = np.abs(self.backend.to_nanoseconds(left)[valid]
+                                  - self.backend.to_nanoseconds(right)[valid]) / 1e9
+                relative = np.array([])
+            else:
+                left = pd.to_numeric(left, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                right = pd.to_numeric(right, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                valid = np.isfinite(left) & np.isfinite(right)
+                # The relative deviation does not depend on the scale of the decimal columns
+                difference = np.abs(left[valid] - right[valid])
+                nonzero = right[valid] != 0
+                relative = difference[nonzero] / np.abs(right[valid][nonzero])
+                absolute = difference / 10 ** scales.get(str(column), 0)
+            if len(absolute):
+                deviations.update({column: {'absolute': absolute, 'relative': relative}})
+        return deviations
+
+    @classmethod
+    def get_deviation_statistics(cls, deviations):
+        """
+        Statistics of the deviations of each column: count, min/max/mean and percentiles of the absolute
+        and relative deviations and the log-scale histogram of the absolute deviations as
+        [lower edge, count] pairs (see deviation_bins)
+        """
+        statistics = {}
+        for column, deviation in deviations.items():
+            histogram = np.histogram(deviation['absolute'], bins=deviation_bins)[0]
+            statistics.update({column: {'count': len(deviation['absolute']),
+                                        'absolute': cls.get_statistics(deviation['absolute']),
+                                        'relative': cls.get_statistics(deviation['relative']),
+                                        'histogram': [[edge, int(count)] for edge, count in
+                                                      zip(deviation_bins, histogram)]}})
+        return statistics
+
+    @staticmethod
+    def get_statistics(values):
+        if not len(values):
+            return None
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {'min': float(values.min()), 'max': float(values.max()), 'mean': float(values.mean()),
+                'p50': float(p50), 'p90': float(p90), 'p99': float(p99)}
+
     @staticmethod
     def check_for_number(input_value):
         """
@@ -269,7 +789,7 @@ class Comparison:
 
     @staticmethod
     def read_w_replace(file, sep, replace=None, r_start=None, r_end=None, ignore_r=None):
-        with open(file, 'r') as reader:
+        with open_input(file, 'r') as reader:
             lines = reader.readlines()
 
             for i in range(len(lines)):
@@ -293,12 +813,130 @@ class Comparison:
 
         return df
 
+    @staticmethod
+    def read_excel(file, sheet=0, usecols=None, log=None):
+        """
+        Reads a sheet of a workbook with the fastest available engine ("calamine" if installed).
+        A parquet copy of the sheet is kept next to the workbook (if "pyarrow" is installed),
+        later runs read the copy as long as the workbook, sheet and usecols are unchanged.
+        """
+        start = time.perf_counter()
+        stat = os.stat(file)
+        signature = json.dumps({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sheet': sheet, 'usecols': usecols})
+        cache_file = f'{file}.{hashlib.md5(json.dumps([sheet, usecols]).encode()).hexdigest()[:8]}.parquet'
+        use_cache = find_spec('pyarrow') is not None
+
+        if use_cache and os.path.isfile(cache_file):
+            import pyarrow.parquet as pq
+            metadata = pq.read_schema(cache_file).metadata or {}
+            if metadata.get(b'datacomparer_source', b'').decode() == signature:
+                df = pd.read_parquet(cache_file)
+                if log:
+                    log.logger.info(f'Reading file: {file} from the cached copy took {time.perf_counter() - start:0.2f}s')
+                return df
+
+        engine = 'calamine' if find_spec('python_calamine') is not None else None
+        df = pd.read_excel(open_seekable(file), sheet, usecols=usecols, engine=engine)
+        if log:
+            log.logger.info(f'Reading file: {file} ({engine or "default"} engine) took '
+                            f'{time.perf_counter() - start:0.2f}s')
+
+        if use_cache:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            try:
+                table = pa.Table.from_pandas(df)
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                       b'datacomparer_source': signature.encode()})
+                pq.write_table(table, cache_file + '.tmp')
+                os.replace(cache_file + '.tmp', cache_file)
+            except (OSError, ValueError, TypeError, pa.ArrowException) as e:
+                if log:
+                    log.logger.warning(f'Cached copy of {file} was not written: {e}')
+        return df
+
+    @staticmethod
+    def read_fixed_width(file, column_widths, skip_header=False, ignore_r=None, encoding='latin-1',
+                         batch_size=1000000):
+        """
+        Reads a fixed width file. The file is memory-mapped and viewed as a NumPy byte array,
+        the fields are sliced out of it for a batch of lines at once, numeric fields are
+        converted directly from the bytes, so no Python string is created per line.
+            column_widths: {column name: (offset, width)}
+        """
+        if detect_compression(file) is None and os.path.getsize(file):
+            with open(file, 'rb') as reader:
+                data = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open_input(file) as stream:
+                data = stream.read()
+        buffer = np.frombuffer(data, dtype=np.uint8)
+
+        # Start and end of each line, without the line break
+        line_ends = np.flatnonzero(buffer == ord('\n'))
+        line_starts = np.concatenate(([0], line_ends + 1))
+        line_ends = np.concatenate((line_ends, [len(buffer)]))
+        if line_starts[-1] == len(buffer):
+            line_starts, line_ends = line_starts[:-1], line_ends[:-1]
+        carriage_return = np.zeros(len(line_ends), dtype=bool)
+        has_char = line_ends > line_starts
+        carriage_return[has_char] = buffer[line_ends[has_char] - 1] == ord('\r')
+        line_ends = line_ends - carriage_return
+
+        keep = np.ones(len(line_starts), dtype=bool)
+        if skip_header and len(keep):
+            keep[0] = False
+        if ignore_r:
+            ignored = np.array(ignore_r if isinstance(ignore_r, list) else [ignore_r])
+            keep[ignored[ignored < len(keep)]] = False
+        line_starts, line_ends = line_starts[keep], line_ends[keep]
+
+        columns = {name: [] for name in column_widths}
+        for first in range(0, len(line_starts), batch_size):
+            starts = line_starts[first:first + batch_size, None]
+            ends = line_ends[first:first + batch_size, None]
+            for name, (offset, width) in column_widths.items():
+                indexes = starts + offset + np.arange(width)
+                chars = buffer[np.minimum(indexes, len(buffer) - 1)]
+                chars[indexes >= ends] = ord(' ')  # Fields behind the end of a line are blank
+                fields = chars.view(f'S{width}').ravel()
+                columns[name].append(np.char.strip(fields))
+
+        df = pd.DataFrame({name: Comparison.convert_fields(np.concatenate(batches) if batches else
+                                                           np.array([], dtype='S1'), encoding)
+                           for name, batches in columns.items()})
+        if isinstance(data, mmap.mmap):
+            del buffer
+            data.close()
+        return df
+
+    @staticmethod
+    def convert_fields(fields, encoding):
+        """
+        Converts an array of stripped byte fields to integers or floats
+        if all of them are numeric, otherwise to strings, empty fields are missing values
+        """
+        empty = fields == b''
+        for dtype in [np.int64, np.float64]:
+            try:
+                values = fields[~empty].astype(dtype)
+            except (ValueError, OverflowError):
+                continue
+            if not empty.any():
+                return values
+            column = np.full(len(fields), np.nan)
+            column[~empty] = values
+            return column
+
+        column = pd.Series(np.char.decode(fields, encoding), dtype=object)
+        column[empty] = np.nan
+        return column
+
     def load_reports(self):
         """
         todo
         """
 
-        start = time.perf_counter()
         self.log.logger.info('')
         self.log.logger.info('  *******  Reports Comparison  *******  ')
         self.log.logger.info(f'Comparing the files started: {os.path.basename(self.configuration["left"])} '
@@ -306,61 +944,304 @@ class Comparison:
 
         if self.configuration["file_type"] == 'xls':
             # df_left = pd.read_excel(comparison["left"], encoding='unicode_escape')
-            df_left = pd.read_excel(self.configuration["left"], 0)
-            df_right = pd.read_excel(self.configuration["right"], 0)
-        elif self.configuration["remove_begin"] or self.configuration["remove_end"] or self.configuration["replace"]:
-            df_left = self.read_w_replace(self.configuration["left"], 'III', replace=self.configuration["replace"],
-                                          r_start=self.configuration["remove_begin"],
-                                          r_end=self.configuration["remove_end"],
-                                          ignore_r=self.configuration["ignore_rows"])
-            df_right = self.read_w_replace(self.configuration["right"], 'III', replace=self.configuration["replace"],
-                                           r_start=self.configuration["remove_begin"],
-                                           r_end=self.configuration["remove_end"],
-                                           ignore_r=self.configuration["ignore_rows"])
+            # Both workbooks are parsed concurrently
+            with ThreadPoolExecutor(2) as executor:
+                left = executor.submit(self.load_report, 'left')
+                right = executor.submit(self.load_report, 'right')
+                df_left, df_right = left.result(), right.result()
         else:
-            df_left = pd.read_csv(self.configuration["left"], sep=self.configuration["separator"],
-                                  header=self.configuration["header"],
-                                  names=self.configuration['header_names'], encoding='unicode_escape', engine='python',
-                                  skiprows=self.configuration["ignore_rows"])
-            if len(self.configuration['drop_duplicates']) > 0:
-                df_left.drop_duplicates(subset=self.configuration['drop_duplicates'], inplace=True)
-
-            # In case that there are no header, Cast the column number to string
-            if not self.configuration["header"] and self.configuration['header_names']:
-                columns_names = []
-                for i in range(len(df_left.columns)):
-                    columns_names.append(str(i))
-                df_left.columns = columns_names
+            df_left = self.load_report('left')
+            df_right = self.load_report('right')
+        if self.configuration["header"] or self.configuration['header_names']:
+            add_header = True
+        else:
+            add_header = False
 
-            self.log.logger.info(f'Reading file: {self.configuration["left"]} took {time.perf_counter() - start:0.2f}s')
+        self.summary['lines'].update({'left': len(df_left)})
+        self.summary['lines'].update({'right': len(df_right)})
 
-            start = time.perf_counter()
-            df_right = pd.read_csv(self.configuration["right"], sep=self.configuration["separator"],
-                                   header=self.configuration["header"],
-                                   names=self.configuration['header_names'], encoding='unicode_escape', engine='python',
-                                   skiprows=self.configuration["ignore_rows"])
+        return df_left, df_right, add_header
 
+    def load_report(self, side):
+        """
+        Loads the left or the right report with the reader of the file type
+        """
+        start = time.perf_counter()
+        file = self.configuration[side]
+        # The keys-only mode reads just the projected columns where the reader supports it
+        projection = self.get_projection()
+        if self.configuration["file_type"] == 'xls':
+            try:
+                return self.read_excel(file, self.configuration["sheet"], self.configuration["usecols"] or projection,
+                                       self.log)
+            except Exception:
+                self.check_header(side, projection)
+                raise
+        elif self.configuration["file_type"] == 'fixed_width':
+            column_widths = {column: width for column, width in self.configuration['column_widths'].items()
+                             if projection is None or column in projection}
+            df = self.read_fixed_width(file, column_widths,
+                                       skip_header=self.configuration["header"] is not None,
+                                       ignore_r=self.configuration["ignore_rows"])
             if len(self.configuration['drop_duplicates']) > 0:
-                df_right.drop_duplicates(subset=self.configuration['drop_duplicates'], inplace=True)
+                df.drop_duplicates(subset=self.configuration['drop_duplicates'], inplace=True)
+            return df
+        elif self.configuration["remove_begin"] or self.configuration["remove_end"] or self.configuration["replace"]:
+            return self.read_w_replace(file, 'III', replace=self.configuration["replace"],
+                                       r_start=self.configuration["remove_begin"],
+                                       r_end=self.configuration["remove_end"],
+                                       ignore_r=self.configuration["ignore_rows"])
 
-            # In case that there are no header, Cast the column number to string
-            if not self.configuration["header"] and self.configuration['header_names']:
-                columns_names = []
-                for i in range(len(df_left.columns)):
-                    columns_names.append(str(i))
-                df_right.columns = columns_names
+        # Headers given by "header_names" are replaced by the column numbers below
+        renamed = not self.configuration["header"] and self.configuration['header_names']
+        try:
+            df = self.backend.read_csv(file, self.configuration, usecols=None if renamed else projection)
+        except Exception:
+            self.check_header(side, None if renamed else projection)
+            raise
+        if len(self.configuration['drop_duplicates']) > 0:
+            df.drop_duplicates(subset=self.configuration['drop_duplicates'], inplace=True)
 
-            self.log.logger.info(
-                f'Reading file: {self.configuration["right"]} took {time.perf_counter() - start:0.2f}s')
-        if self.configuration["header"] or self.configuration['header_names']:
-            add_header = True
-        else:
-            add_header = False
+        # In case that there are no header, Cast the column number to string
+        if not self.configuration["header"] and self.configuration['header_names']:
+            columns_names = []
+            for i in range(len(df.columns)):
+                columns_names.append(str(i))
+            df.columns = columns_names
+
+        self.log.logger.info(f'Reading file: {file} took {time.perf_counter() - start:0.2f}s')
+        return df
+
+    def check_header(self, side, projection):
+        """
+        Called when the read of a report with the projected columns failed, the readers reject a missing column
+        with their own errors. Raises the error of the missing key column, otherwise the original error is raised.
+        """
+        if projection is None:
+            return
+        file = self.configuration[side]
+        try:
+            if self.configuration["file_type"] == 'xls':
+                columns = pd.read_excel(open_seekable(file), self.configuration["sheet"], nrows=0).columns
+            else:
+                with open_input(file) as reader:
+                    columns = pd.read_csv(reader, sep=self.configuration["separator"],
+                                          header=self.configuration["header"], encoding='unicode_escape',
+                                          engine='python', skiprows=self.configuration["ignore_rows"], nrows=0).columns
+        except (OSError, ValueError):
+            return
+        names = [str(column) for column in columns]
+        for column in projection:
+            if str(column) not in names:
+                raise ValueError(f'The key column "{column}" was not found in the {side} report!')
+
+    def use_reports(self, df_left, df_right):
+        """
+        In-memory reports are used instead of loading the files, they are never modified
+        """
+        if len(self.configuration['drop_duplicates']) > 0:
+            df_left = df_left.drop_duplicates(subset=self.configuration['drop_duplicates'])
+            df_right = df_right.drop_duplicates(subset=self.configuration['drop_duplicates'])
 
         self.summary['lines'].update({'left': len(df_left)})
         self.summary['lines'].update({'right': len(df_right)})
 
-        return df_left, df_right, add_header
+        return df_left, df_right, True
+
+    def prepare_reports(self, df_left, df_right):
+        """
+        Projects the reports in the keys-only mode, normalizes and converts the typed columns of the reports,
+        a report given as None is skipped
+        """
+        projection = self.get_projection()
+        if projection is not None:
+            for df, side in [(df, side) for df, side in [(df_left, 'left'), (df_right, 'right')] if df is not None]:
+                for column in projection:
+                    if column not in df.columns:
+                        raise ValueError(f'The key column "{column}" was not found in the {side} report!')
+            df_left = df_left[projection] if df_left is not None else None
+            df_right = df_right[projection]
+        if self.configuration['normalizations']:
+            df_left, df_right = self.normalize_reports(df_left, df_right)
+        if self.configuration['column_types']:
+            df_left, df_right = self.convert_types(df_left, df_right)
+        return df_left, df_right
+
+    def normalize_reports(self, df_left, df_right):
+        """
+        Applies the normalization rules of the columns to both reports, so the formatting noise
+        is not compared. The normalized columns replace the loaded ones in shallow copies of the reports.
+        """
+        start = time.perf_counter()
+        df_left = df_left.copy(deep=False) if df_left is not None else None
+        df_right = df_right.copy(deep=False)
+        for column, normalization in self.configuration['normalizations'].items():
+            for df, side in [(df, side) for df, side in [(df_left, 'left'), (df_right, 'right')] if df is not None]:
+                if column not in df.columns:
+                    raise ValueError(f'The normalized column "{column}" was not found in the {side} report!')
+                df[column] = self.normalize_column(df[column], normalization)
+
+        self.log.logger.info(f'Normalizing {len(self.configuration["normalizations"])} columns finished, '
+                             f'elapsed time: {time.perf_counter() - start:0.2f}s')
+        return df_left, df_right
+
+    def convert_types(self, df_left, df_right):
+        """
+        Parses the typed columns of both reports, in shallow copies of the reports
+        """
+        start = time.perf_counter()
+        df_left = df_left.copy(deep=False) if df_left is not None else None
+        df_right = df_right.copy(deep=False)
+        for column, column_type in self.configuration['column_types'].items():
+            for df, side in [(df, side) for df, side in [(df_left, 'left'), (df_right, 'right')] if df is not None]:
+                if column not in df.columns:
+                    raise ValueError(f'The typed column "{column}" was not found in the {side} report!')
+                if column_type['type'] == 'datetime':
+                    df[column] = self.parse_datetime(df[column], column_type['format'], column_type['timezone'])
+                elif column_type['type'] == 'decimal':
+                    df[column] = self.parse_decimal(df[column], column_type['scale'])
+        self.log.logger.info(f'Parsing {len(self.configuration["column_types"])} typed columns finished, '
+                             f'elapsed time: {time.perf_counter() - start:0.2f}s')
+        return df_left, df_right
+
+    def parse_datetime(self, column, date_format=None, timezone=None):
+        """
+        Vectorized parsing of a datetime column. The values without an offset are in the "timezone",
+        the values with an offset are converted to it (to UTC without a "timezone" if the offsets differ).
+        The values which cannot be parsed are missing values (NaT), their number is logged.
+        """
+        try:
+            with warnings.catch_warnings():
+                # Values with different offsets are parsed in UTC below
+                warnings.simplefilter('ignore', FutureWarning)
+                if date_format:
+                    dates = column if is_datetime64_any_dtype(column) else \
+                        pd.to_datetime(column, errors='coerce', format=date_format)
+                else:
+                    dates = self.parse_dates(column)
+        except ValueError:
+            dates = column
+        if not is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(column, errors='coerce', format=date_format or 'mixed', utc=True)
+
+        invalid = int(dates.isna().sum() - column.isna().sum())
+        if invalid:
+            self.log.logger.warning(f'{invalid} values of the datetime column "{column.name}" could not be parsed')
+
+        if timezone:
+            if dates.dt.tz is None:
+                dates = dates.dt.tz_localize(timezone, ambiguous='NaT', nonexistent='NaT')
+            else:
+                dates = dates.dt.tz_convert(timezone)
+        return dates
+
+    def parse_decimal(self, column, scale):
+        """
+        Vectorized parsing of a decimal column into integers scaled by 10^scale (nullable Int64), so the values
+        are compared exactly. The texts are parsed from their digits, the numbers loaded as floats are rounded
+        to the scale. More decimals than the scale are rounded half away from zero, the values which cannot be
+        parsed or have more than 18 digits are missing values, both numbers are logged.
+        """
+        values = np.zeros(len(column), dtype='int64')
+        valid = np.zeros(len(column), dtype=bool)
+        rounded = 0
+        if is_numeric_dtype(column):
+            numbers = column.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            present = column.notna().to_numpy()
+            text = column.astype(str).str.strip()
+            parts = text.str.extract(r'^([+-]?)(\d*)(?:\.(\d*))?$')
+            integer = parts[1].fillna('')
+            fraction = parts[2].fillna('')
+            matched = present & parts[1].notna().to_numpy() & (integer.str.len() + fraction.str.len() > 0).to_numpy()
+            digits = (integer + fraction.str[:scale].str.ljust(scale, '0')).str.lstrip('0').replace('', '0')
+            matched &= (digits.str.len() <= 18).to_numpy()
+            values[matched] = digits[matched].to_numpy().astype('int64')
+            # Half away from zero, the sign is applied to the rounded magnitude
+            round_up = (fraction.str[scale:scale + 1] >= '5').to_numpy() & matched
+            values += round_up
+            values = np.where((parts[0] == '-').to_numpy(), -values, values)
+            valid |= matched
+            rounded += int(((fraction.str.len() > scale).to_numpy() & matched).sum())
+            # Other numbers, e.g. with an exponent
+            numbers = pd.to_numeric(text.where(present & ~matched), errors='coerce').to_numpy(dtype='float64',
+                                                                                            na_value=np.nan)
+        scaled = numbers * 10 ** scale
+        numeric = np.isfinite(scaled) & (np.abs(scaled) < 1e18)
+        values[numeric] = np.round(scaled[numeric]).astype('int64')
+        rounded += int((numeric & (np.round(scaled, 6) != np.round(scaled))).sum())
+        valid |= numeric
+
+        invalid = int(valid.size - valid.sum() - column.isna().sum())
+        if invalid:
+            self.log.logger.warning(f'{invalid} values of the decimal column "{column.name}" could not be parsed')
+        if rounded:
+            self.log.logger.warning(f'{rounded} values of the decimal column "{column.name}" have more than '
+                                    f'{scale} decimals and were rounded')
+        return pd.Series(pd.arrays.IntegerArray(values, ~valid), index=column.index, name=column.name)
+
+    @staticmethod
+    def normalize_column(column, normalization):
+        """
+        Vectorized normalization of one column, only the text values are changed
+        (the string methods return NaN for other values, these are kept as they are)
+        """
+        if not (is_object_dtype(column) or is_string_dtype(column)):
+            return column
+
+        def text_operation(values, operation):
+            result = operation(values.str)
+            return result.where(result.notna(), values)
+
+        rules = normalization.get('rules', [])
+        if 'regex_replace' in normalization:
+            pattern, replacement = normalization['regex_replace']
+            column = text_operation(column, lambda text: text.replace(pattern, replacement, regex=True))
+        if 'trim' in rules:
+            column = text_operation(column, lambda text: text.strip())
+        if 'casefold' in rules:
+            column = text_operation(column, lambda text: text.casefold())
+
+        if 'null_values' in normalization:
+            null_values = pd.Series(normalization['null_values'], dtype=object)
+            if 'trim' in rules:
+                null_values = null_values.str.strip()
+            if 'casefold' in rules:
+                null_values = null_values.str.casefold()
+            column = column.mask(column.isin(null_values))
+
+        if 'numeric' in rules:
+            numbers = column
+            if 'thousands' in normalization:
+                numbers = text_operation(numbers, lambda text: text.replace(normalization['thousands'], '',
+                                                                             regex=False))
+            numbers = pd.to_numeric(numbers, errors='coerce')
+            not_numbers = numbers.isna() & column.notna()
+            if not_numbers.any():
+                column = numbers.astype(object).where(~not_numbers, column)
+            else:
+                column = numbers
+        return column
 
     def get_comparison(self):
         return self
+
+
+class Baseline:
+    """
+    Left report of a fan-out comparison, loaded and prepared once by the comparison with the first
+    candidate and shared by the comparisons with the other candidates. The index of its reference
+    keys is built on the first use.
+    """
+
+    def __init__(self, comparison):
+        self.df_left = comparison.df_left
+        self.add_header = comparison.add_header
+        self.keys = None
+        self.lock = threading.Lock()
+
+    def get_keys(self, backend, references):
+        with self.lock:
+            if self.keys is None:
+                self.keys = {'index': backend.index_keys(self.df_left, references)}
+            return self.keys['index']
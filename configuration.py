@@ -1,10 +1,19 @@
 import os
 import re
 import xml.etree.ElementTree as ET
+from copy import deepcopy
 
 true_values = [True, 'True', 'true', 'Y', 'y', '1']
 false_values = [False, 'False', 'false', 'F', 'f', '0']
 none_values = [None, 'None', 'none', 'NAN', 'NaN', 'nan']
+normalization_rules = ['trim', 'casefold', 'numeric']
+column_types = ['datetime', 'decimal']
+# Maximal scale of the decimal columns, the scaled values are int64
+max_decimal_scale = 18
+# Units of the tolerance of datetime columns, in seconds
+time_units = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9}
+# Elements of the configuration resolved to comparisons
+comparison_tags = ['comparison', 'comparison_set']
 
 
 class Configuration:
@@ -20,14 +29,18 @@ class Configuration:
                      'right': {'mandatory': 'True'},
                      'separator': {},
                      'header': {'default': 'infer'},
-                     'file_type': {'default': 'csv', 'options': ['csv', 'xls', 'db']},
+                     'file_type': {'default': 'csv', 'options': ['csv', 'xls', 'db', 'fixed_width']},
                      'header_names': {'to_list': True},
+                     'sheet': {'default': '0'},
+                     'usecols': {},
                      'columns': {'mandatory': 'True'},
                      'remove_begin': {},
                      'remove_end': {},
                      'replace': {},
                      'ignore_rows': {'to_list': True, 'cast': int},
-                     'count_difference': {}}
+                     'count_difference': {},
+                     'backend': {'default': 'pandas', 'options': ['pandas', 'polars']},
+                     'keys_only': {'default': 'false'}}
         self.comparison_config, self.defaults = self.read_configuration(xml_comparison, xml_defaults)
         if self.comparison_config['enabled'] in true_values:
             self.process_comparison()
@@ -47,8 +60,10 @@ class Configuration:
         if xml_comparison.find('enabled').text in true_values:
             config.update({'enabled': True})
             config.update({'file_name': xml_comparison.get('file_name')})
+            config.update({'fan_out': xml_comparison.get('fan_out')})
             for tag in self.tags:
                 config.update({tag: self.get_tag_content(xml_comparison, tag)})
+            config.update({'gate': self.get_gate(xml_comparison.find('gate'), xml_defaults[0].find('gate'))})
         elif xml_comparison.find('enabled').text in false_values:
             config.update({'enabled': False})
         else:
@@ -91,7 +106,27 @@ class Configuration:
                 <column name="5" tolerance="1.0" tolerance_mode="Rel" />
                 <column name="é" drop_duplicates="True" />
                 <column name="7" ignore="True" />
+                <column name="8" offset="40" width="12" />
+                <column name="9" normalize="trim;casefold" null_values="NULL;-" />
+                <column name="10" normalize="numeric" thousands="," regex_replace="^\$" />
+                <column name="11" type="datetime" format="%d.%m.%Y %H:%M" timezone="Europe/Prague"
+                        tolerance="500" tolerance_unit="ms" />
+                <column name="12" type="decimal(2)" tolerance="0.01" />
             </columns>
+
+        Normalization rules (applied to the loaded reports, in this order):
+            regex_replace - replaces the matches of the pattern with "regex_replacement" (default: empty)
+            trim          - strips the leading and trailing white spaces
+            casefold      - case insensitive values
+            null_values   - ";" separated aliases of a missing value
+            numeric       - numbers as floats, "thousands" separators are removed, other values are kept
+
+        Column types (parsed once the reports are loaded and normalized):
+            datetime      - "format" (strftime codes, ISO 8601 or any other format if not given) and "timezone"
+                            of the values without an offset, the tolerance is absolute, in seconds
+                            or in the "tolerance_unit" (s, ms, us, ns)
+            decimal(n)    - fixed-point numbers with n decimals, compared exactly as integers scaled by 10^n,
+                            the tolerances are checked in integer arithmetic
         """
 
         names = []
@@ -100,6 +135,9 @@ class Configuration:
         ignores = []
         drops = []
         count_diffs = []
+        widths = {}
+        normalizations = {}
+        types = {}
 
         for column in config_section['columns'].findall('column'):
             # Get name of column
@@ -161,7 +199,152 @@ class Configuration:
                 if count_diff in true_values:
                     count_diffs.append(name)
 
-        return [references, ignores, tolerances, drops, count_diffs]
+            # Check for "offset" and "width" attributes of fixed width files
+            offset = column.get('offset')
+            width = column.get('width')
+            if width is not None:
+                try:
+                    widths.update({name: (int(offset) if offset is not None else None, int(width))})
+                except ValueError:
+                    self.log.logger.info(f'Todo, the offset and width attributes must have an integer value!')
+                    raise ValueError(f'Todo, the offset and width attributes must have an integer value!')
+
+            # Check for the "type" attribute
+            column_type = self.get_column_type(column)
+            if column_type:
+                types.update({name: column_type})
+                if str(name) in tolerances and column_type['type'] == 'datetime':
+                    tolerances[str(name)] = self.get_time_tolerance(column, tolerances[str(name)])
+
+            # Check for the normalization attributes
+            normalization = self.get_normalization(column)
+            if normalization:
+                normalizations.update({name: normalization})
+
+        if config_section['file_type'] == 'fixed_width':
+            # Columns without an offset follow the previous column
+            position = 0
+            for name in names:
+                if name not in widths:
+                    self.log.logger.info(f'Todo, the column "{name}" of a fixed width file has no width!')
+                    raise ValueError(f'Todo, the column "{name}" of a fixed width file has no width!')
+                if widths[name][0] is None:
+                    widths[name] = (position, widths[name][1])
+                position = widths[name][0] + widths[name][1]
+
+        return [references, ignores, tolerances, drops, count_diffs, widths, normalizations, types]
+
+    def get_column_type(self, column):
+        """
+        The type of a column and its parameters, None for the columns compared as loaded
+        """
+        column_type = column.get('type')
+        if column_type is None:
+            return None
+        decimal = re.fullmatch(r'decimal\s*\(\s*(\d+)\s*\)', column_type.strip().lower())
+        if decimal:
+            scale = int(decimal.group(1))
+            if scale > max_decimal_scale:
+                self.log.logger.info(f'Todo, the scale of a decimal column must be at most {max_decimal_scale}!')
+                raise ValueError(f'Todo, the scale of a decimal column must be at most {max_decimal_scale}!')
+            return {'type': 'decimal', 'scale': scale, 'format': None, 'timezone': None}
+        if column_type.lower() == 'decimal':
+            self.log.logger.info(f'Todo, the scale of a decimal column is missing, e.g. "decimal(2)"!')
+            raise ValueError(f'Todo, the scale of a decimal column is missing, e.g. "decimal(2)"!')
+        if column_type.lower() not in column_types:
+            self.log.logger.info(f'Todo, unknown column type "{column_type}", the options are: {column_types}')
+            raise ValueError(f'Todo, unknown column type "{column_type}", the options are: {column_types}')
+        return {'type': column_type.lower(), 'format': column.get('format'), 'timezone': column.get('timezone')}
+
+    def get_time_tolerance(self, column, tolerance):
+        """
+        The tolerance of a datetime column in seconds
+        """
+        if tolerance['tolerance_mode'].lower() != 'abs':
+            self.log.logger.info(f'Todo, the tolerance of a datetime column must be absolute!')
+            raise ValueError(f'Todo, the tolerance of a datetime column must be absolute!')
+        unit = column.get('tolerance_unit', 's').lower()
+        if unit not in time_units:
+            self.log.logger.info(f'Todo, unknown tolerance_unit "{unit}", the options are: {list(time_units)}')
+            raise ValueError(f'Todo, unknown tolerance_unit "{unit}", the options are: {list(time_units)}')
+        return {'tolerance': tolerance['tolerance'] * time_units[unit], 'tolerance_mode': tolerance['tolerance_mode']}
+
+    def get_normalization(self, column):
+        """
+        Collects the normalization rules of a column, returns an empty dict if there are none
+        """
+        normalization = {}
+        rules = column.get('normalize')
+        if rules is not None:
+            rules = [rule.strip().lower() for rule in rules.split(';') if rule.strip()]
+            for rule in rules:
+                if rule not in normalization_rules:
+                    self.log.logger.info(f'Todo, unknown normalization rule "{rule}", the options are: '
+                                         f'{normalization_rules}')
+                    raise ValueError(f'Todo, unknown normalization rule "{rule}", the options are: '
+                                     f'{normalization_rules}')
+            normalization.update({'rules': rules})
+
+        null_values = column.get('null_values')
+        if null_values is not None:
+            normalization.update({'null_values': null_values.split(';')})
+
+        regex_replace = column.get('regex_replace')
+        if regex_replace is not None:
+            try:
+                re.compile(regex_replace)
+            except re.error as error:
+                self.log.logger.info(f'Todo, the regex_replace attribute is not a valid pattern: {error}')
+                raise ValueError(f'Todo, the regex_replace attribute is not a valid pattern: {error}')
+            normalization.update({'regex_replace': (regex_replace, column.get('regex_replacement', ''))})
+
+        thousands = column.get('thousands')
+        if thousands is not None:
+            normalization.update({'thousands': thousands})
+        return normalization
+
+    def get_gate(self, xml_gate, xml_default_gate):
+        """
+        Thresholds of the gate mode, the "gate" of a comparison overrides the "gate" of the defaults
+
+        example:
+            <gate max_differences="0" max_unmatched="1%" shards="16" report="false" />
+
+        The thresholds are numbers of lines or percentages of the merged lines, the comparison
+        stops as soon as one is exceeded. The detailed report is created only with report="true".
+        """
+        if xml_gate is None and xml_default_gate is None:
+            return None
+        attributes = {}
+        for xml_element in [xml_default_gate, xml_gate]:
+            if xml_element is not None:
+                attributes.update(xml_element.attrib)
+        if attributes.get('enabled', 'true') in false_values:
+            return None
+
+        gate = {'report': attributes.get('report', 'false') in true_values}
+        try:
+            gate.update({'shards': int(attributes.get('shards', 16))})
+        except ValueError:
+            self.log.logger.info(f'Todo, the shards attribute of the gate must have an integer value!')
+            raise ValueError(f'Todo, the shards attribute of the gate must have an integer value!')
+
+        for threshold in ['max_differences', 'max_unmatched']:
+            value = attributes.get(threshold)
+            if value is None:
+                gate.update({threshold: None})
+                continue
+            try:
+                gate.update({threshold: {'value': float(value.strip().rstrip('%')),
+                                         'percent': value.strip().endswith('%')}})
+            except ValueError:
+                self.log.logger.info(f'Todo, the {threshold} attribute of the gate must be a number or a percentage!')
+                raise ValueError(f'Todo, the {threshold} attribute of the gate must be a number or a percentage!')
+
+        if gate['max_differences'] is None and gate['max_unmatched'] is None:
+            self.log.logger.info(f'Todo, the gate needs the max_differences or max_unmatched attribute!')
+            raise ValueError(f'Todo, the gate needs the max_differences or max_unmatched attribute!')
+        return gate
 
     def check_value(self, config, key):
         value = config[key]
@@ -199,17 +382,29 @@ class Configuration:
         todo
         """
         self.comparison_config['file_type'] = self.check_value(self.comparison_config, 'file_type')
+        self.comparison_config['backend'] = self.check_value(self.comparison_config, 'backend')
+        # Only the reference columns are loaded and reconciled, see Comparison.reconcile_keys
+        self.comparison_config['keys_only'] = self.check_value(self.comparison_config, 'keys_only') in true_values
 
         self.comparison_config['header'] = self.check_value(self.comparison_config, 'header')
         if self.comparison_config['header'] in false_values or self.comparison_config['header'] in none_values:
             self.comparison_config['header'] = None
 
-        ref, ignore, tol, drops, c_diffs = self.process_column_tags(self.comparison_config)
+        ref, ignore, tol, drops, c_diffs, widths, normalizations, types = \
+            self.process_column_tags(self.comparison_config)
         self.comparison_config.update(
             {'references': ref, 'ignore_columns': ignore, 'tolerances': tol, 'drop_duplicates': drops,
-             'count_diffs': c_diffs})
+             'count_diffs': c_diffs, 'column_widths': widths, 'normalizations': normalizations,
+             'column_types': types})
         self.comparison_config['ignore_rows'] = self.check_value(self.comparison_config, 'ignore_rows')
         self.comparison_config['header_names'] = self.check_value(self.comparison_config, 'header_names')
+
+        # Excel sheet is given by its position or name, usecols by Excel letters ("A:D,F") or names ("A;B;C")
+        self.comparison_config['sheet'] = self.check_value(self.comparison_config, 'sheet')
+        if self.comparison_config['sheet'].isdigit():
+            self.comparison_config['sheet'] = int(self.comparison_config['sheet'])
+        if self.comparison_config['usecols'] and ';' in self.comparison_config['usecols']:
+            self.comparison_config['usecols'] = self.comparison_config['usecols'].split(';')
         del self.comparison_config['columns']
 
     @staticmethod
@@ -294,11 +489,176 @@ class Configuration:
         pass
 
     @classmethod
-    def get_xml_comparisons(cls, config_file):
-        root = cls.create_root(config_file)
-        return {'comparisons': root.findall('comparison'),
-                'output': root.find('output').text,
-                'defaults': root.findall('defaults')}
+    def get_xml_comparisons(cls, config_file, lazy=False):
+        """
+        Reads the configuration file, with "lazy" the comparisons are a generator parsing
+        the file incrementally (see iter_xml_comparisons)
+        """
+        if lazy:
+            return cls.iter_xml_comparisons(config_file)
+        return cls.get_root_comparisons(cls.create_root(config_file))
+
+    @classmethod
+    def iter_xml_comparisons(cls, config_file):
+        """
+        Parses the configuration with iterparse: the output, defaults and store (which precede the
+        comparisons) are read at once, the comparisons are yielded one by one as they are parsed and
+        resolved, so the first comparison can start before the whole file is read
+        """
+        if not os.path.isfile(config_file):
+            raise FileNotFoundError(
+                f'Configuration file: {os.path.abspath(config_file)} was not found!')
+        events = ET.iterparse(config_file, events=('start', 'end'))
+        _, root = next(events)
+        depth = 1
+        for event, element in events:
+            depth += 1 if event == 'start' else -1
+            if event == 'start' and depth == 2 and element.tag in comparison_tags:
+                break
+        if root.find('output') is None:
+            raise ValueError(f'Todo, the output of the configuration has to precede the comparisons: {config_file}')
+        output = root.find('output').text
+
+        def iter_comparisons(depth):
+            for event, element in events:
+                depth += 1 if event == 'start' else -1
+                # A child of the root was parsed completely
+                if event == 'end' and depth == 1:
+                    if element.tag in comparison_tags:
+                        yield from cls.resolve_comparisons(element)
+                        root.remove(element)
+
+        # The element whose start ended the header is parsed by the generator
+        return {'comparisons': iter_comparisons(depth),
+                'output': output,
+                'defaults': root.findall('defaults'),
+                'store': Configuration.get_store_path(root.find('store'), output)}
+
+    @classmethod
+    def resolve_comparisons(cls, xml_element):
+        if xml_element.tag == 'comparison_set':
+            return cls.expand_comparison_set(xml_element)
+        if len(xml_element.findall('right')) > 1:
+            return cls.expand_fan_out(xml_element)
+        return [xml_element]
+
+    @staticmethod
+    def expand_fan_out(xml_comparison):
+        """
+        Resolves a fan-out comparison (one left baseline and many right candidates) to a comparison
+        for each candidate, "<file_name>_<name of the right element or its number>". The comparisons
+        keep the "fan_out" attribute with the file name of the group and are processed together,
+        the baseline is loaded and indexed only once.
+        """
+        group = xml_comparison.get('file_name')
+        comparisons = []
+        for i, xml_right in enumerate(xml_comparison.findall('right')):
+            candidate = xml_right.get('name', str(i + 1))
+            xml_candidate = ET.Element('comparison', dict(xml_comparison.attrib))
+            xml_candidate.set('file_name', f'{group}_{candidate}')
+            xml_candidate.set('fan_out', group)
+            for xml_child in xml_comparison:
+                if xml_child.tag != 'right' or xml_child is xml_right:
+                    xml_candidate.append(deepcopy(xml_child))
+            comparisons.append(xml_candidate)
+        return comparisons
+
+    @classmethod
+    def expand_comparison_set(cls, xml_set):
+        """
+        Resolves a comparison set to a comparison for each pair of files. The "left" and "right" paths
+        are patterns, glob by default (each wildcard is a captured group) or regular expressions with
+        match="regex" (matched against the file names in the "folder" attribute). The files are paired
+        by the values of the captured groups, a file without a pair gets the pattern as the missing
+        path so the comparison fails visibly. All other elements (columns, tolerances...) are shared,
+        the "file_name" is a template formatted with the groups ({1}, {2}... or the group names).
+        """
+        match = xml_set.get('match', 'glob')
+        template = xml_set.get('file_name', 'comparison')
+        if match not in ['glob', 'regex']:
+            raise ValueError(f'Todo, unknown match "{match}" of comparison_set {template}, glob or regex expected')
+        files = {}
+        for tag in ['left', 'right']:
+            xml_path = xml_set.find(tag)
+            if xml_path is None or not xml_path.text:
+                raise ValueError(f'Todo, comparison_set {template} requires the <{tag}> pattern')
+            files[tag] = cls.find_files(xml_path.text.strip(), match, xml_path.get('folder'))
+
+        comparisons = []
+        for key in sorted(set(files['left']) | set(files['right'])):
+            groups, named_groups = key[0], dict(key[1])
+            if '{' in template:
+                file_name = template.format('', *groups, **named_groups)
+            else:
+                file_name = '_'.join([template] + list(groups))
+            xml_comparison = ET.Element('comparison', {key: value for key, value in xml_set.attrib.items()
+                                                       if key != 'match'})
+            xml_comparison.set('file_name', file_name)
+            for xml_child in xml_set:
+                if xml_child.tag in ['left', 'right']:
+                    path = files[xml_child.tag].get(key, xml_child.text.strip())
+                    ET.SubElement(xml_comparison, xml_child.tag).text = path
+                else:
+                    xml_comparison.append(deepcopy(xml_child))
+            comparisons.append(xml_comparison)
+        return comparisons
+
+    @staticmethod
+    def find_files(pattern, match, folder=None):
+        """
+        Files matching the pattern, as a dict {(groups, named groups): path}
+        """
+        if match == 'glob':
+            folder = os.path.dirname(pattern) if folder is None else folder
+            regex = re.compile(''.join('([^\\\\/]*)' if character == '*' else '([^\\\\/])' if character == '?'
+                                       else re.escape(character) for character in pattern))
+        else:
+            regex = re.compile(pattern)
+        files = {}
+        listed_folder = folder or '.'
+        if not os.path.isdir(listed_folder):
+            return files
+        for name in sorted(os.listdir(listed_folder)):
+            path = os.path.join(folder, name) if folder else name
+            found = regex.fullmatch(path if match == 'glob' else name)
+            if found and os.path.isfile(path):
+                files[(found.groups(), tuple(sorted(found.groupdict().items())))] = path
+        return files
+
+    @classmethod
+    def get_xml_comparisons_from_string(cls, xml_text, base_config=None):
+        """
+        Reads a configuration given as a xml string. It is either a whole "Config"
+        or a single "comparison", the output and defaults of a single comparison
+        are taken from the base configuration
+        """
+        root = ET.fromstring(xml_text)
+        if root.tag == 'comparison':
+            if base_config is None:
+                raise ValueError(f'A single comparison requires a base configuration with output and defaults!')
+            return {'comparisons': [root], 'output': base_config['output'], 'defaults': base_config['defaults']}
+        return cls.get_root_comparisons(root)
+
+    @staticmethod
+    def get_root_comparisons(root):
+        output = root.find('output').text
+        return {'comparisons': [xml_comparison for xml_element in root if xml_element.tag in comparison_tags
+                                for xml_comparison in Configuration.resolve_comparisons(xml_element)],
+                'output': output,
+                'defaults': root.findall('defaults'),
+                'store': Configuration.get_store_path(root.find('store'), output)}
+
+    @staticmethod
+    def get_store_path(xml_store, output):
+        """
+        Path of the results store, "results.sqlite" in the output folder by default,
+        <store>false</store> disables it
+        """
+        if xml_store is None or not xml_store.text:
+            return output + '\\' + 'results.sqlite'
+        if xml_store.text in false_values or xml_store.text in none_values:
+            return None
+        return xml_store.text
 
     @classmethod
     def create_root(cls, config_file):
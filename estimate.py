@@ -0,0 +1,81 @@
+import os
+import math
+from copy import deepcopy
+
+# Normal quantile of the 95% confidence intervals
+z_95 = 1.96
+
+
+def estimate_count(count, fraction):
+    """
+    Extrapolates a count of the sample to all lines with its 95% confidence interval. Each key is
+    in the sample with the probability "fraction", so the count of the sample is binomial. Without
+    any occurrence in the sample the upper bound is given by the "rule of three".
+    """
+    estimate = count / fraction
+    if count == 0:
+        return {'estimate': 0, 'low': 0, 'high': round(3 / fraction) if fraction < 1 else 0}
+    half_width = z_95 * math.sqrt(count * (1 - fraction)) / fraction
+    return {'estimate': round(estimate), 'low': max(round(estimate - half_width), count),
+            'high': round(estimate + half_width)}
+
+
+def get_estimate(comparison, report_path, report_time):
+    """
+    Estimate of the full comparison from the comparison of the sample and its report
+        merge_match, diffs_counter - extrapolated counts
+        differences                - lines of the detailed report
+        report_bytes               - size of the detailed report
+        run_time                   - loading (measured on all lines) and the extrapolated rest
+    """
+    fraction = comparison.sample_fraction or 1.0
+    summary = comparison.summary
+    differences = estimate_count(len(comparison.df_compare), fraction)
+
+    report_bytes = os.path.getsize(report_path) if os.path.isfile(report_path) else 0
+    per_line = report_time / len(comparison.df_compare) if len(comparison.df_compare) else 0.0
+    bytes_per_line = report_bytes / len(comparison.df_compare) if len(comparison.df_compare) else 0.0
+    compare_time = comparison.timings['compare'] / fraction
+    run_time = {bound: round(comparison.timings['load'] + compare_time + differences[bound] * per_line, 2)
+                for bound in ['estimate', 'low', 'high']}
+
+    return {'fraction': fraction,
+            'sample_lines': {'left': len(comparison.df_left), 'right': len(comparison.df_right)},
+            'merge_match': {key: estimate_count(int(value), fraction) for key, value in summary['merge_match'].items()},
+            'diffs_counter': {column: {key: estimate_count(value, fraction) for key, value in counter.items()}
+                              for column, counter in summary['diffs_counter'].items()},
+            'differences': differences,
+            'report_bytes': {bound: round(report_bytes + (value - len(comparison.df_compare)) * bytes_per_line)
+                             for bound, value in differences.items()},
+            'run_time': run_time}
+
+
+def get_estimated_summary(summary):
+    """
+    Summary with the extrapolated values, for the summary workbook of the estimate
+    """
+    estimate = summary['estimate']
+    estimated = deepcopy(summary)
+    estimated['merge_match'] = {key: value['estimate'] for key, value in estimate['merge_match'].items()}
+    estimated['diffs_counter'] = {column: {key: value['estimate'] for key, value in counter.items()}
+                                  for column, counter in estimate['diffs_counter'].items()}
+    estimated['lines']['merged'] = sum(estimated['merge_match'].values())
+    estimated['total_time'] = estimate['run_time']['estimate']
+    estimated['note'] = '; '.join([f'Estimate from a {estimate["fraction"]:.2%} sample'] + describe(estimate))
+    return estimated
+
+
+def describe(estimate):
+    """
+    The estimated values with their 95% confidence intervals, as text
+    """
+    lines = [f'{name} {value["estimate"]} ({value["low"]} - {value["high"]})'
+             for name, value in [('match', estimate['merge_match']['match_both']),
+                                 ('unmatched left', estimate['merge_match']['unmatched_left']),
+                                 ('unmatched right', estimate['merge_match']['unmatched_right']),
+                                 ('report lines', estimate['differences'])]]
+    lines.append(f'report {estimate["report_bytes"]["estimate"] / 1024:0.0f} KiB '
+                 f'({estimate["report_bytes"]["low"] / 1024:0.0f} - {estimate["report_bytes"]["high"] / 1024:0.0f})')
+    lines.append(f'run time {estimate["run_time"]["estimate"]:0.1f}s '
+                 f'({estimate["run_time"]["low"]:0.1f} - {estimate["run_time"]["high"]:0.1f})')
+    return lines
@@ -1,5 +1,7 @@
 import pandas as pd
 import numpy as np
+from decimal import Decimal
+from datetime import datetime
 from xlsxwriter import Workbook
 from fastnumbers import query_type
 from pandas.api.types import is_numeric_dtype
@@ -88,9 +90,12 @@ class ExportResults:
         """
         todo
         """
+        if comparison.configuration['keys_only']:
+            return self.create_keys_report(comparison, limit=limit)
 
         row = 0
         add_differences = comparison.configuration['count_diffs']
+        scales = comparison.get_scales()
         results_sheet = self.workbook.add_worksheet("Detailed Comparison")
 
         if comparison.df_merge.empty:
@@ -108,7 +113,9 @@ class ExportResults:
         # Add the rows with differences
         for diff in comparison.df_compare.index.tolist():
             cell = 0
-            for pair in comparison.x_columns:
+            for column, pair in zip(comparison.columns, comparison.x_columns):
+                # Decimal columns are integers scaled by 10^scale
+                scale = scales.get(str(column))
                 if comparison.df_merge.iloc[diff, -1] == 'both':
                     left_value = self.check_for_number(comparison.df_merge.iloc[diff, pair[0]])
                     right_value = self.check_for_number(comparison.df_merge.iloc[diff, pair[1]])
@@ -122,6 +129,25 @@ class ExportResults:
                 if type(left_value) == str and type(right_value) == str:
                     if left_value == right_value:
                         match = True
+                elif scale is not None and is_numeric_dtype(left_value) and is_numeric_dtype(right_value):
+                    # Exact check in integers, like the backends do
+                    if str(column) in comparison.configuration['tolerances']:
+                        tolerance, mode = comparison.backend.get_tolerance(comparison.configuration['tolerances'],
+                                                                           str(column))
+                        match = comparison.backend.decimal_in_tolerance(left_value, right_value, tolerance, mode,
+                                                                        scale)
+                    else:
+                        match = left_value == right_value
+                elif isinstance(left_value, pd.Timestamp) and isinstance(right_value, pd.Timestamp):
+                    # Datetime columns, the tolerance is absolute in seconds
+                    tolerance_config = comparison.configuration['tolerances']
+                    tolerance_name = str(comparison.df_merge.columns[pair[0]])
+                    if tolerance_name.endswith('_x') or tolerance_name.endswith('_y'):
+                        tolerance_name = tolerance_name[:-2]
+                    tolerance_value = tolerance_config[tolerance_name]['tolerance'] \
+                        if tolerance_config.get(tolerance_name) else 0.0
+                    if abs(left_value.value - right_value.value) <= round(tolerance_value * 1e9):
+                        match = True
                 elif is_numeric_dtype(left_value) and is_numeric_dtype(right_value):
                     if str(comparison.df_merge.columns[pair[0]]).endswith('_x') \
                             or \
@@ -151,16 +177,21 @@ class ExportResults:
                             match = True
 
                 if match:
-                    results_sheet.write(row, cell, left_value)
-                    results_sheet.write(row, cell + 1, right_value, self.format_second_cell)
+                    results_sheet.write(row, cell, self.to_cell(left_value, scale))
+                    results_sheet.write(row, cell + 1, self.to_cell(right_value, scale), self.format_second_cell)
                 else:
-                    results_sheet.write(row, cell, left_value, self.format_fail)
-                    results_sheet.write(row, cell + 1, right_value, self.format_fail_second_cell)
+                    results_sheet.write(row, cell, self.to_cell(left_value, scale), self.format_fail)
+                    results_sheet.write(row, cell + 1, self.to_cell(right_value, scale), self.format_fail_second_cell)
                 cell += 2
                 # Count difference if configured
                 if comparison.columns[pair[0]] in add_differences:
-                    if is_numeric_dtype(left_value) and is_numeric_dtype(right_value):
-                        results_sheet.write(row, cell, abs(left_value - right_value), self.format_second_cell)
+                    if isinstance(left_value, pd.Timestamp) and isinstance(right_value, pd.Timestamp):
+                        # Difference of datetimes in seconds
+                        results_sheet.write(row, cell, abs(left_value.value - right_value.value) / 1e9,
+                                            self.format_second_cell)
+                    elif is_numeric_dtype(left_value) and is_numeric_dtype(right_value):
+                        results_sheet.write(row, cell, self.to_cell(abs(left_value - right_value), scale),
+                                            self.format_second_cell)
                     else:
                         results_sheet.write(row, cell, 0, self.format_second_cell)
                     cell += 1
@@ -171,11 +202,11 @@ class ExportResults:
             row += 1
 
             #  Checking that the limit been reached
-            if limit:
-                if row >= limit:
-                    results_sheet.write(row, 0,
-                                        f'A limit on the number of results ({limit} comparisons) was used!',
-                                        self.format_red_text)
+            if limit and limit < row <= len(comparison.df_compare):
+                results_sheet.write(row, 0,
+                                    f'A limit on the number of results ({limit} comparisons) was used!',
+                                    self.format_red_text)
+                row += 1
                 results_sheet.write(row, 0,
                                     f'Differences were found on '
                                     f'{len(comparison.df_compare.index.tolist())} lines of total '
@@ -190,6 +221,42 @@ class ExportResults:
         # Set autofilters  for each columns + indicator column
         results_sheet.autofilter(f'A1:{self.excel_column_name(len(columns_widths) + 1)}1')
 
+        # Deviation statistics of the columns with differences
+        if comparison.summary.get('deviations'):
+            deviations_sheet = self.workbook.add_worksheet('Deviations')
+            self.add_column_names(deviations_sheet, comparison.summary['diff_column_names'], first_cell_empty=False,
+                                  first_cell='Column')
+            self.add_deviations(deviations_sheet, comparison.summary['diff_column_names'],
+                                comparison.summary['deviations'])
+            deviations_sheet.freeze_panes(1, 1)
+
+    def create_keys_report(self, comparison, limit=None):
+        """
+        Report of a keys-only comparison, the unmatched keys and the side where they were found
+        """
+        sheet = self.workbook.add_worksheet('Unmatched Keys')
+        references = comparison.configuration['references']
+        scales = comparison.get_scales()
+        header = [str(reference) for reference in references] + ['Indicator']
+        for cell, name in enumerate(header):
+            sheet.write(0, cell, name, self.format_header)
+            sheet.set_column(cell, cell, len(name) + 5)  # (+ 5) for space for autofilter
+        sheet.freeze_panes(1, 0)
+        sheet.autofilter(0, 0, 0, len(header) - 1)
+
+        df_unmatched = comparison.df_merge
+        if df_unmatched.empty:
+            sheet.write(1, 0, 'All keys were matched', self.format_green_text)
+            return
+        for row, values in enumerate(df_unmatched.iloc[:limit].itertuples(index=False), start=1):
+            for cell, value in enumerate(values):
+                scale = scales.get(header[cell]) if cell < len(references) else None
+                sheet.write(row, cell, self.to_cell(self.check_for_number(value), scale))
+        if limit and len(df_unmatched) > limit:
+            sheet.write(limit + 1, 0, f'A limit on the number of results ({limit} unmatched keys) was used!',
+                        self.format_red_text)
+            sheet.write(limit + 2, 0, f'{len(df_unmatched)} lines were not matched', self.format_red_text)
+
     def add_column_names(self, sheet, header, first_cell_empty=True, first_cell=''):
         """
             Adds column names to the first column, each column name to a new row
@@ -262,6 +329,48 @@ class ExportResults:
                 row += 1
         sheet.freeze_panes(1, 0)
 
+    def add_deviations(self, sheet, column_names, deviations, first_cell=1):
+        """
+        Adds the deviation statistics of the columns (see Comparison.get_deviation_statistics),
+        one row for each column name of the first column
+        """
+        statistics = ['min', 'mean', 'max', 'p50', 'p90', 'p99']
+        histogram = next(iter(deviations.values()))['histogram'] if deviations else []
+        bins = [f'[{edge:g}, {next_edge[0]:g})' if next_edge else f'>= {edge:g}'
+                for (edge, _), next_edge in zip(histogram, histogram[1:] + [None])]
+        header = ['Deviations'] + [f'{kind} {statistic}' for kind in ['Abs', 'Rel'] for statistic in statistics] + bins
+        for i, name in enumerate(header):
+            sheet.write(0, first_cell + i, name, self.format_header)
+            sheet.set_column(first_cell + i, first_cell + i, self.limit(len(name) + 4, minimum=10))
+        sheet.write_comment(0, first_cell, 'Numeric differences (datetimes in seconds) of the column, '
+                                           'with their absolute and relative deviations and the histogram '
+                                           'of the absolute deviations')
+        for row, column in enumerate(column_names, start=1):
+            deviation = deviations.get(column)
+            if not deviation:
+                continue
+            cell = first_cell
+            sheet.write(row, cell, deviation['count'])
+            cell += 1
+            for kind, cell_format in [('absolute', None), ('relative', self.format_percentage)]:
+                for statistic in statistics:
+                    if deviation[kind]:
+                        sheet.write(row, cell, deviation[kind][statistic], cell_format)
+                    cell += 1
+            for _, count in deviation['histogram']:
+                sheet.write(row, cell, count)
+                cell += 1
+
+    @staticmethod
+    def get_largest_deviation(deviations):
+        """
+        The column with the largest absolute deviation, as text for the summary
+        """
+        if not deviations:
+            return None
+        column, deviation = max(deviations.items(), key=lambda item: item[1]['absolute']['max'])
+        return f'{column}: {deviation["absolute"]["max"]:g} (p99 {deviation["absolute"]["p99"]:g})'
+
     def create_summary(self, summary_dict):
         """
         TODO
@@ -288,7 +397,12 @@ class ExportResults:
             {'column_name': 'Note', 'width': 64},
             {'column_name': 'Comparison file link'},
             {'column_name': 'Path left'},
-            {'column_name': 'Path right'}
+            {'column_name': 'Path right'},
+            {'column_name': 'Hot functions', 'width': 64,
+             'comment': 'The most expensive function of a profiled comparison, click for the profile report'},
+            {'column_name': 'Largest deviation', 'width': 32,
+             'comment': 'Column with the largest absolute deviation and its 99th percentile, '
+                        'the statistics of all columns are on the sheet of the comparison'}
         ]:
             # Write column name
             sh['Summary_Sheet'].write(row, i, name['column_name'], self.format_header)
@@ -384,6 +498,19 @@ class ExportResults:
                 sh['Summary_Sheet'].write(row, cell, result['paths']['file_right'])
                 cell += 1
 
+                # Profile report of the comparison
+                if result.get('profile') and result['profile']['hot_functions']:
+                    sh['Summary_Sheet'].write_url(row, cell, 'external:' + result['profile']['files']['profile'],
+                                                  string=result['profile']['hot_functions'][0])
+                    sh['Summary_Sheet'].write_comment(row, cell, '\n'.join(result['profile']['hot_functions']))
+                cell += 1
+
+                # Deviations of the comparison
+                largest_deviation = self.get_largest_deviation(result.get('deviations'))
+                if largest_deviation:
+                    sh['Summary_Sheet'].write(row, cell, largest_deviation)
+                cell += 1
+
             elif status == 100:
                 sh['Summary_Sheet'].write(row, 0, result['file_name'])
                 sh['Summary_Sheet'].write(row, 1, status, self.format_fail)
@@ -410,6 +537,9 @@ class ExportResults:
                 row = self.add_column_names(report_sheet, report_summary['diff_column_names'], first_cell_empty=False,
                                             first_cell='=HYPERLINK("#Summary_Sheet!A1","Back to Summary")')
                 self.add_diffs(report_sheet, row, report_summary['diff_column_names'], report_summary)
+                if report_summary.get('deviations'):
+                    self.add_deviations(report_sheet, report_summary['diff_column_names'],
+                                        report_summary['deviations'], first_cell=5)
                 sheets.update({report_name: report_sheet})
         return sheets
 
@@ -424,6 +554,20 @@ class ExportResults:
             name = chr(r + ord('A')) + name
         return name
 
+    @staticmethod
+    def to_cell(value, scale=None):
+        """
+        Datetimes are written as ISO 8601 strings, with the offset for time zone aware values.
+        Decimals (integers scaled by 10^scale) are written as numbers if Excel keeps all their digits
+        (15 significant digits), otherwise as texts.
+        """
+        if isinstance(value, pd.Timestamp):
+            return value.isoformat()
+        if scale is not None and value != '':
+            value = Decimal(int(value)).scaleb(-scale)
+            return value if len(value.as_tuple().digits) <= 15 else str(value)
+        return value
+
     @staticmethod
     def check_for_number(input_value):
         """
@@ -432,6 +576,8 @@ class ExportResults:
         https://pypi.orgg/project/fastnumbers/
         """
         value = '' if pd.isna(input_value) else input_value
+        if isinstance(value, (datetime, np.datetime64)):
+            return pd.Timestamp(value)
         value_type = query_type(value)
         if value_type in [int, np.int64]:
             return np.int64(value)
@@ -0,0 +1,144 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+compression_extensions = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.xz': 'xz',
+                          '.zst': 'zstd', '.zstd': 'zstd'}
+compression_magic = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+
+def detect_compression(path):
+    """
+    Returns the compression of the file ("gzip", "bz2", "xz", "zstd") or None for a plain file.
+    The extension is checked first, the magic bytes at the beginning of the file second.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in compression_extensions:
+        return compression_extensions[extension]
+
+    with open(path, 'rb') as reader:
+        head = reader.read(6)
+    for magic, compression in compression_magic.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_input(path, mode='rb', encoding=None, threaded=True):
+    """
+    Opens an input file, compressed files are decompressed on the fly, no uncompressed copy is written.
+    With "threaded" the decompression runs in a background thread, overlapped with the parsing
+        mode: "rb" for a binary stream, "r" for a text stream
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        stream = open(path, 'rb', buffering=1024 * 1024)
+    else:
+        stream = open_decompressed(path, compression)
+        if threaded:
+            stream = io.BufferedReader(ThreadedReader(stream), buffer_size=1024 * 1024)
+
+    if mode == 'rb':
+        return stream
+    elif mode == 'r':
+        return io.TextIOWrapper(stream, encoding=encoding)
+    else:
+        raise ValueError(f'Unsupported mode: {mode}, required: "rb" or "r"')
+
+
+def open_seekable(path):
+    """
+    Returns the path of a plain file or an in-memory seekable copy of a compressed
+    file, for readers which need to seek (e.g. xlsx workbooks)
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return path
+    with open_decompressed(path, compression) as reader:
+        return io.BytesIO(reader.read())
+
+
+def open_decompressed(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        return bz2.open(path, 'rb')
+    elif compression == 'xz':
+        return lzma.open(path, 'rb')
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError(f'File {path} is compressed by zstd, the "zstandard" package is required to read it!')
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Reads a decompressing stream in a background thread, the decompressed
+    chunks are passed through a bounded queue to the reading (parsing) thread.
+    The decompressors of zlib, bz2, lzma and zstd release the GIL,
+    so decompression and parsing run in parallel.
+    """
+
+    def __init__(self, stream, chunk_size=1024 * 1024, max_chunks=8):
+        super().__init__()
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.buffer = b''
+        self.error = None
+        self.finished = False
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.decompress, daemon=True)
+        self.thread.start()
+
+    def decompress(self):
+        try:
+            while not self.stop.is_set():
+                chunk = self.stream.read(self.chunk_size)
+                self.put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            self.error = e
+            self.put(b'')
+
+    def put(self, chunk):
+        while not self.stop.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.buffer and not self.finished:
+            self.buffer = memoryview(self.chunks.get())
+            if not self.buffer:
+                self.finished = True
+                if self.error:
+                    raise self.error
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+            self.stream.close()
+        super().close()
@@ -4,11 +4,19 @@ from datetime import datetime
 
 
 class Logger:
-    def __init__(self, logfile_dir_path, name, file_name=None):
+    def __init__(self, logfile_dir_path, name, file_name=None, mode='w'):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.DEBUG)
+        # A reused process (pool worker, server) must not write to the log files of previous runs
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
         formatter_default = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s', datefmt='%m/%d/%Y %H:%M:%S')
 
+        self.log_path = None
+        if logfile_dir_path is None:
+            return
+
         cmd_hdl = logging.StreamHandler()
         cmd_hdl.setFormatter(formatter_default)
         self.logger.addHandler(cmd_hdl)
@@ -17,9 +25,9 @@ class Logger:
         if not os.path.exists(logfile_dir_path):
             os.makedirs(logfile_dir_path)
         if file_name is None:
-            file_hdl = logging.FileHandler(logfile_dir_path + '/' + ts + '.log', mode='w')
+            file_hdl = logging.FileHandler(logfile_dir_path + '/' + ts + '.log', mode=mode)
         else:
-            file_hdl = logging.FileHandler(logfile_dir_path + '/' + file_name + '.log', mode='w')
+            file_hdl = logging.FileHandler(logfile_dir_path + '/' + file_name + '.log', mode=mode)
         file_hdl.setFormatter(formatter_default)
         self.log_path = file_hdl.baseFilename
         self.logger.addHandler(file_hdl)
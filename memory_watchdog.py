@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+
+# Units of the --memory-limit option
+size_units = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+class MemoryWatchdog:
+    """
+    Monitors the resident memory (RSS) of the worker process. Above "ratio" of the soft limit the
+    worker is under memory pressure: the stages of the comparison switch to cheaper strategies
+    (see Comparison.check_memory) and the shared "pressure" counter tells the parent process to
+    hold back new jobs. With a "slot", "pressure" is a shared array with a counter per job, so the
+    parent can drop the counter of a worker which died. Every degradation is recorded as an event.
+    """
+
+    def __init__(self, soft_limit, ratio=0.8, interval=0.2, pressure=None, log=None, chunk_rows=100000,
+                 report_rows=10000, slot=None):
+        self.soft_limit = soft_limit
+        self.threshold = soft_limit * ratio
+        self.interval = interval
+        self.shared_pressure = pressure
+        self.slot = slot
+        self.log = log
+        self.chunk_rows = chunk_rows
+        self.report_rows = report_rows
+        self.under_pressure = False
+        self.peak_rss = 0
+        self.events = []
+        self.stop = threading.Event()
+        self.monitor = None
+
+    def __enter__(self):
+        self.set_pressure(self.get_rss() > self.threshold)
+        self.monitor = threading.Thread(target=self.watch, daemon=True)
+        self.monitor.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop.set()
+        self.monitor.join()
+        self.set_pressure(False)
+        return False
+
+    def watch(self):
+        while not self.stop.wait(self.interval):
+            self.set_pressure(self.get_rss() > self.threshold)
+
+    def set_pressure(self, under_pressure):
+        if under_pressure == self.under_pressure:
+            return
+        self.under_pressure = under_pressure
+        if self.shared_pressure is not None:
+            with self.shared_pressure.get_lock():
+                if self.slot is None:
+                    self.shared_pressure.value += 1 if under_pressure else -1
+                else:
+                    self.shared_pressure[self.slot] += 1 if under_pressure else -1
+
+    def get_rss(self):
+        rss = get_rss()
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def check(self, stage, action):
+        """
+        Called by the stages of the comparison, returns True and records the degradation if the memory
+        is above the threshold
+        """
+        rss = self.get_rss()
+        self.set_pressure(rss > self.threshold)
+        if not self.under_pressure:
+            return False
+        self.events.append({'stage': stage, 'action': action, 'rss': rss})
+        if self.log:
+            self.log.logger.warning(f'Memory pressure in {stage} ({rss / 1024 ** 2:0.0f} MiB of the soft limit '
+                                    f'{self.soft_limit / 1024 ** 2:0.0f} MiB): {action}')
+        return True
+
+    def get_report(self):
+        return {'soft_limit': self.soft_limit, 'peak_rss': self.peak_rss, 'events': self.events}
+
+
+def get_rss():
+    """
+    Current resident memory of the process in bytes: /proc on Linux or psutil if installed, None if it cannot be
+    measured (the peak resident memory of the resource module never falls back below the threshold)
+    """
+    try:
+        with open('/proc/self/statm') as reader:
+            return int(reader.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def parse_size(value):
+    """
+    Size given as bytes or with a unit, e.g. "512M" or "4G"
+    """
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([kmg]?)i?b?\s*', str(value).lower())
+    if not match:
+        raise ValueError(f'Unknown size: {value}, e.g. 512M or 4G is expected')
+    return int(float(match.group(1)) * size_units[match.group(2)])
@@ -0,0 +1,157 @@
+import os
+import time
+import threading
+from configuration import true_values
+
+
+class Prefetcher:
+    """
+    Reads the input files of the next "lookahead" jobs of the pool ahead into the page cache (after a
+    posix_fadvise WILLNEED hint where it is available), while the workers still process the previous
+    jobs. The workers count the started jobs in the shared "started" counter, the files of the jobs
+    not started yet are bounded by the byte budget. A file is read ahead only until its job starts.
+    The read-ahead time is the time of the prefetcher itself, the saved load time of a comparison is
+    estimated from the load times of the comparisons which were not prefetched (cold).
+    """
+
+    def __init__(self, jobs, started, lookahead, budget, log, chunk_size=8 * 1024 ** 2, poll_interval=0.1):
+        # List of jobs (lists of comparisons), it may grow while the configuration is streamed
+        self.jobs = jobs
+        self.started = started
+        self.lookahead = lookahead
+        self.budget = budget
+        self.log = log
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        # {path: {'job', 'size', 'bytes', 'seconds', 'complete'}}
+        self.files = {}
+        self.stop = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+    @staticmethod
+    def get_paths(job):
+        paths = []
+        for xml_comparison in job:
+            if xml_comparison.find('enabled') is None or xml_comparison.find('enabled').text not in true_values:
+                continue
+            for tag in ['left', 'right']:
+                xml_path = xml_comparison.find(tag)
+                if xml_path is not None and xml_path.text and xml_path.text not in paths:
+                    paths.append(xml_path.text)
+        return paths
+
+    def get_pending_bytes(self):
+        """
+        Prefetched bytes of the jobs which have not started yet
+        """
+        return sum(file['bytes'] for file in self.files.values() if file['job'] >= self.started.value)
+
+    def run(self):
+        while not self.stop.is_set():
+            first = self.started.value
+            for index in range(first, min(first + self.lookahead, len(self.jobs))):
+                for path in self.get_paths(self.jobs[index]):
+                    if path in self.files or not os.path.isfile(path):
+                        continue
+                    size = os.path.getsize(path)
+                    if self.get_pending_bytes() + size > self.budget:
+                        continue
+                    self.read_ahead(path, index, size)
+                    if self.stop.is_set() or self.started.value != first:
+                        break
+            self.stop.wait(self.poll_interval)
+
+    def read_ahead(self, path, index, size):
+        file = {'job': index, 'size': size, 'bytes': 0, 'seconds': 0.0, 'complete': False}
+        self.files[path] = file
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb', buffering=0) as reader:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(reader.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                # The worker reads the file itself as soon as the job starts
+                while not self.stop.is_set() and self.started.value <= index:
+                    chunk = reader.read(self.chunk_size)
+                    if not chunk:
+                        file['complete'] = True
+                        break
+                    file['bytes'] += len(chunk)
+        except OSError as e:
+            self.log.logger.warning(f'Prefetching {path} failed: {e}')
+        file['seconds'] = time.perf_counter() - start
+
+    def get_report(self, job):
+        """
+        Prefetch of the inputs of the job: bytes and seconds read ahead before the job started
+        """
+        files = [file for path, file in self.files.items() if path in self.get_paths(job)]
+        return {'files': len(files), 'bytes': sum(file['bytes'] for file in files),
+                'read_ahead_seconds': sum(file['seconds'] for file in files),
+                'complete': bool(files) and all(file['complete'] for file in files)}
+
+    @staticmethod
+    def get_size(paths):
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def get_cold_load_rate(self, comparisons):
+        """
+        Load seconds per byte of the inputs of the comparisons which were not prefetched, None without any
+        """
+        seconds, size = 0.0, 0
+        for xml_comparison, report, summary in comparisons:
+            if not report['bytes']:
+                seconds += summary.get('timings', {}).get('load', 0.0)
+                size += self.get_size(self.get_paths([xml_comparison]))
+        return seconds / size if size else None
+
+    def log_prefetch(self, jobs, results):
+        """
+        Logs the prefetch of each comparison with its load time and the estimate of the saved load time:
+        the load time of its inputs at the rate of the cold comparisons (or the load time with the read-ahead
+        time of the prefetched bytes, without any cold comparison) minus the load time.
+        """
+        results = iter(results)
+        comparisons = []
+        for job in jobs:
+            report = self.get_report(job)
+            for xml_comparison in job:
+                status, summary = next(results)
+                if status == 0:
+                    comparisons.append((xml_comparison, report, summary))
+
+        cold_rate = self.get_cold_load_rate(comparisons)
+        saved, prefetched = 0.0, 0
+        for xml_comparison, report, summary in comparisons:
+            load = summary.get('timings', {}).get('load', 0.0)
+            if not report['bytes']:
+                continue
+            if cold_rate is not None:
+                cold_load = self.get_size(self.get_paths([xml_comparison])) * cold_rate
+            else:
+                cold_load = load + report['read_ahead_seconds']
+            summary.update({'prefetch': dict(report, cold_load_estimate=cold_load, saved_seconds=cold_load - load)})
+            saved += cold_load - load
+            prefetched += 1
+            self.log.logger.info(f'{summary["report_name"]}: {report["bytes"] / 1024 ** 2:0.1f} MiB of the inputs '
+                                 f'prefetched{"" if report["complete"] else " (partially)"}, '
+                                 f'read ahead in {report["read_ahead_seconds"]:0.2f}s, '
+                                 f'load took {load:0.2f}s (cold about {cold_load:0.2f}s, '
+                                 f'{cold_load - load:0.2f}s saved)')
+        if prefetched:
+            self.log.logger.info(f'The prefetch saved about {saved:0.2f}s of the load time of {prefetched} comparisons')
@@ -0,0 +1,145 @@
+import io
+import os
+import sys
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+profile_modes = {'true': ['cpu', 'memory'], 'all': ['cpu', 'memory'], 'cpu': ['cpu'], 'memory': ['memory']}
+
+# tracemalloc traces the whole process, it is started by the first and stopped by the last memory profiler
+tracing_lock = threading.Lock()
+memory_profilers = set()
+
+
+class Profiler:
+    """
+    Profiles the code running in its context (in the current thread) and writes the reports to the log folder
+        <file_name>.pstats         - cProfile statistics, for pstats / snakeviz
+        <file_name>.profile.txt    - the most expensive functions
+        <file_name>.collapsed.txt  - sampled stacks in the collapsed format of flamegraph.pl / speedscope
+        <file_name>.allocations.txt - top allocations by source line (tracemalloc)
+    The memory is traced for the whole process: the peak is the growth of the traced memory over its
+    start, the peak and the allocations of concurrently profiled comparisons (fan-out groups) include
+    each other and are reported as shared.
+    """
+
+    def __init__(self, log_dir, file_name, modes=('cpu', 'memory'), interval=0.005, top=25):
+        self.path = os.path.join(log_dir, file_name)
+        self.modes = modes
+        self.interval = interval
+        self.top = top
+        self.profile = None
+        self.stacks = Counter()
+        self.stop = threading.Event()
+        self.sampler = None
+        self.report = {'hot_functions': [], 'files': {}, 'peak_memory': None}
+        self.traced_start = 0
+
+    def __enter__(self):
+        if 'memory' in self.modes:
+            self.start_tracing()
+        if 'cpu' in self.modes:
+            self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+            self.sampler.start()
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profile:
+            self.profile.disable()
+            self.stop.set()
+            self.sampler.join()
+        if self in memory_profilers:
+            self.write_memory_report(self.stop_tracing())
+        if self.profile:
+            self.write_cpu_reports()
+        return False
+
+    def start_tracing(self):
+        with tracing_lock:
+            if not memory_profilers:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(10)
+                tracemalloc.reset_peak()
+            else:
+                for profiler in memory_profilers:
+                    profiler.report['peak_memory_shared'] = True
+                self.report['peak_memory_shared'] = True
+            self.traced_start = tracemalloc.get_traced_memory()[0]
+            memory_profilers.add(self)
+
+    def stop_tracing(self):
+        """
+        Returns the snapshot of the traced allocations, the last profiler stops the tracing
+        """
+        with tracing_lock:
+            snapshot = tracemalloc.take_snapshot()
+            self.report['peak_memory'] = max(tracemalloc.get_traced_memory()[1] - self.traced_start, 0)
+            memory_profilers.discard(self)
+            if not memory_profilers:
+                tracemalloc.stop()
+        return snapshot
+
+    def sample(self, thread_id):
+        """
+        Samples the stack of the profiled thread, root first
+        """
+        while not self.stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_cpu_reports(self):
+        self.profile.dump_stats(self.path + '.pstats')
+        self.report['files'].update({'pstats': self.path + '.pstats'})
+
+        with open(self.path + '.collapsed.txt', 'w') as writer:
+            for stack, count in self.stacks.most_common():
+                writer.write(f'{stack} {count}\n')
+        self.report['files'].update({'collapsed': self.path + '.collapsed.txt'})
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('tottime').print_stats(self.top)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        with open(self.path + '.profile.txt', 'w') as writer:
+            writer.write(stream.getvalue())
+        self.report['files'].update({'profile': self.path + '.profile.txt'})
+
+        hot_functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:5]
+        for (file, line, function), (calls, _, total_time, cumulative_time, _) in hot_functions:
+            self.report['hot_functions'].append(f'{function} ({os.path.basename(file)}:{line}) '
+                                                f'{total_time:0.2f}s own, {cumulative_time:0.2f}s total, '
+                                                f'{calls} calls')
+
+    def write_memory_report(self, snapshot):
+        with open(self.path + '.allocations.txt', 'w') as writer:
+            writer.write(f'Peak traced memory: {self.report["peak_memory"] / 1024 / 1024:0.1f} MiB'
+                         f'{" (shared with concurrent comparisons)" if self.report.get("peak_memory_shared") else ""}'
+                         f'\n\n')
+            for statistic in snapshot.statistics('lineno')[:self.top]:
+                writer.write(f'{statistic}\n')
+        self.report['files'].update({'allocations': self.path + '.allocations.txt'})
+
+
+def get_profile_modes(value):
+    """
+    Profile modes of the --profile option or the "profile" attribute of a comparison
+    """
+    if value is None:
+        return []
+    if value.lower() in ['false', 'f', '0', 'none']:
+        return []
+    if value.lower() not in profile_modes:
+        raise ValueError(f'Unknown profile mode: {value}, the options are: {list(profile_modes)}')
+    return profile_modes[value.lower()]
+
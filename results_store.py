@@ -0,0 +1,198 @@
+import os
+import json
+import sqlite3
+import argparse
+import numpy as np
+from decimal import Decimal
+from datetime import datetime
+
+
+class ResultsStore:
+    """
+    Indexed SQLite store of the comparison results, shared by all runs of an output folder.
+        summaries   - one row per run and comparison, with the summary as JSON
+        differences - one row per differing cell of "df_compare" (column, left and right value)
+                      and one row per unmatched line (column is NULL), keyed by run, comparison
+                      and the reference key ("|" separated values of the reference columns)
+    """
+
+    def __init__(self, db_path, timeout=60):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=timeout)
+        # Rollback journal, the store is shared by the queue workers of other nodes over a network
+        # folder where the shared memory of the WAL mode does not work
+        self.connection.execute('PRAGMA journal_mode=DELETE')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                run_id TEXT, file_name TEXT, status INTEGER, created TEXT, summary TEXT,
+                PRIMARY KEY (run_id, file_name));
+            CREATE TABLE IF NOT EXISTS differences (
+                run_id TEXT, file_name TEXT, key TEXT, column_name TEXT,
+                left_value, right_value, merge TEXT);
+            CREATE INDEX IF NOT EXISTS differences_key ON differences (key, column_name);
+            CREATE INDEX IF NOT EXISTS differences_file_key ON differences (file_name, key);
+            CREATE INDEX IF NOT EXISTS differences_column ON differences (column_name, file_name);
+            CREATE INDEX IF NOT EXISTS differences_run ON differences (run_id, file_name);
+        """)
+
+    def close(self):
+        self.connection.close()
+
+    def store_result(self, run_id, status, summary, comparison=None):
+        """
+        Stores the summary and, for a finished comparison, its differences and unmatched lines
+        """
+        file_name = summary.get('report_name', summary.get('file_name'))
+        with self.connection:
+            self.connection.execute('DELETE FROM summaries WHERE run_id = ? AND file_name = ?', (run_id, file_name))
+            self.connection.execute('DELETE FROM differences WHERE run_id = ? AND file_name = ?', (run_id, file_name))
+            self.connection.execute('INSERT INTO summaries VALUES (?, ?, ?, ?, ?)',
+                                    (run_id, file_name, status, datetime.now().isoformat(timespec='seconds'),
+                                     json.dumps(summary, default=to_plain)))
+            if comparison is not None and not comparison.df_merge.empty:
+                self.connection.executemany('INSERT INTO differences VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                            self.get_difference_rows(run_id, file_name, comparison))
+
+    @staticmethod
+    def get_difference_rows(run_id, file_name, comparison):
+        """
+        Yields the rows for the "differences" table, built column by column from "df_compare"
+        """
+        df_merge = comparison.df_merge
+        references = comparison.configuration['references']
+        # Decimal columns are integers scaled by 10^scale, they are stored as exact decimal texts
+        scales = comparison.get_scales()
+        keys = to_keys(df_merge[references[0]], scales.get(str(references[0])))
+        for reference in references[1:]:
+            keys = keys + '|' + to_keys(df_merge[reference], scales.get(str(reference)))
+        merge = df_merge['_merge'].astype(str)
+
+        df_compare = comparison.df_compare
+        for column in df_compare.columns.get_level_values(0).unique():
+            left = df_compare[(column, 'self')]
+            right = df_compare[(column, 'other')]
+            rows = df_compare.index[left.notna() | right.notna()]
+            yield from zip([run_id] * len(rows), [file_name] * len(rows), keys.loc[rows].tolist(),
+                           [str(column)] * len(rows), to_values(left.loc[rows], scales.get(str(column))),
+                           to_values(right.loc[rows], scales.get(str(column))),
+                           merge.loc[rows].tolist())
+
+        unmatched = df_merge.index[merge != 'both']
+        yield from zip([run_id] * len(unmatched), [file_name] * len(unmatched), keys.loc[unmatched].tolist(),
+                       [None] * len(unmatched), [None] * len(unmatched), [None] * len(unmatched),
+                       merge.loc[unmatched].tolist())
+
+    def query(self, key=None, key_prefix=None, column=None, file_name=None, run_id=None, since=None, limit=1000):
+        """
+        Differences filtered by key (exact or prefix), column, comparison, run and run start (run ids are
+        the time stamps of the export folders, e.g. since="20240101")
+        """
+        conditions = []
+        parameters = []
+        if key is not None:
+            conditions.append('key = ?')
+            parameters.append(key)
+        if key_prefix is not None:
+            # A range instead of LIKE, so the index is used
+            conditions.append('key >= ? AND key < ?')
+            parameters.extend([key_prefix, key_prefix + '\uffff'])
+        if column is not None:
+            conditions.append('column_name = ?')
+            parameters.append(column)
+        if file_name is not None:
+            conditions.append('file_name = ?')
+            parameters.append(file_name)
+        if run_id is not None:
+            conditions.append('run_id = ?')
+            parameters.append(run_id)
+        if since is not None:
+            conditions.append('run_id >= ?')
+            parameters.append(since)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        cursor = self.connection.execute(f'SELECT run_id, file_name, key, column_name, left_value, right_value, merge '
+                                         f'FROM differences {where} ORDER BY run_id, file_name, key LIMIT ?',
+                                         parameters + [limit])
+        return cursor.fetchall()
+
+    def query_summaries(self, file_name=None, since=None):
+        conditions = []
+        parameters = []
+        if file_name is not None:
+            conditions.append('file_name = ?')
+            parameters.append(file_name)
+        if since is not None:
+            conditions.append('run_id >= ?')
+            parameters.append(since)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        cursor = self.connection.execute(f'SELECT run_id, file_name, status, summary FROM summaries {where} '
+                                         f'ORDER BY run_id, file_name', parameters)
+        return [(run_id, name, status, json.loads(summary)) for run_id, name, status, summary in cursor]
+
+
+def to_values(column, scale=None):
+    """
+    Cell values as plain Python values for SQLite, missing values are NULL (see to_value)
+    """
+    values = column.astype(object).where(column.notna(), None).tolist()
+    return [None if value is None else to_value(value, scale) for value in values]
+
+
+def to_keys(column, scale=None):
+    """
+    Values of a reference column as texts of the key
+    """
+    keys = column.astype(str)
+    if scale is not None or column.dtype.kind == 'M':
+        valid = column.notna()
+        keys[valid] = [to_value(value, scale) for value in column[valid].tolist()]
+    return keys
+
+
+def to_value(value, scale=None):
+    """
+    Plain Python value for SQLite, a decimal (with its scale) as the exact decimal text and a datetime
+    as ISO 8601 text, with the offset for time zone aware values
+    """
+    if scale is not None:
+        return to_decimal(value, scale)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def to_decimal(value, scale):
+    """
+    Integer scaled by 10^scale as the exact decimal text, e.g. 500 with the scale 2 as "5.00"
+    """
+    return f'{Decimal(int(value)).scaleb(-scale):f}'
+
+
+def to_plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Queries the differences stored by the comparison runs')
+    parser.add_argument('store', help='path of the results store (results.sqlite in the output folder)')
+    parser.add_argument('--key', default=None, help='reference key, values of the reference columns joined by "|"')
+    parser.add_argument('--key-prefix', default=None, help='beginning of the reference key')
+    parser.add_argument('--column', default=None)
+    parser.add_argument('--file', default=None, help='file_name of the comparison')
+    parser.add_argument('--run', default=None, help='run id, the time stamp of the export folder')
+    parser.add_argument('--since', default=None, help='first run id, e.g. 20240101')
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--summaries', action='store_true', help='lists the summaries instead of the differences')
+    arguments = parser.parse_args()
+
+    store = ResultsStore(arguments.store)
+    if arguments.summaries:
+        for run_id, name, status, summary in store.query_summaries(arguments.file, arguments.since):
+            print(f'{run_id}\t{name}\t{status}\t{summary.get("merge_match", summary.get("error"))}')
+    else:
+        for row in store.query(arguments.key, arguments.key_prefix, arguments.column, arguments.file,
+                               arguments.run, arguments.since, arguments.limit):
+            print('\t'.join('' if value is None else str(value) for value in row))
+    store.close()
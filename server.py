@@ -0,0 +1,225 @@
+import json
+import signal
+import argparse
+import threading
+import multiprocessing
+from datetime import datetime
+from urllib.request import Request, urlopen
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from DataComparer import Comparer, process_comparison
+from configuration import Configuration
+
+
+def warm_up():
+    """
+    Initializer of the pool workers, pandas and the comparison modules are imported once per worker
+    """
+    import comparison
+    import export_results
+
+
+def process_indexed(task):
+    index, xml_comparison, xml_defaults, export_folder, store = task
+    return index, process_comparison(xml_comparison, xml_defaults, export_folder, store=store)
+
+
+def to_json(data):
+    """
+    Summaries contain numpy numbers and exceptions, they are converted to plain values
+    """
+    return json.dumps(data, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+
+class ComparisonServer:
+    """
+    Long-running comparison service with a warm pool of workers.
+
+    Jobs are posted as JSON to "/jobs", either {"config": "<path to config.xml>"}
+    or {"xml": "<Config>...</Config>"} or {"xml": "<comparison>...</comparison>"}
+    (a single comparison uses the output and defaults of the base configuration).
+    The response is streamed as JSON lines: "queued", "started", one "result" per comparison
+    (the summary returned by "process_comparison") and "done" with the export folder.
+        GET  /status - number of queued and running jobs
+        POST /drain  - stops accepting jobs, finishes the accepted ones and shuts down
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, processes=None, max_jobs=2, max_queue=100,
+                 base_config=None, start_method=None):
+        self.base_config = Configuration.get_xml_comparisons(base_config) if base_config else None
+        self.max_queue = max_queue
+        self.job_slots = threading.Semaphore(max_jobs)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.queued = 0
+        self.running = 0
+        self.job_counter = 0
+        self.draining = False
+
+        context = multiprocessing.get_context(start_method)
+        self.pool = context.Pool(processes or multiprocessing.cpu_count(), initializer=warm_up)
+        self.httpd = ThreadingHTTPServer((host, port), self.create_handler())
+        self.httpd.daemon_threads = True
+
+    def create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.0'
+
+            def do_GET(self):
+                if self.path == '/status':
+                    with server.lock:
+                        self.send_json(200, {'queued': server.queued, 'running': server.running,
+                                             'draining': server.draining})
+                else:
+                    self.send_json(404, {'error': f'Unknown path: {self.path}'})
+
+            def do_POST(self):
+                if self.path == '/drain':
+                    threading.Thread(target=server.drain, daemon=True).start()
+                    self.send_json(202, {'draining': True})
+                elif self.path == '/jobs':
+                    try:
+                        job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                        xml_config = server.read_job(job)
+                    except Exception as e:
+                        self.send_json(400, {'error': str(e)})
+                        return
+                    job_id = server.accept_job()
+                    if job_id is None:
+                        self.send_json(503, {'error': 'The server is draining or the job queue is full'})
+                        return
+                    # Closing the events of a disconnected client releases the queued or running job
+                    events = server.run_job(job_id, xml_config)
+                    try:
+                        for event in events:
+                            if event['event'] == 'queued':
+                                self.send_response(200)
+                                self.send_header('Content-Type', 'application/x-ndjson')
+                                self.end_headers()
+                            self.wfile.write(to_json(event).encode() + b'\n')
+                            self.wfile.flush()
+                    finally:
+                        events.close()
+                else:
+                    self.send_json(404, {'error': f'Unknown path: {self.path}'})
+
+            def send_json(self, code, data):
+                body = to_json(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def read_job(self, job):
+        if job.get('config'):
+            return Configuration.get_xml_comparisons(job['config'])
+        elif job.get('xml'):
+            return Configuration.get_xml_comparisons_from_string(job['xml'], self.base_config)
+        raise ValueError(f'The job requires a "config" path or a "xml" configuration')
+
+    def accept_job(self):
+        with self.lock:
+            if self.draining or self.queued >= self.max_queue:
+                return None
+            self.queued += 1
+            self.job_counter += 1
+            return self.job_counter
+
+    def run_job(self, job_id, xml_config):
+        """
+        Runs all comparisons of the job in the warm pool, yields the events of the job.
+        The job is released when the generator is closed, also while it is queued (the client disconnected).
+        """
+        waiting = True
+        try:
+            yield {'event': 'queued', 'job': job_id}
+            with self.job_slots:
+                with self.lock:
+                    self.queued -= 1
+                    self.running += 1
+                    waiting = False
+                try:
+                    export_folder = f'{xml_config["output"]}\\{datetime.today().strftime("%Y%m%d_%H%M%S")}_{job_id}'
+                    comparer = Comparer(xml_config, export_folder=export_folder)
+                    yield {'event': 'started', 'job': job_id, 'export_folder': export_folder}
+
+                    # Only the arguments of "process_comparison" are sent to the workers, not the Comparer
+                    results = [None] * len(xml_config['comparisons'])
+                    tasks = [(i, comparison, xml_config['defaults'], export_folder, xml_config.get('store'))
+                             for i, comparison in enumerate(xml_config['comparisons'])]
+                    for index, (status, summary) in self.pool.imap_unordered(process_indexed, tasks):
+                        results[index] = (status, summary)
+                        yield {'event': 'result', 'job': job_id, 'status': status, 'summary': summary}
+
+                    comparer.results = results
+                    comparer.generate_summary()
+                    yield {'event': 'done', 'job': job_id, 'export_folder': export_folder}
+                except Exception as e:
+                    yield {'event': 'error', 'job': job_id, 'error': str(e)}
+                finally:
+                    with self.condition:
+                        self.running -= 1
+                        self.condition.notify_all()
+        finally:
+            if waiting:
+                with self.condition:
+                    self.queued -= 1
+                    self.condition.notify_all()
+
+    def drain(self):
+        """
+        Stops accepting new jobs, waits for the accepted jobs and shuts the server down
+        """
+        with self.condition:
+            self.draining = True
+            self.condition.wait_for(lambda: self.queued == 0 and self.running == 0)
+        self.httpd.shutdown()
+
+    def serve(self):
+        signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=self.drain, daemon=True).start())
+        signal.signal(signal.SIGINT, lambda *args: threading.Thread(target=self.drain, daemon=True).start())
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.pool.close()
+            self.pool.join()
+
+
+def submit_job(url, config=None, xml=None):
+    """
+    Posts a job to a running server and yields its events
+    """
+    request = Request(url.rstrip('/') + '/jobs', data=json.dumps({'config': config, 'xml': xml}).encode(),
+                      headers={'Content-Type': 'application/json'}, method='POST')
+    with urlopen(request) as response:
+        for line in response:
+            yield json.loads(line)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Comparison server with a warm pool of workers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--processes', type=int, default=None, help='number of workers, default is the cpu count')
+    parser.add_argument('--max-jobs', type=int, default=2, help='number of jobs processed at the same time')
+    parser.add_argument('--max-queue', type=int, default=100, help='number of jobs waiting for processing')
+    parser.add_argument('--config', default=None, help='base configuration for jobs with a single comparison')
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(), default=None)
+    parser.add_argument('--submit', metavar='CONFIG', default=None,
+                        help='client mode, submits the configuration to a running server')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    if arguments.submit:
+        for event in submit_job(f'http://{arguments.host}:{arguments.port}', config=arguments.submit):
+            print(to_json(event))
+    else:
+        ComparisonServer(arguments.host, arguments.port, arguments.processes, arguments.max_jobs,
+                         arguments.max_queue, arguments.config, arguments.start_method).serve()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+from api import compare_frames
+from backends import get_backend
+
+# Conformance of the compute backends: every backend has to give the results of the pandas backend
+pytest.importorskip('polars')
+backend_names = ['pandas', 'polars']
+
+
+def get_cases():
+    """
+    Small in-memory reports with their columns configuration, {name: (left, right, columns)}
+    """
+    cases = {}
+    cases['numbers'] = (
+        pd.DataFrame({'id': [1, 2, 3, 4, 5], 'a': [1.0, 2.0, 3.0, np.nan, 5.0], 'b': [10, 20, 30, 40, 50]}),
+        pd.DataFrame({'id': [1, 2, 3, 4, 6], 'a': [1.0, 2.5, 3.01, np.nan, 6.0], 'b': [10, 21, 30, 41, 60]}),
+        [{'name': 'id', 'reference': True},
+         {'name': 'a', 'tolerance': 0.1, 'tolerance_mode': 'Abs'},
+         {'name': 'b', 'tolerance': 0.04, 'tolerance_mode': 'Rel'}])
+    cases['texts'] = (
+        pd.DataFrame({'id': ['x', 'y', 'z', 'w'], 'key': [1, 1, 2, 2], 't': ['a', None, 'c', 'd']}),
+        pd.DataFrame({'id': ['x', 'y', 'z', 'v'], 'key': [1, 1, 3, 2], 't': ['a', 'b', 'c', None]}),
+        [{'name': 'id', 'reference': True}, {'name': 'key', 'reference': True}, {'name': 't'}])
+    cases['mixed types'] = (
+        pd.DataFrame({'id': [1, 2, 3], 'v': [1, 'two', 3.5]}),
+        pd.DataFrame({'id': [1, 2, 3], 'v': ['1', 'two', 3.25]}),
+        [{'name': 'id', 'reference': True}, {'name': 'v', 'tolerance': 0.5, 'tolerance_mode': 'Abs'}])
+    cases['datetime'] = (
+        pd.DataFrame({'id': [1, 2, 3, 4], 'd': ['2024-01-01 10:00:00', '2024-01-01 10:00:00', None,
+                                               '2024-03-31 01:30:00']}),
+        pd.DataFrame({'id': [1, 2, 3, 4], 'd': ['2024-01-01 10:00:00.400', '2024-01-01 10:00:02', '2024-01-02',
+                                               '2024-03-31 01:30:00']}),
+        [{'name': 'id', 'reference': True},
+         {'name': 'd', 'type': 'datetime', 'timezone': 'Europe/Prague', 'tolerance': 500, 'tolerance_unit': 'ms'}])
+    cases['decimal'] = (
+        pd.DataFrame({'id': [1, 2, 3, 4, 5], 'amount': ['0.30', '10.10', '5.00', None, '100.00'],
+                      'rate': ['1.00', '2.00', '0', '3.00', '100.00']}),
+        pd.DataFrame({'id': [1, 2, 3, 4, 5], 'amount': ['0.31', '10.12', '5.00', '1.00', '100.01'],
+                      'rate': ['1.01', '2.03', '0.01', '3.00', '101.00']}),
+        [{'name': 'id', 'reference': True},
+         {'name': 'amount', 'type': 'decimal(2)', 'tolerance': 0.01, 'tolerance_mode': 'Abs'},
+         {'name': 'rate', 'type': 'decimal(2)', 'tolerance': 0.01, 'tolerance_mode': 'Rel'}])
+    cases['decimal reference'] = (
+        pd.DataFrame({'price': ['1.10', '2.20', '3.30'], 'v': [1, 2, 3]}),
+        pd.DataFrame({'price': ['1.1', '2.2', '3.31'], 'v': [1, 3, 3]}),
+        [{'name': 'price', 'type': 'decimal(2)', 'reference': True}, {'name': 'v'}])
+    cases['datetime reference'] = (
+        pd.DataFrame({'t': ['2024-01-01 10:00:00', '2024-01-01 11:00:00'], 'v': [1, 2]}),
+        pd.DataFrame({'t': ['2024-01-01 10:00:01', '2024-01-01 11:00:05'], 'v': [1, 3]}),
+        [{'name': 't', 'type': 'datetime', 'reference': True, 'tolerance': 2}, {'name': 'v'}])
+    return cases
+
+
+def run(case, backend):
+    left, right, columns = get_cases()[case]
+    return compare_frames(left, right, {'file_name': 'conformance', 'backend': backend, 'columns': columns})
+
+
+def assert_frames_equal(left, right, obj):
+    if not (left.empty and right.empty):
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, obj=obj)
+
+
+@pytest.mark.parametrize('case', list(get_cases()))
+def test_comparison(case):
+    baseline = run(case, 'pandas')
+    for backend in backend_names[1:]:
+        comparison = run(case, backend)
+        assert_frames_equal(comparison.df_merge, baseline.df_merge, 'df_merge')
+        assert_frames_equal(comparison.df_compare, baseline.df_compare, 'df_compare')
+        assert comparison.summary['diffs_counter'] == baseline.summary['diffs_counter']
+        assert comparison.summary['merge_match'] == baseline.summary['merge_match']
+
+
+def test_decimal_tolerance():
+    comparison = run('decimal', 'pandas')
+    # 0.30/0.31, 100.00/100.01 and 1.00/1.01, 100.00/101.00 are in tolerance, exactly
+    assert comparison.summary['diffs_counter'] == {'amount': {'absolute': 4, 'in_tolerance': 2},
+                                                   'rate': {'absolute': 4, 'in_tolerance': 2}}
+    assert list(comparison.df_compare.index) == [1, 2, 3]
+
+
+def test_datetime_reference_tolerance():
+    # The tolerance of a typed datetime reference is in seconds
+    comparison = run('datetime reference', 'pandas')
+    assert comparison.summary['merge_match'] == {'match_both': 1, 'unmatched_left': 1, 'unmatched_right': 1}
+
+
+@pytest.mark.parametrize('case', list(get_cases()))
+def test_operators(case):
+    """
+    The operators of the backends on the reports prepared by the pandas comparison
+    """
+    comparison = run(case, 'pandas')
+    references = comparison.configuration['references']
+    df_left, df_right = comparison.df_left, comparison.df_right
+    values = [column for column in comparison.columns if column not in references]
+    merges, compares, tolerances = {}, {}, {}
+    for backend in map(get_backend, backend_names):
+        merges[backend.name] = backend.merge(df_left, df_right, references)
+        df_merge = merges['pandas']
+        compares[backend.name] = backend.compare(
+            df_merge[[f'{column}_x' for column in values]].set_axis(values, axis=1),
+            df_merge[[f'{column}_y' for column in values]].set_axis(values, axis=1))
+        tolerances[backend.name] = backend.tolerance(compares['pandas'], comparison.configuration['tolerances'],
+                                                     comparison.get_scales())
+
+    for backend in backend_names[1:]:
+        assert_frames_equal(merges[backend], merges['pandas'], 'merge')
+        assert_frames_equal(compares[backend], compares['pandas'], 'compare')
+        np.testing.assert_array_equal(tolerances[backend][0], tolerances['pandas'][0])
+        assert tolerances[backend][1] == tolerances['pandas'][1]
@@ -0,0 +1,47 @@
+import os
+import xml.etree.ElementTree as ET
+from checkpoints import Checkpoints
+
+
+def get_comparison(tmp_path, tolerance='0.01'):
+    for side in ['left', 'right']:
+        if not (tmp_path / f'{side}.csv').exists():
+            (tmp_path / f'{side}.csv').write_text('id;v\n1;1\n')
+    return ET.fromstring(f'<comparison file_name="C0"><left>{tmp_path / "left.csv"}</left>'
+                         f'<right>{tmp_path / "right.csv"}</right><columns>'
+                         f'<column name="v" tolerance="{tolerance}" /></columns></comparison>')
+
+
+def test_fingerprint_ignores_formatting(tmp_path):
+    xml_comparison = get_comparison(tmp_path)
+    formatted = ET.fromstring(ET.tostring(xml_comparison).decode().replace('><', '>\n    <'))
+    assert Checkpoints.get_fingerprint(xml_comparison, []) == Checkpoints.get_fingerprint(formatted, [])
+
+
+def test_fingerprint_changes(tmp_path):
+    xml_comparison = get_comparison(tmp_path)
+    fingerprint = Checkpoints.get_fingerprint(xml_comparison, [])
+    assert Checkpoints.get_fingerprint(get_comparison(tmp_path, '0.02'), []) != fingerprint
+    assert Checkpoints.get_fingerprint(xml_comparison, [ET.fromstring('<defaults />')]) != fingerprint
+
+    # A modified input file
+    stat = os.stat(tmp_path / 'right.csv')
+    os.utime(tmp_path / 'right.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert Checkpoints.get_fingerprint(xml_comparison, []) != fingerprint
+    os.remove(tmp_path / 'right.csv')
+    assert Checkpoints.get_fingerprint(xml_comparison, []) != fingerprint
+
+
+def test_get_result(tmp_path):
+    checkpoints = Checkpoints(str(tmp_path / 'export'))
+    xml_comparison = get_comparison(tmp_path)
+    assert checkpoints.get_result(xml_comparison, []) is None
+
+    checkpoints.write('C0', Checkpoints.get_fingerprint(xml_comparison, []), (0, {'report_name': 'C0'}))
+    assert checkpoints.get_result(xml_comparison, []) == (0, {'report_name': 'C0'})
+    # Changed configuration
+    assert checkpoints.get_result(get_comparison(tmp_path, '0.02'), []) is None
+
+    # Failed comparisons are run again
+    checkpoints.write('C0', Checkpoints.get_fingerprint(xml_comparison, []), (100, {'file_name': 'C0'}))
+    assert checkpoints.get_result(xml_comparison, []) is None
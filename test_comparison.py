@@ -0,0 +1,220 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+from api import compare_frames, comparison_to_xml, defaults_to_xml
+from comparison import Comparison
+from configuration import Configuration
+from logger import Logger
+
+
+def compare(left, right, columns, **tags):
+    return compare_frames(left, right, {'file_name': 'comparison', 'columns': columns, **tags})
+
+
+def run(configuration, **kwargs):
+    """
+    Comparison of the configuration dict or xml element, for the inputs given as files or the options of the CLI
+    """
+    log = Logger(None, 'comparison')
+    xml_comparison = configuration if isinstance(configuration, ET.Element) else comparison_to_xml(configuration)
+    config, defaults = Configuration(xml_comparison, [defaults_to_xml(None)], log).get_configuration()
+    return Comparison(config, defaults, '', log, **kwargs)
+
+
+def get_matched(comparison):
+    return {key: int(count) for key, count in comparison.summary['merge_match'].items()}
+
+
+# Tolerant join
+
+def tolerant_columns(tolerance, mode='Abs'):
+    return [{'name': 'k', 'reference': True, 'tolerance': tolerance, 'tolerance_mode': mode}, {'name': 'v'}]
+
+
+def test_tolerant_join_nearest():
+    comparison = compare(pd.DataFrame({'k': [1.0, 2.0, 3.0], 'v': [1, 2, 3]}),
+                         pd.DataFrame({'k': [1.04, 2.2, 2.98], 'v': [1, 2, 4]}), tolerant_columns(0.05))
+    assert get_matched(comparison) == {'match_both': 2, 'unmatched_left': 1, 'unmatched_right': 1}
+    assert list(comparison.df_compare.index) == [1, 2, 3]
+
+
+def test_tolerant_join_rematches_lost_lines():
+    # 1.1 loses 1.05 to the closer 1.0 and is matched with 1.2
+    comparison = compare(pd.DataFrame({'k': [1.0, 1.1], 'v': [1, 2]}),
+                         pd.DataFrame({'k': [1.05, 1.2], 'v': [1, 2]}), tolerant_columns(0.15))
+    assert get_matched(comparison) == {'match_both': 2, 'unmatched_left': 0, 'unmatched_right': 0}
+    assert comparison.df_compare.empty
+
+
+def test_tolerant_join_one_to_one():
+    comparison = compare(pd.DataFrame({'k': [1.0, 1.0, 1.0], 'v': [1, 1, 1]}),
+                         pd.DataFrame({'k': [1.01, 0.99], 'v': [1, 1]}), tolerant_columns(0.05))
+    assert get_matched(comparison) == {'match_both': 2, 'unmatched_left': 1, 'unmatched_right': 0}
+
+
+def test_tolerant_join_relative():
+    comparison = compare(pd.DataFrame({'k': [100.0, 1000.0], 'v': [1, 2]}),
+                         pd.DataFrame({'k': [101.0, 1020.0], 'v': [1, 2]}), tolerant_columns(0.01, 'Rel'))
+    assert get_matched(comparison) == {'match_both': 1, 'unmatched_left': 1, 'unmatched_right': 1}
+
+
+def test_tolerant_join_exact_references():
+    columns = [{'name': 'id', 'reference': True}] + tolerant_columns(0.5)
+    comparison = compare(pd.DataFrame({'id': ['a', 'b'], 'k': [1.0, 1.0], 'v': [1, 2]}),
+                         pd.DataFrame({'id': ['b', 'c'], 'k': [1.2, 1.2], 'v': [2, 3]}), columns)
+    assert get_matched(comparison) == {'match_both': 1, 'unmatched_left': 1, 'unmatched_right': 1}
+
+
+def test_tolerant_join_duplicated_keys():
+    # 200 lines per key in one report and spread values in the other, in both directions
+    keys = np.repeat(np.arange(50), 200).astype(float)
+    spread = keys + np.tile(np.linspace(0.0, 0.04, 200), 50)
+    for left, right in [(keys, keys + 0.01), (keys, spread), (spread, keys)]:
+        comparison = compare(pd.DataFrame({'k': left, 'v': 1}), pd.DataFrame({'k': right, 'v': 1}),
+                             tolerant_columns(0.05))
+        assert get_matched(comparison) == {'match_both': 10000, 'unmatched_left': 0, 'unmatched_right': 0}
+
+
+# Estimate sample
+
+def test_sample_before_normalization(monkeypatch):
+    # The keys are sampled by the normalized references, the other columns are normalized only in the sample
+    normalized = {}
+    normalize_column = Comparison.normalize_column
+
+    def record_normalization(column, normalization):
+        normalized.setdefault(column.name, []).append(len(column))
+        return normalize_column(column, normalization)
+
+    monkeypatch.setattr(Comparison, 'normalize_column', staticmethod(record_normalization))
+    ids = [f'id{i}' for i in range(1000)]
+    columns = [{'name': 'id', 'reference': True, 'normalize': 'trim;casefold'}, {'name': 'v', 'normalize': 'trim'}]
+    comparison = run({'file_name': 'sample', 'columns': columns},
+                     sample=0.1, df_left=pd.DataFrame({'id': ids, 'v': ' a '}),
+                     df_right=pd.DataFrame({'id': [f' {key.upper()} ' for key in ids], 'v': 'a'}))
+    assert 0.05 < comparison.sample_fraction < 0.15
+    assert len(comparison.df_left) == len(comparison.df_right) == comparison.summary['merge_match']['match_both']
+    assert (comparison.summary['lines']['left'], comparison.summary['lines']['right']) == (1000, 1000)
+    assert comparison.df_compare.empty
+    assert normalized['v'] == [len(comparison.df_left), len(comparison.df_right)]
+
+
+# Fixed width files
+
+def test_read_fixed_width(tmp_path):
+    path = tmp_path / 'report.txt'
+    path.write_bytes(b'ID  AMOUNT NAME\r\n1     10.5 Alpha\r\n22    -3   Beta\r\n333\r\n')
+    df = Comparison.read_fixed_width(str(path), {'id': (0, 4), 'amount': (4, 6), 'name': (11, 5)}, skip_header=True)
+    assert df['id'].tolist() == [1, 22, 333]
+    assert df['amount'].tolist()[:2] == [10.5, -3.0]
+    # Fields behind the end of a short line are missing values
+    assert np.isnan(df['amount'][2]) and pd.isna(df['name'][2])
+    assert df['name'].tolist()[:2] == ['Alpha', 'Beta']
+
+
+def test_compare_fixed_width(tmp_path):
+    (tmp_path / 'left.txt').write_text('ID   VALUE\nA001  1.00\nA002  2.00\nA003  3.00\n')
+    (tmp_path / 'right.txt').write_text('ID   VALUE\nA001  1.00\nA002  2.50\nA004  4.00')
+    comparison = run({'file_name': 'fixed', 'left': str(tmp_path / 'left.txt'), 'right': str(tmp_path / 'right.txt'),
+                      'file_type': 'fixed_width', 'columns': [{'name': 'id', 'reference': True, 'width': 4},
+                                                              {'name': 'v', 'offset': 4, 'width': 6}]})
+    assert get_matched(comparison) == {'match_both': 2, 'unmatched_left': 1, 'unmatched_right': 1}
+    assert comparison.df_compare[('v', 'self')].tolist()[0] == 2.0
+    assert comparison.df_compare[('v', 'other')].tolist()[0] == 2.5
+
+
+# Normalization rules
+
+def test_normalization():
+    columns = [{'name': 'id', 'reference': True, 'normalize': 'trim;casefold'},
+               {'name': 'amount', 'normalize': 'trim;numeric', 'thousands': ','},
+               {'name': 'code', 'regex_replace': '^0+', 'null_values': 'N/A;-'}]
+    comparison = compare(pd.DataFrame({'id': ['a', 'b', 'c'], 'amount': ['1,000.5', '2', 'x'],
+                                       'code': ['7', 'N/A', '12']}),
+                         pd.DataFrame({'id': [' A', 'B ', 'c'], 'amount': [' 1000.50', '2.0', 'y'],
+                                       'code': ['007', '-', '012']}), columns)
+    assert get_matched(comparison) == {'match_both': 3, 'unmatched_left': 0, 'unmatched_right': 0}
+    # Only the texts which are not numbers differ
+    assert list(comparison.df_compare.columns.get_level_values(0).unique()) == ['amount']
+    assert comparison.df_compare[('amount', 'self')].tolist() == ['x']
+
+
+# Gate
+
+def gate_comparison(gate, lines=1000, differences=10):
+    xml_comparison = comparison_to_xml({'file_name': 'gate', 'columns': [{'name': 'id', 'reference': True},
+                                                                          {'name': 'v'}]})
+    ET.SubElement(xml_comparison, 'gate', gate)
+    right = np.arange(lines)
+    right[:differences] += 1
+    return run(xml_comparison, df_left=pd.DataFrame({'id': np.arange(lines), 'v': np.arange(lines)}),
+               df_right=pd.DataFrame({'id': np.arange(lines), 'v': right}))
+
+
+def test_gate_passed():
+    comparison = gate_comparison({'max_differences': '10', 'shards': '8'})
+    gate = comparison.summary['gate']
+    assert gate['passed'] and gate['complete'] and gate['shards_processed'] == 8
+    assert gate['differences'] == len(comparison.df_compare) == 10
+    assert len(comparison.df_merge) == 1000
+    # The merged shards are sorted by the references like a single merge
+    assert comparison.df_merge['id'].tolist() == list(range(1000))
+    assert comparison.summary['note'] == 'Gate passed'
+
+
+def test_gate_failed_early():
+    comparison = gate_comparison({'max_differences': '0', 'shards': '8'}, differences=500)
+    gate = comparison.summary['gate']
+    assert not gate['passed'] and not gate['complete']
+    assert gate['shards_processed'] == 1
+    assert comparison.summary['note'].startswith('Gate failed: differences exceed 0')
+
+
+def test_gate_percent():
+    # 1% of at most 2000 lines before the last shard, 1% of the 1000 merged lines at the end
+    assert not gate_comparison({'max_differences': '1%', 'shards': '4'}, differences=11).summary['gate']['passed']
+    assert gate_comparison({'max_differences': '1%', 'shards': '4'}, differences=10).summary['gate']['passed']
+
+
+# Keys only
+
+def test_keys_only():
+    comparison = compare(pd.DataFrame({'id': [1, 1, 2, 3, None], 'v': ['a', 'b', 'c', 'd', 'e']}),
+                         pd.DataFrame({'id': [1, 2, 2, 4, None], 'v': ['x', 'y', 'z', 'w', 'u']}),
+                         [{'name': 'id', 'reference': True}, {'name': 'v'}], keys_only=True)
+    # The counts of the outer join, missing keys are equal
+    assert get_matched(comparison) == {'match_both': 5, 'unmatched_left': 1, 'unmatched_right': 1}
+    assert comparison.df_merge['id'].tolist() == [3, 4]
+    assert comparison.df_merge['_merge'].tolist() == ['left_only', 'right_only']
+    # Only the references are loaded and nothing is compared
+    assert list(comparison.df_left.columns) == ['id']
+    assert comparison.df_compare.empty
+
+
+def test_keys_only_tolerant_reference():
+    comparison = compare(pd.DataFrame({'k': [1.0, 2.0, 3.0], 'v': 1}), pd.DataFrame({'k': [1.01, 2.5, 3.0], 'v': 2}),
+                         tolerant_columns(0.05), keys_only=True)
+    assert get_matched(comparison) == {'match_both': 2, 'unmatched_left': 1, 'unmatched_right': 1}
+
+
+# Decimal columns
+
+def test_parse_decimal():
+    comparison = compare(pd.DataFrame({'id': [1]}), pd.DataFrame({'id': [1]}), [{'name': 'id', 'reference': True}])
+    texts = pd.Series(['1.005', '-1.005', ' 2.5 ', '1e2', '.5', 'abc', None, '12345678901234567890'], name='d')
+    assert comparison.parse_decimal(texts, 2).tolist() == [101, -101, 250, 10000, 50, pd.NA, pd.NA, pd.NA]
+    numbers = pd.Series([0.1 + 0.2, -2.675, np.nan], name='d')
+    assert comparison.parse_decimal(numbers, 2).tolist() == [30, -268, pd.NA]
+
+
+def test_decimal_scaling():
+    # 0.1 + 0.2 is equal to 0.30 after the scaling, 0.12345 is rounded to 0.1235
+    columns = [{'name': 'id', 'reference': True}, {'name': 'amount', 'type': 'decimal(2)'},
+               {'name': 'rate', 'type': 'decimal(4)', 'tolerance': 0.0001, 'tolerance_mode': 'Abs'}]
+    comparison = compare(pd.DataFrame({'id': [1, 2, 3], 'amount': [0.1 + 0.2, 1.0, 5.0],
+                                       'rate': ['0.1234', '0.5000', '1.0000']}),
+                         pd.DataFrame({'id': [1, 2, 3], 'amount': ['0.30', '1.01', '5'],
+                                       'rate': ['0.12345', '0.5001', '1.0002']}), columns)
+    assert comparison.df_compare.index.tolist() == [1, 2]
+    assert comparison.summary['diffs_counter']['amount'] == {'absolute': 1, 'in_tolerance': 0}
+    assert comparison.summary['diffs_counter']['rate'] == {'absolute': 3, 'in_tolerance': 2}
@@ -0,0 +1,27 @@
+import tracemalloc
+from profiler import Profiler
+
+
+def test_nested_memory_profilers(tmp_path):
+    # The concurrent profilers share the tracing, the first one to finish does not stop it
+    with Profiler(str(tmp_path), 'first', modes=['memory']) as first:
+        with Profiler(str(tmp_path), 'second', modes=['memory']) as second:
+            data = [bytearray(1024 * 1024) for _ in range(4)]
+        assert tracemalloc.is_tracing()
+        del data
+    assert not tracemalloc.is_tracing()
+    assert second.report['peak_memory'] >= 4 * 1024 * 1024
+    assert first.report['peak_memory'] >= second.report['peak_memory']
+    assert first.report['peak_memory_shared'] and second.report['peak_memory_shared']
+    assert 'shared' in (tmp_path / 'first.allocations.txt').read_text().splitlines()[0]
+
+
+def test_memory_peak_of_comparison(tmp_path):
+    # The peak of an earlier profiled comparison is not reported again
+    with Profiler(str(tmp_path), 'large', modes=['memory']):
+        data = bytearray(8 * 1024 * 1024)
+        del data
+    with Profiler(str(tmp_path), 'small', modes=['memory']) as small:
+        data = bytearray(1024 * 1024)
+    assert 1024 * 1024 <= small.report['peak_memory'] < 4 * 1024 * 1024
+    assert 'peak_memory_shared' not in small.report
@@ -0,0 +1,43 @@
+import pandas as pd
+from api import compare_frames
+from results_store import ResultsStore
+
+
+def store(tmp_path, left, right, columns):
+    comparison = compare_frames(left, right, {'file_name': 'store', 'columns': columns})
+    results_store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    results_store.store_result('20240101_000000', 0, comparison.summary, comparison)
+    rows = results_store.query()
+    summaries = results_store.query_summaries()
+    results_store.close()
+    return rows, summaries
+
+
+def test_datetime_column(tmp_path):
+    rows, summaries = store(
+        tmp_path,
+        pd.DataFrame({'id': [1, 2, 3], 'd': ['2024-01-01 10:00:00', '2024-01-01 10:00:00', None]}),
+        pd.DataFrame({'id': [1, 2, 4], 'd': ['2024-01-01 10:00:00', '2024-01-01 10:00:05', '2024-01-02']}),
+        [{'name': 'id', 'reference': True}, {'name': 'd', 'type': 'datetime', 'timezone': 'Europe/Prague'}])
+    assert summaries[0][2] == 0
+    assert ('20240101_000000', 'store', '2', 'd', '2024-01-01T10:00:00+01:00', '2024-01-01T10:00:05+01:00',
+            'both') in rows
+    assert ('20240101_000000', 'store', '4', 'd', None, '2024-01-02T00:00:00+01:00', 'right_only') in rows
+
+
+def test_datetime_reference(tmp_path):
+    rows, _ = store(
+        tmp_path,
+        pd.DataFrame({'t': ['2024-01-01 10:00:00', '2024-01-01 11:00:00'], 'v': [1, 2]}),
+        pd.DataFrame({'t': ['2024-01-01 10:00:00', '2024-01-01 11:00:00'], 'v': [1, 3]}),
+        [{'name': 't', 'type': 'datetime', 'reference': True}, {'name': 'v'}])
+    assert rows == [('20240101_000000', 'store', '2024-01-01T11:00:00', 'v', 2, 3, 'both')]
+
+
+def test_decimal_column(tmp_path):
+    rows, _ = store(
+        tmp_path,
+        pd.DataFrame({'price': ['1.10', '2.20'], 'amount': ['5.00', '0.01']}),
+        pd.DataFrame({'price': ['1.1', '2.2'], 'amount': ['5.01', '0.01']}),
+        [{'name': 'price', 'type': 'decimal(2)', 'reference': True}, {'name': 'amount', 'type': 'decimal(2)'}])
+    assert rows == [('20240101_000000', 'store', '1.10', 'amount', '5.00', '5.01', 'both')]
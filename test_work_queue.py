@@ -0,0 +1,77 @@
+import os
+import time
+import xml.etree.ElementTree as ET
+from work_queue import WorkQueue
+
+
+def get_comparisons(count):
+    comparisons = []
+    for i in range(count):
+        xml_comparison = ET.Element('comparison', {'file_name': f'C{i}'})
+        ET.SubElement(xml_comparison, 'left').text = f'left_{i}.csv'
+        ET.SubElement(xml_comparison, 'right').text = f'right_{i}.csv'
+        comparisons.append(xml_comparison)
+    return comparisons
+
+
+def expire(path):
+    os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+
+def test_submit_absolute_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    comparisons = get_comparisons(1)
+    queue = WorkQueue(tmp_path / 'queue')
+    run_dir = queue.submit(comparisons, [], 'export')
+    job = ET.parse(os.path.join(run_dir, 'pending', '00000.1.xml')).getroot()
+    assert job.get('export_folder') == str(tmp_path / 'export')
+    assert job.find('comparison/left').text == str(tmp_path / 'left_0.csv')
+    assert job.get('cwd') is None
+    # The comparisons of the coordinator are not modified
+    assert comparisons[0].find('left').text == 'left_0.csv'
+
+
+def test_claim_once(tmp_path):
+    queue = WorkQueue(tmp_path)
+    run_dir = queue.submit(get_comparisons(2), [], str(tmp_path / 'export'))
+    claims = [queue.claim('worker'), queue.claim('worker'), queue.claim('worker')]
+    assert [os.path.basename(claim[1]) for claim in claims[:2]] == ['00000.1.worker.xml', '00001.1.worker.xml']
+    assert claims[0][0] == run_dir
+    assert claims[2] is None
+
+
+def test_expired_lease(tmp_path):
+    queue = WorkQueue(tmp_path, lease_timeout=60, max_attempts=2)
+    run_dir = queue.submit(get_comparisons(1), [], str(tmp_path / 'export'))
+    _, claimed = queue.claim('worker')
+    queue.requeue_expired(run_dir)
+    assert os.listdir(os.path.join(run_dir, 'pending')) == []
+
+    # Requeued with the next attempt, then failed after the last attempt
+    expire(claimed)
+    queue.requeue_expired(run_dir)
+    assert os.listdir(os.path.join(run_dir, 'pending')) == ['00000.2.xml']
+    _, claimed = queue.claim('worker')
+    expire(claimed)
+    queue.requeue_expired(run_dir)
+    status, summary = queue.collect(run_dir, 1, poll_interval=0)[0]
+    assert status == 100
+    assert summary['file_name'] == 'C0'
+
+
+def test_process(tmp_path):
+    queue = WorkQueue(tmp_path)
+    run_dir = queue.submit(get_comparisons(2), [], str(tmp_path / 'export'))
+
+    def process_comparison(xml_comparison, xml_defaults, export_folder, profile=None, store=None):
+        if xml_comparison.get('file_name') == 'C1':
+            raise OSError('The input is not reachable')
+        return 0, {'report_name': xml_comparison.get('file_name')}
+
+    for _ in range(2):
+        queue.process(*queue.claim('worker'), process_comparison)
+    results = queue.collect(run_dir, 2, poll_interval=0)
+    assert results[0] == (0, {'report_name': 'C0'})
+    assert results[1][0] == 100
+    assert str(results[1][1]['error']) == 'The input is not reachable'
+    assert os.listdir(os.path.join(run_dir, 'running')) == []
@@ -0,0 +1,138 @@
+import os
+import time
+from importlib.util import find_spec
+from configuration import true_values
+from checkpoints import Checkpoints
+
+
+class Watcher:
+    """
+    Watch mode of the Comparer, the input files of the enabled comparisons are monitored (inotify if
+    the "inotify_simple" package is installed, otherwise polling) and a comparison is dispatched to
+    the warm pool of workers as soon as both of its inputs are complete and changed since their last
+    comparison. An input is complete when its size and modification time did not change for
+    "settle_time" seconds. The results summary is written again after each finished comparison.
+    """
+
+    def __init__(self, comparer, poll_interval=5.0, settle_time=10.0, timeout=None):
+        self.comparer = comparer
+        self.log = comparer.sum_log
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self.comparisons = [comparison for comparison in comparer.get_comparisons()
+                            if comparison.find('enabled') is not None
+                            and comparison.find('enabled').text in true_values]
+        self.checkpoints = Checkpoints(comparer.export_folder)
+        # Fingerprint of the last comparison of each file name, from the checkpoints of a resumed run
+        self.compared = {}
+        # Results in the order of the configuration
+        self.results = {}
+        for index, comparison in enumerate(self.comparisons):
+            checkpoint = self.checkpoints.read(comparison.get('file_name')) if comparer.resume else None
+            if checkpoint is not None:
+                self.compared[comparison.get('file_name')] = checkpoint['fingerprint']
+                self.results[index] = checkpoint['result']
+        # Observed signature (size, modification time) of each input and since when it is unchanged
+        self.observed = {}
+        self.notifier = self.get_notifier()
+
+    def get_notifier(self):
+        if find_spec('inotify_simple') is None:
+            return None
+        from inotify_simple import INotify, flags
+
+        notifier = INotify()
+        mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO
+        for folder in {os.path.dirname(os.path.abspath(path)) for path in self.get_paths()}:
+            if os.path.isdir(folder):
+                notifier.add_watch(folder, mask)
+        return notifier
+
+    def get_paths(self):
+        return [comparison.find(tag).text for comparison in self.comparisons for tag in ['left', 'right']
+                if comparison.find(tag) is not None and comparison.find(tag).text]
+
+    def wait(self):
+        if self.notifier:
+            # Wakes up on a change of the watched folders, at the latest after the poll interval
+            self.notifier.read(timeout=int(self.poll_interval * 1000))
+        else:
+            time.sleep(self.poll_interval)
+
+    def is_complete(self, path, now):
+        """
+        The file exists and its size and modification time are stable for the settle time
+        """
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            self.observed.pop(path, None)
+            return False
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if path not in self.observed or self.observed[path][0] != signature:
+            self.observed[path] = (signature, now)
+        unchanged_since = self.observed[path][1]
+        return now - stat.st_mtime >= self.settle_time or now - unchanged_since >= self.settle_time
+
+    def get_ready(self, running):
+        """
+        Comparisons with complete inputs, changed since their last comparison and not running
+        """
+        ready = []
+        now = time.time()
+        for index, comparison in enumerate(self.comparisons):
+            if index in running:
+                continue
+            paths = [comparison.find(tag).text if comparison.find(tag) is not None else None
+                     for tag in ['left', 'right']]
+            if not all([self.is_complete(path, now) for path in paths]):
+                continue
+            fingerprint = Checkpoints.get_fingerprint(comparison, self.comparer.xml_config['defaults'])
+            if self.compared.get(comparison.get('file_name')) != fingerprint:
+                ready.append((index, fingerprint))
+        return ready
+
+    def run(self):
+        """
+        Watches until interrupted (or the timeout), returns the last result of each comparison
+        """
+        from DataComparer import init_worker
+
+        comparer = self.comparer
+        processes = max(min(os.cpu_count(), len(self.comparisons)), 1)
+        context = comparer.get_context()
+        pressure = context.Value('i', 0)
+        self.log.logger.info(f'Watching {len(self.comparisons)} comparisons with {processes} worker processes'
+                             f'{" (inotify)" if self.notifier else ""}, the inputs settle for {self.settle_time}s')
+        start = time.perf_counter()
+        running = {}
+        with context.Pool(processes, initializer=init_worker, initargs=(pressure,)) as pool:
+            try:
+                while self.timeout is None or time.perf_counter() - start < self.timeout:
+                    for index in [index for index, result in running.items() if result.ready()]:
+                        self.results[index] = running.pop(index).get()
+                        self.log.logger.info(f'{self.comparisons[index].get("file_name")} finished with status '
+                                             f'{self.results[index][0]}')
+                        self.write_summary()
+
+                    for index, fingerprint in self.get_ready(running):
+                        # New jobs are held back while a worker is under memory pressure
+                        if running and (len(running) >= processes or pressure.value > 0):
+                            break
+                        file_name = self.comparisons[index].get('file_name')
+                        self.log.logger.info(f'Inputs of {file_name} are complete, comparison dispatched')
+                        self.compared[file_name] = fingerprint
+                        running[index] = pool.apply_async(comparer.process_comparison, (self.comparisons[index],))
+                    self.wait()
+            except KeyboardInterrupt:
+                self.log.logger.info('Watching stopped')
+        return [self.results[index] for index in sorted(self.results)]
+
+    def write_summary(self):
+        self.comparer.results = [self.results[index] for index in sorted(self.results)]
+        try:
+            self.comparer.generate_summary()
+        except Exception as e:
+            # e.g. the summary is opened in Excel, it is written again with the next result
+            self.log.logger.warning(f'Results summary was not written: {e}')
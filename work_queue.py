@@ -0,0 +1,201 @@
+import os
+import time
+import pickle
+import socket
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from copy import deepcopy
+from datetime import datetime
+
+
+class WorkQueue:
+    """
+    Job queue in a directory shared by several nodes (e.g. NFS mount).
+    Each run has its own folder with three sub folders:
+        pending - "<index>.<attempt>.xml" job files waiting for a worker
+        running - "<index>.<attempt>.<worker>.xml" claimed jobs, the worker touches the file as a lease
+        done    - "<index>.pkl" results (status, summary) of "process_comparison"
+    Jobs are claimed by an atomic rename from "pending" to "running". A job whose lease was
+    not renewed within the lease timeout is moved back to "pending" with the next attempt,
+    after "max_attempts" it is recorded as failed (status 100).
+    """
+
+    def __init__(self, queue_dir, lease_timeout=300, max_attempts=3, log=None):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.log = log
+        os.makedirs(self.queue_dir, exist_ok=True)
+
+    @staticmethod
+    def run_folders(run_dir):
+        return {folder: os.path.join(run_dir, folder) for folder in ['pending', 'running', 'done']}
+
+    def submit(self, comparisons, xml_defaults, export_folder, profile=None, store=None):
+        """
+        Coordinator: writes a job file for each comparison, returns the run folder. The paths of the
+        inputs, the export folder and the store are absolute, the workers do not share the working directory.
+        """
+        run_dir = os.path.join(self.queue_dir, f'{datetime.today().strftime("%Y%m%d_%H%M%S")}_{os.getpid()}')
+        folders = self.run_folders(run_dir)
+        for folder in folders.values():
+            os.makedirs(folder, exist_ok=True)
+
+        for index, xml_comparison in enumerate(comparisons):
+            job = ET.Element('job', {'export_folder': os.path.abspath(export_folder)})
+            if profile:
+                job.set('profile', profile)
+            if store:
+                job.set('store', os.path.abspath(store))
+            xml_comparison = deepcopy(xml_comparison)
+            for xml_path in [*xml_comparison.findall('left'), *xml_comparison.findall('right')]:
+                if xml_path.text:
+                    xml_path.text = os.path.abspath(xml_path.text)
+            job.extend(xml_defaults)
+            job.append(xml_comparison)
+            self.write_atomic(os.path.join(folders['pending'], f'{index:05d}.1.xml'), ET.tostring(job))
+        return run_dir
+
+    def collect(self, run_dir, count, poll_interval=1.0, on_result=None):
+        """
+        Coordinator: waits for the results of all jobs of the run, requeues jobs with an expired lease.
+        Returns the list of results in the order of the comparisons.
+        """
+        folders = self.run_folders(run_dir)
+        results = {}
+        while len(results) < count:
+            for file_name in os.listdir(folders['done']):
+                if file_name.endswith('.pkl') and int(file_name.split('.')[0]) not in results:
+                    with open(os.path.join(folders['done'], file_name), 'rb') as reader:
+                        index = int(file_name.split('.')[0])
+                        results[index] = pickle.load(reader)
+                    if on_result:
+                        on_result(index, results[index])
+            self.requeue_expired(run_dir)
+            if len(results) < count:
+                time.sleep(poll_interval)
+        return [results[index] for index in range(count)]
+
+    def requeue_expired(self, run_dir):
+        folders = self.run_folders(run_dir)
+        for file_name in os.listdir(folders['running']):
+            path = os.path.join(folders['running'], file_name)
+            try:
+                expired = time.time() - os.path.getmtime(path) > self.lease_timeout
+            except FileNotFoundError:
+                continue
+            if not expired:
+                continue
+
+            index, attempt = [int(part) for part in file_name.split('.')[:2]]
+            if os.path.isfile(os.path.join(folders['done'], f'{index:05d}.pkl')):
+                continue
+            if attempt >= self.max_attempts:
+                job = ET.parse(path).getroot()
+                file_name = job.find('comparison').get('file_name')
+                error = RuntimeError(f'Job lease expired {attempt} times, the worker crashed or hung')
+                self.write_atomic(os.path.join(folders['done'], f'{index:05d}.pkl'),
+                                  pickle.dumps((100, {'error': error, 'file_name': file_name})))
+                self.remove(path)
+            else:
+                try:
+                    os.rename(path, os.path.join(folders['pending'], f'{index:05d}.{attempt + 1}.xml'))
+                except FileNotFoundError:
+                    continue
+            if self.log:
+                self.log.logger.warning(f'Lease of job {index} (attempt {attempt}) expired, '
+                                        f'{"failed" if attempt >= self.max_attempts else "requeued"}')
+
+    def claim(self, worker_id):
+        """
+        Worker: claims a pending job of any run, returns (run folder, path of the claimed job) or None
+        """
+        for run_name in sorted(os.listdir(self.queue_dir)):
+            folders = self.run_folders(os.path.join(self.queue_dir, run_name))
+            if not os.path.isdir(folders['pending']):
+                continue
+            for file_name in sorted(os.listdir(folders['pending'])):
+                if not file_name.endswith('.xml'):
+                    continue
+                claimed = os.path.join(folders['running'], f'{file_name[:-4]}.{worker_id}.xml')
+                try:
+                    os.rename(os.path.join(folders['pending'], file_name), claimed)
+                except OSError:
+                    continue  # Claimed by another worker
+                os.utime(claimed)
+                return os.path.join(self.queue_dir, run_name), claimed
+        return None
+
+    def process(self, run_dir, claimed, process_comparison):
+        """
+        Worker: processes a claimed job, renews its lease meanwhile and stores the result.
+        A job which raises an error is stored as failed (status 100), like in "process_comparison".
+        """
+        job = ET.parse(claimed).getroot()
+        index = int(os.path.basename(claimed).split('.')[0])
+        stop = threading.Event()
+
+        def renew_lease():
+            while not stop.wait(self.lease_timeout / 3):
+                try:
+                    os.utime(claimed)
+                except FileNotFoundError:
+                    return
+
+        heartbeat = threading.Thread(target=renew_lease, daemon=True)
+        heartbeat.start()
+        try:
+            result = process_comparison(job.find('comparison'), job.findall('defaults'), job.get('export_folder'),
+                                        job.get('profile'), job.get('store'))
+        except Exception as e:
+            if self.log:
+                self.log.logger.error(f'Job {index} of {run_dir} failed: {e}')
+            result = (100, {'error': e, 'file_name': job.find('comparison').get('file_name')})
+        finally:
+            stop.set()
+            heartbeat.join()
+        self.write_atomic(os.path.join(self.run_folders(run_dir)['done'], f'{index:05d}.pkl'), pickle.dumps(result))
+        self.remove(claimed)
+        return result
+
+    def work(self, process_comparison, worker_id=None, poll_interval=1.0, stop=None):
+        """
+        Worker loop, claims and processes jobs until stopped
+        """
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        while stop is None or not stop.is_set():
+            job = self.claim(worker_id)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            self.process(*job, process_comparison)
+
+    @staticmethod
+    def write_atomic(path, data):
+        with open(path + '.tmp', 'wb') as writer:
+            writer.write(data)
+            writer.flush()
+            os.fsync(writer.fileno())
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_worker(queue_dir, lease_timeout=300):
+    from DataComparer import process_comparison
+
+    WorkQueue(queue_dir, lease_timeout=lease_timeout).work(process_comparison)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker of the shared-directory comparison queue')
+    parser.add_argument('queue', help='queue directory shared with the coordinator')
+    parser.add_argument('--lease-timeout', type=int, default=300, help='seconds after which a job is requeued')
+    arguments = parser.parse_args()
+    run_worker(arguments.queue, arguments.lease_timeout)